@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Arrow and row-tuple result paths used by the chat interface.
+
+Runs the same million-row query through both paths of
+``query_results.query_dataframe`` and reports wall time and peak memory.
+Connection settings are read from the .env file like test_connection.py.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from dotenv import load_dotenv
+import clickhouse_connect
+
+from query_results import arrow_available, query_dataframe
+
+
+BENCHMARK_QUERY = """
+SELECT
+    number AS id,
+    toString(number % 1000) AS category,
+    number * 1.5 AS amount,
+    toDateTime('2024-01-01 00:00:00') + number AS created_at,
+    concat('user_', toString(number % 50000)) AS user_name
+FROM numbers({rows})
+"""
+
+
+def measure_time(client, sql_query: str, result_format: str) -> float:
+    """Run one query and return its wall time in seconds."""
+    start = time.perf_counter()
+    query_dataframe(client, sql_query, result_format)
+    return time.perf_counter() - start
+
+
+def measure_peak(client, sql_query: str, result_format: str) -> int:
+    """Run one query and return the peak Python heap usage in bytes.
+
+    Traced separately from the timed runs because tracemalloc slows down
+    allocation-heavy code.
+    """
+    tracemalloc.start()
+    query_dataframe(client, sql_query, result_format)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark chat query result paths')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Number of result rows (default 1,000,000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per result path (default 3)')
+    args = parser.parse_args()
+
+    print("Query Result Path Benchmark")
+    print("=" * 30)
+
+    if not arrow_available():
+        print("❌ pyarrow is not installed; the Arrow path cannot be benchmarked")
+        return False
+
+    load_dotenv()
+    client = clickhouse_connect.get_client(
+        host=os.getenv('CLICKHOUSE_HOST', 'localhost'),
+        port=int(os.getenv('CLICKHOUSE_PORT', 8123)),
+        username=os.getenv('CLICKHOUSE_USER', 'default'),
+        password=os.getenv('CLICKHOUSE_PASSWORD', ''),
+        database=os.getenv('CLICKHOUSE_DATABASE', 'default'),
+        secure=os.getenv('CLICKHOUSE_SECURE', 'false').lower() == 'true'
+    )
+
+    sql_query = BENCHMARK_QUERY.format(rows=args.rows)
+    print(f"Rows: {args.rows:,}, runs per path: {args.repeat}\n")
+
+    best = {}
+    for result_format in ('rows', 'arrow'):
+        elapsed = min(measure_time(client, sql_query, result_format) for _ in range(args.repeat))
+        peak = measure_peak(client, sql_query, result_format)
+        best[result_format] = elapsed
+        print(f"  {result_format:>5}: best {elapsed:.2f}s, peak Python heap {peak / 1_048_576:.1f} MiB")
+
+    print(f"\nArrow speedup: {best['rows'] / best['arrow']:.1f}x")
+    client.close()
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Benchmark the schema context formats of NL-to-SQL prompts.
+
+Builds the schema context for a set of questions from
+``clickhouse_metadata.json`` (or a synthetic catalog) in the indented JSON
+and the compact format, and reports characters, tokens and render time per
+format, plus how far the token budget had to trim each prompt. With
+``--gemini`` the tokens are counted by the model and the generation latency
+of each prompt is measured as well (needs GEMINI_API_KEY in the .env file).
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from dotenv import load_dotenv
+
+from schema_prompt import SCHEMA_FORMATS, estimate_tokens, fit_schema, prompt_tables
+from schema_retrieval import SchemaIndex
+from snapshot_io import load_snapshot
+
+
+COLUMN_TYPES = ['UInt64', 'LowCardinality(String)', 'DateTime', 'Nullable(String)', 'Float64',
+                "Enum8('active' = 1, 'disabled' = 2)"]
+SHARED_COLUMNS = [
+    {'name': 'created_at', 'type': 'DateTime', 'ai_definition': 'Time the row was created'},
+    {'name': 'updated_at', 'type': 'DateTime', 'ai_definition': 'Time the row was last updated'},
+    {'name': 'tenant_id', 'type': 'UInt32', 'ai_definition': 'Identifier of the tenant owning the row'},
+]
+DEFAULT_QUESTIONS = [
+    "How many orders were placed per day last month?",
+    "Top 10 customers by revenue",
+    "Average session duration by country",
+    "Which products were returned most often?",
+    "Show users who signed up this week but never logged in",
+]
+
+
+def synthetic_metadata(tables: int, columns: int) -> Dict[str, Any]:
+    """Catalog of ``tables`` tables with ``columns`` columns each, including shared audit columns."""
+    subjects = ['orders', 'customers', 'sessions', 'products', 'returns', 'users', 'logins', 'revenue']
+    metadata = {'databases': {}}
+    for index in range(tables):
+        database = f"db_{index % 4}"
+        subject = subjects[index % len(subjects)]
+        schema_tables = metadata['databases'].setdefault(database, {'schemas': {}})['schemas'] \
+            .setdefault(database, {'tables': {}})['tables']
+        own_columns = [
+            {
+                'name': f"{subject}_attribute_{position}",
+                'type': COLUMN_TYPES[position % len(COLUMN_TYPES)],
+                'ai_definition': f"Attribute {position} of the {subject} record in table {index}"
+            }
+            for position in range(max(0, columns - len(SHARED_COLUMNS)))
+        ]
+        schema_tables[f"{subject}_{index}"] = {
+            'columns': own_columns + [dict(column) for column in SHARED_COLUMNS],
+            'statistics': {'engine': 'MergeTree', 'sorting_key': f"{subject}_attribute_0",
+                           'partition_key': 'toYYYYMM(created_at)', 'rows': 1_000_000 * (index + 1),
+                           'compressed_bytes': 50_000_000 * (index + 1)}
+        }
+    return metadata
+
+
+def measure_render(tables: Dict[str, Any], schema_format: str, max_tokens: int, repeat: int) -> float:
+    """Best render time in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fit_schema(tables, schema_format, max_tokens)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def measure_generation(model, prompt: str) -> float:
+    """Seconds until the model has returned its full reply."""
+    start = time.perf_counter()
+    model.generate_content(prompt)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the schema context formats of NL-to-SQL prompts')
+    parser.add_argument('--file', default='clickhouse_metadata.json',
+                        help='Metadata snapshot to benchmark (default clickhouse_metadata.json)')
+    parser.add_argument('--synthetic-tables', type=int,
+                        help='Benchmark a synthetic catalog with this many tables instead of --file')
+    parser.add_argument('--columns', type=int, default=30, help='Columns per synthetic table (default 30)')
+    parser.add_argument('--question', action='append', help='Question to build a prompt for (repeatable)')
+    parser.add_argument('--top-k', type=int, default=8, help='Tables per prompt (default 8)')
+    parser.add_argument('--max-columns', type=int, default=50, help='Columns per table (default 50)')
+    parser.add_argument('--max-tokens', type=int, default=6000,
+                        help='Token budget of the budgeted compact row (default 6000, 0 leaves it out)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (default 5)')
+    parser.add_argument('--gemini', action='store_true',
+                        help='Count tokens with Gemini and measure generation latency per format')
+    args = parser.parse_args()
+
+    print("Schema Prompt Benchmark")
+    print("=" * 23)
+
+    if args.synthetic_tables:
+        metadata = synthetic_metadata(args.synthetic_tables, args.columns)
+        print(f"Synthetic catalog: {args.synthetic_tables:,} tables x {args.columns} columns")
+    elif os.path.exists(args.file):
+        metadata = load_snapshot(args.file)
+        print(f"Catalog: {args.file}")
+    else:
+        print(f"❌ {args.file} not found; run an extraction first or use --synthetic-tables")
+        return False
+
+    count_tokens: Callable[[str], int] = estimate_tokens
+    model = None
+    if args.gemini:
+        load_dotenv()
+        if not os.getenv('GEMINI_API_KEY'):
+            print("❌ GEMINI_API_KEY is not set")
+            return False
+        from llm_clients import get_model
+        model = get_model(os.getenv('GEMINI_API_KEY'), os.getenv('GEMINI_MODEL', 'gemini-1.5-flash'))
+        count_tokens = lambda text: model.count_tokens(text).total_tokens
+    print(f"Tokens: {'counted by Gemini' if model else 'local estimate'}, "
+          f"compact budget: {args.max_tokens or 'none'}\n")
+
+    index = SchemaIndex(metadata)
+    # Both formats without a budget compare the formats; the budgeted row shows what fitting trims
+    variants = [(schema_format, schema_format, 0) for schema_format in SCHEMA_FORMATS]
+    if args.max_tokens:
+        variants.append(('budget', 'compact', args.max_tokens))
+    totals = {name: {'chars': 0, 'tokens': 0, 'latency': 0.0} for name, _, _ in variants}
+    questions: List[str] = args.question or DEFAULT_QUESTIONS
+    for question in questions:
+        tables = prompt_tables(index, question, args.top_k, args.max_columns)
+        print(f"❓ {question} ({len(tables)} tables)")
+        for name, schema_format, max_tokens in variants:
+            schema_prompt = fit_schema(tables, schema_format, max_tokens, count_tokens)
+            render_ms = measure_render(tables, schema_format, max_tokens, args.repeat)
+            total = totals[name]
+            total['chars'] += len(schema_prompt.text)
+            total['tokens'] += schema_prompt.tokens
+            line = (f"  {name:>7}: {len(schema_prompt.text):>7,} chars, {schema_prompt.tokens:>6,} tokens, "
+                    f"render {render_ms:.2f} ms")
+            if model:
+                prompt = f"Relevant tables ({schema_prompt.description}):\n{schema_prompt.text}\n\n" \
+                         f"Question: {question}\nReturn only the ClickHouse SQL query."
+                latency = min(measure_generation(model, prompt) for _ in range(args.repeat))
+                total['latency'] += latency
+                line += f", generation {latency:.2f}s"
+            if schema_prompt.reduction:
+                line += f" ({schema_prompt.reduction})"
+            print(line)
+
+    print(f"\nOver {len(questions)} prompts, relative to JSON:")
+    for name in (name for name, _, _ in variants if name != 'json'):
+        total = totals[name]
+        line = (f"  {name:>7}: {total['chars'] / max(1, totals['json']['chars']):.0%} of the characters, "
+                f"{total['tokens'] / max(1, totals['json']['tokens']):.0%} of the tokens")
+        if model:
+            line += (f", generation {total['latency'] / len(questions):.2f}s per prompt "
+                     f"(JSON {totals['json']['latency'] / len(questions):.2f}s)")
+        print(line)
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark loading a metadata snapshot as JSON and in the binary format.
+
+Converts ``clickhouse_metadata.json`` (or a synthetic catalog) to the
+MessagePack snapshot format and reports file size, load time and peak memory
+for ``json.load``, ``SnapshotReader`` and the binary loader.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from snapshot_io import SnapshotReader, msgpack_available, read_binary_snapshot, write_binary_snapshot, write_snapshot
+
+
+COLUMN_TYPES = ['UInt64', 'String', 'DateTime', 'Nullable(String)', 'Float64', 'LowCardinality(String)']
+
+
+def synthetic_metadata(tables: int, columns: int) -> Dict[str, Any]:
+    """Build a catalog of ``tables`` tables with ``columns`` columns each."""
+    metadata = {'databases': {}}
+    for index in range(tables):
+        database = f"db_{index % 10}"
+        schema_tables = metadata['databases'].setdefault(database, {'schemas': {}})['schemas'] \
+            .setdefault(database, {'tables': {}})['tables']
+        schema_tables[f"table_{index}"] = {
+            'columns': [
+                {
+                    'name': f"column_{position}",
+                    'type': COLUMN_TYPES[position % len(COLUMN_TYPES)],
+                    'default_type': '',
+                    'default_expression': '',
+                    'comment': '',
+                    'codec_expression': '',
+                    'ttl_expression': '',
+                    'ai_definition': f"Column {position} of table {index}"
+                }
+                for position in range(columns)
+            ],
+            'column_count': columns,
+            'uuid': f"00000000-0000-0000-0000-{index:012d}",
+            'metadata_modification_time': '2024-01-01 00:00:00'
+        }
+    return metadata
+
+
+def load_json(filename: str) -> Dict[str, Any]:
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def measure_time(loader: Callable[[str], Any], filename: str) -> float:
+    """Load a snapshot once and return the wall time in seconds."""
+    start = time.perf_counter()
+    loader(filename)
+    return time.perf_counter() - start
+
+
+def measure_peak(loader: Callable[[str], Any], filename: str) -> int:
+    """Load a snapshot once and return the peak Python heap usage in bytes.
+
+    Traced separately from the timed runs because tracemalloc slows down
+    allocation-heavy code.
+    """
+    tracemalloc.start()
+    loader(filename)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON and binary metadata snapshot loading')
+    parser.add_argument('--file', default='clickhouse_metadata.json',
+                        help='JSON snapshot to benchmark (default clickhouse_metadata.json)')
+    parser.add_argument('--synthetic-tables', type=int,
+                        help='Benchmark a synthetic catalog with this many tables instead of --file')
+    parser.add_argument('--columns', type=int, default=50, help='Columns per synthetic table (default 50)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per loader (default 3)')
+    args = parser.parse_args()
+
+    print("Metadata Snapshot Load Benchmark")
+    print("=" * 32)
+
+    if not msgpack_available():
+        print("❌ msgpack is not installed; the binary format cannot be benchmarked")
+        return False
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        json_file = args.file
+        if args.synthetic_tables:
+            json_file = os.path.join(temp_dir, 'synthetic.json')
+            write_snapshot(synthetic_metadata(args.synthetic_tables, args.columns), json_file)
+            print(f"Synthetic catalog: {args.synthetic_tables:,} tables x {args.columns} columns")
+        elif not os.path.exists(json_file):
+            print(f"❌ {json_file} not found; run an extraction first or use --synthetic-tables")
+            return False
+
+        binary_file = os.path.join(temp_dir, 'snapshot.msgpack')
+        write_binary_snapshot(load_json(json_file), binary_file)
+        json_size = os.path.getsize(json_file)
+        binary_size = os.path.getsize(binary_file)
+        print(f"JSON: {json_size / 1_048_576:.1f} MiB, binary: {binary_size / 1_048_576:.1f} MiB "
+              f"({binary_size / json_size:.0%} of JSON), runs per loader: {args.repeat}\n")
+
+        loaders = [
+            ('json.load', load_json, json_file),
+            ('SnapshotReader', lambda filename: SnapshotReader(filename).load(), json_file),
+            ('binary', read_binary_snapshot, binary_file),
+        ]
+        best = {}
+        for name, loader, filename in loaders:
+            elapsed = min(measure_time(loader, filename) for _ in range(args.repeat))
+            peak = measure_peak(loader, filename)
+            best[name] = elapsed
+            print(f"  {name:>14}: best {elapsed:.2f}s, peak Python heap {peak / 1_048_576:.1f} MiB")
+
+    print(f"\nBinary speedup over json.load: {best['json.load'] / best['binary']:.1f}x")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -13,27 +13,358 @@ The extracted metadata is saved to a structured JSON file.
 
 import json
 import os
+import re
 import sys
-import time
 import argparse
-from typing import Dict, List, Any
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from dotenv import load_dotenv
 import clickhouse_connect
-import google.generativeai as genai
+from definition_cache import DefinitionCache
+from llm_dispatcher import LLMDispatcher
+from llm_clients import get_model
+from clickhouse_pool import get_pool
+from column_profiler import ColumnProfiler, profile_hint
+from column_rules import ColumnRuleEngine
+from snapshot_diff import table_fingerprint
+from snapshot_io import SnapshotWriter, load_snapshot, msgpack_available, save_snapshot
+
+
+# (database, schema, table, columns) - columns is None when they still need to be described
+TableTask = Tuple[str, str, str, Optional[List[Dict[str, Any]]]]
+
+
+def _completed(value: Any) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _then(future: Future, action: Callable[[Any], Any]) -> Future:
+    """Future of ``action(result)`` once ``future`` has a result; exceptions are passed on."""
+    chained = Future()
+    
+    def run(done: Future):
+        try:
+            chained.set_result(action(done.result()))
+        except BaseException as e:
+            chained.set_exception(e)
+    
+    future.add_done_callback(run)
+    return chained
+
+
+class ExtractionCancelled(Exception):
+    """Raised when an extraction is stopped through its cancel event."""
+
+
+@dataclass
+class ProgressEvent:
+    """Snapshot of extraction progress passed to a progress callback.
+    
+    ``kind`` is one of 'started', 'table_done', 'finished' or 'cancelled'.
+    """
+    kind: str
+    tables_done: int = 0
+    tables_total: int = 0
+    columns_annotated: int = 0
+    llm_calls: int = 0
+    llm_in_flight: int = 0
+    elapsed_seconds: float = 0.0
+    eta_seconds: Optional[float] = None
+    message: str = ''
+    
+    @property
+    def fraction(self) -> float:
+        """Share of tables processed, between 0 and 1."""
+        return self.tables_done / self.tables_total if self.tables_total else 0.0
+    
+    @property
+    def tables_per_second(self) -> float:
+        return self.tables_done / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+    
+    @property
+    def columns_per_second(self) -> float:
+        return self.columns_annotated / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+
+@dataclass
+class ExtractorConfig:
+    """Settings for one metadata extraction run.
+    
+    Build it directly (or with from_dict) to run the extractor as a library
+    without touching environment variables; the CLI uses from_env.
+    """
+    host: str = 'localhost'
+    port: int = 8123
+    user: str = 'default'
+    password: str = field(default='', repr=False)
+    database: str = 'default'
+    secure: bool = False
+    gemini_api_key: str = field(default='', repr=False)
+    gemini_model: str = 'gemini-1.5-flash'
+    targeted_schemas: List[str] = field(default_factory=list)
+    target_tables: List[str] = field(default_factory=list)
+    extraction_mode: str = 'bulk'
+    workers: int = 4
+    incremental: bool = False
+    llm_batch_mode: bool = True
+    llm_batch_token_budget: int = 4000
+    llm_requests_per_minute: int = 60
+    llm_tokens_per_minute: int = 1000000
+    llm_max_concurrency: int = 8
+    llm_max_retries: int = 5
+    llm_burst_seconds: int = 6
+    definition_cache: bool = True
+    definition_cache_path: str = '.definition_cache.sqlite'
+    definition_cache_max_entries: int = 100000
+    column_rules: bool = True
+    column_rules_path: str = ''
+    table_dedup: bool = True
+    table_statistics: bool = True
+    column_profiling: bool = False
+    profile_sample_rows: int = 100000
+    profile_top_k: int = 5
+    profile_max_execution_time: int = 10
+    profile_max_threads: int = 2
+    profile_max_concurrency: int = 2
+    profile_time_budget: int = 0
+    output_file: str = 'clickhouse_metadata.json'
+    output_format: str = 'json'
+    
+    # Setting name -> (environment variable, JSON config / Streamlit key)
+    _SOURCES = {
+        'host': ('CLICKHOUSE_HOST', 'host'),
+        'port': ('CLICKHOUSE_PORT', 'port'),
+        'user': ('CLICKHOUSE_USER', 'user'),
+        'password': ('CLICKHOUSE_PASSWORD', 'password'),
+        'database': ('CLICKHOUSE_DATABASE', 'database'),
+        'secure': ('CLICKHOUSE_SECURE', 'secure'),
+        'gemini_api_key': ('GEMINI_API_KEY', 'geminiApiKey'),
+        'gemini_model': ('GEMINI_MODEL', 'geminiModel'),
+        'targeted_schemas': ('TARGETED_SCHEMAS', 'targetedSchemas'),
+        'target_tables': ('TARGET_TABLES', 'targetTables'),
+        'extraction_mode': ('EXTRACTION_MODE', 'extractionMode'),
+        'workers': ('EXTRACTION_WORKERS', 'workers'),
+        'incremental': ('INCREMENTAL_REFRESH', 'incremental'),
+        'llm_batch_mode': ('LLM_BATCH_MODE', 'llmBatchMode'),
+        'llm_batch_token_budget': ('LLM_BATCH_TOKEN_BUDGET', 'llmBatchTokenBudget'),
+        'llm_requests_per_minute': ('LLM_REQUESTS_PER_MINUTE', 'llmRequestsPerMinute'),
+        'llm_tokens_per_minute': ('LLM_TOKENS_PER_MINUTE', 'llmTokensPerMinute'),
+        'llm_max_concurrency': ('LLM_MAX_CONCURRENCY', 'llmMaxConcurrency'),
+        'llm_max_retries': ('LLM_MAX_RETRIES', 'llmMaxRetries'),
+        'llm_burst_seconds': ('LLM_BURST_SECONDS', 'llmBurstSeconds'),
+        'definition_cache': ('DEFINITION_CACHE', 'definitionCache'),
+        'definition_cache_path': ('DEFINITION_CACHE_PATH', 'definitionCachePath'),
+        'definition_cache_max_entries': ('DEFINITION_CACHE_MAX_ENTRIES', 'definitionCacheMaxEntries'),
+        'column_rules': ('COLUMN_RULES', 'columnRules'),
+        'column_rules_path': ('COLUMN_RULES_PATH', 'columnRulesPath'),
+        'table_dedup': ('TABLE_DEDUP', 'tableDedup'),
+        'table_statistics': ('TABLE_STATISTICS', 'tableStatistics'),
+        'column_profiling': ('COLUMN_PROFILING', 'columnProfiling'),
+        'profile_sample_rows': ('PROFILE_SAMPLE_ROWS', 'profileSampleRows'),
+        'profile_top_k': ('PROFILE_TOP_K', 'profileTopK'),
+        'profile_max_execution_time': ('PROFILE_MAX_EXECUTION_TIME', 'profileMaxExecutionTime'),
+        'profile_max_threads': ('PROFILE_MAX_THREADS', 'profileMaxThreads'),
+        'profile_max_concurrency': ('PROFILE_MAX_CONCURRENCY', 'profileMaxConcurrency'),
+        'profile_time_budget': ('PROFILE_TIME_BUDGET', 'profileTimeBudget'),
+        'output_file': ('METADATA_OUTPUT_FILE', 'outputFile'),
+        'output_format': ('METADATA_OUTPUT_FORMAT', 'outputFormat'),
+    }
+    
+    # Settings used verbatim: surrounding spaces can be part of a password or key
+    _SECRETS = ('password', 'gemini_api_key')
+    
+    @staticmethod
+    def _convert(value: Any, default: Any) -> Any:
+        """Convert a raw env/JSON value to the type of the setting's default."""
+        if isinstance(default, bool):
+            return value if isinstance(value, bool) else str(value).strip().lower() == 'true'
+        if isinstance(default, int):
+            return int(value)
+        if isinstance(default, list):
+            if isinstance(value, (list, tuple)):
+                return [str(item).strip() for item in value if str(item).strip()]
+            return [item.strip() for item in str(value).split(',') if item.strip()]
+        return str(value).strip()
+    
+    @classmethod
+    def _build(cls, lookup) -> 'ExtractorConfig':
+        config = cls()
+        for setting in fields(cls):
+            value = lookup(*cls._SOURCES[setting.name])
+            if value is None or value == '':
+                continue
+            if setting.name in cls._SECRETS:
+                setattr(config, setting.name, str(value))
+            else:
+                setattr(config, setting.name, cls._convert(value, getattr(config, setting.name)))
+        return config
+    
+    @classmethod
+    def from_env(cls) -> 'ExtractorConfig':
+        """Build a config from environment variables (as set by .env or the CLI)."""
+        return cls._build(lambda env_name, key: os.getenv(env_name))
+    
+    @classmethod
+    def from_dict(cls, config_data: Dict[str, Any]) -> 'ExtractorConfig':
+        """Build a config from JSON config file / Streamlit form keys."""
+        return cls._build(lambda env_name, key: config_data.get(key))
+    
+    @property
+    def connection_params(self) -> Dict[str, Any]:
+        """Keyword arguments for clickhouse_connect.get_client."""
+        return {
+            'host': self.host,
+            'port': int(self.port),
+            'username': self.user,
+            'password': self.password,
+            'database': self.database,
+            'secure': self.secure
+        }
+
+
+class _SnapshotStream:
+    """Writes the tables of a metadata structure in snapshot order as their slots fill.
+    
+    Slots still holding None are tables that have not finished; writing stops
+    at the first one and continues on the next flush.
+    """
+    
+    def __init__(self, metadata: Dict[str, Any], writer: SnapshotWriter):
+        self.metadata = metadata
+        self.writer = writer
+        # (database, None, None) opens a database, (database, schema, None) a schema
+        self._layout = []
+        for database, db_info in metadata['databases'].items():
+            self._layout.append((database, None, None))
+            for schema, schema_info in db_info['schemas'].items():
+                self._layout.append((database, schema, None))
+                self._layout.extend((database, schema, table) for table in schema_info['tables'])
+        self._next = 0
+    
+    def flush(self):
+        while self._next < len(self._layout):
+            database, schema, table = self._layout[self._next]
+            if schema is None:
+                self.writer.write_database(database)
+            elif table is None:
+                self.writer.write_schema(database, schema)
+            else:
+                table_info = self.metadata['databases'][database]['schemas'][schema]['tables'][table]
+                if table_info is None:
+                    return
+                self.writer.write_table(database, schema, table, table_info)
+            self._next += 1
+
+
+class _TableGroups:
+    """Annotates structurally identical tables once.
+    
+    Tables of a database whose names differ only in their digits
+    (events_2024_01, events_2024_02, ...) and whose column structure is
+    identical form a group. The first table of a group to be processed is
+    the representative and is annotated. The others are set aside without
+    holding a worker and copy its definitions once it is done.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.representatives = 0
+        self.members = 0
+    
+    @staticmethod
+    def key(database: str, table: str, columns: List[Dict[str, Any]]) -> Tuple[str, str, str]:
+        return database, re.sub(r'\d+', '#', table), table_fingerprint(columns)
+    
+    def claim(self, key: Tuple[str, str, str]) -> Tuple[bool, Dict[str, Any]]:
+        """(is representative, group) for a table's group key."""
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = {'done': False, 'definitions': None, 'error': None, 'waiting': []}
+                self._groups[key] = group
+                return True, group
+            return False, group
+    
+    def when_done(self, group: Dict[str, Any], callback: Callable[[], None]):
+        """Call ``callback`` once the group's representative is done (now, if it already is)."""
+        with self._lock:
+            if not group['done']:
+                group['waiting'].append(callback)
+                return
+        callback()
+    
+    def finish(self, group: Dict[str, Any], definitions: Dict[str, Any] = None, error: BaseException = None):
+        """Record the representative's definitions, or its error, and run the waiting callbacks."""
+        with self._lock:
+            group.update(done=True, definitions=definitions, error=error)
+            waiting, group['waiting'] = group['waiting'], []
+        for callback in waiting:
+            callback()
+    
+    def add_member(self, group: Dict[str, Any]):
+        with self._lock:
+            group['members'] = group.get('members', 0) + 1
+            self.members += 1
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            groups = sum(1 for group in self._groups.values() if group.get('members'))
+            return {'groups': groups, 'tables_copied': self.members}
 
 
 class GeminiLLMAnalyzer:
     """Uses Google Gemini to analyze and generate column definitions."""
 
-    def __init__(self):
-        api_key = os.getenv('GEMINI_API_KEY')
+    # Expected reply size of one definition inside a batched JSON answer
+    BATCH_OUTPUT_TOKENS_PER_COLUMN = 60
+
+    # Bump when the definition prompts change so cached definitions are regenerated
+    PROMPT_VERSION = 'v1'
+
+    def __init__(self, config: ExtractorConfig = None):
+        config = config or ExtractorConfig.from_env()
+        api_key = config.gemini_api_key
         if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
+            raise ValueError("Gemini API key not configured (GEMINI_API_KEY)")
 
         # Prefer a modern default if not set
-        model_name = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name)
+        model_name = config.gemini_model
+        # Shared handle: repeated extractions in one process reuse the same client
+        self.model = get_model(api_key, model_name)
+        self.model_name = model_name
+
+        # Batched mode annotates all uncommented columns of a table per request
+        self.batch_mode = config.llm_batch_mode
+        self.batch_token_budget = config.llm_batch_token_budget
+
+        # Rate-limited concurrent dispatch of definition requests
+        self.dispatcher = LLMDispatcher(
+            self.model,
+            requests_per_minute=config.llm_requests_per_minute,
+            tokens_per_minute=config.llm_tokens_per_minute,
+            max_concurrency=config.llm_max_concurrency,
+            max_retries=config.llm_max_retries,
+            burst_seconds=config.llm_burst_seconds
+        )
+
+        # Persistent cache so re-extractions only annotate genuinely new columns
+        self.cache = None
+        if config.definition_cache:
+            self.cache = DefinitionCache(
+                path=config.definition_cache_path,
+                max_entries=config.definition_cache_max_entries
+            )
+
+        # Name/type rules define obvious columns (id, created_at, ...) without a request
+        self.rules = None
+        if config.column_rules:
+            self.rules = ColumnRuleEngine.from_file(config.column_rules_path or None)
 
     @staticmethod
     def _response_to_text(response) -> str:
@@ -68,8 +399,11 @@ class GeminiLLMAnalyzer:
         column_name: str,
         column_type: str,
         database_name: str = None,
-        schema_name: str = None
+        schema_name: str = None,
+        profile: Dict = None
     ) -> str:
+        hint = profile_hint(profile)
+        observed = f"\nObserved Values: {hint}" if hint else ""
         prompt = f"""
 Analyze this database column and provide a clear, concise definition of what this column likely represents.
 
@@ -77,7 +411,7 @@ Database: {database_name}
 Schema: {schema_name}
 Table: {table_name}
 Column Name: {column_name}
-Column Type: {column_type}
+Column Type: {column_type}{observed}
 
 Provide a brief, professional definition (1 to 2 sentences) focusing on business meaning rather than technical details.
 
@@ -85,34 +419,192 @@ Definition:
 """.strip()
 
         try:
-            response = self.model.generate_content(prompt)
+            response = self.dispatcher.generate(prompt, expected_output_tokens=self.BATCH_OUTPUT_TOKENS_PER_COLUMN)
             text = self._response_to_text(response)
-            return text if text else f"Column {column_name} of type {column_type}"
+            return text if text else self._fallback_definition(column_name, column_type)
         except Exception as e:
             print(f"Error generating definition for {table_name}.{column_name}: {e}")
-            return f"Column {column_name} of type {column_type}"
+            return self._fallback_definition(column_name, column_type)
+
+    @staticmethod
+    def _fallback_definition(column_name: str, column_type: str) -> str:
+        """Placeholder definition used when the model gives no answer."""
+        return f"Column {column_name} of type {column_type}"
+
+    @staticmethod
+    def _column_line(column: Dict) -> str:
+        """Prompt line for a column, with observed values when it was profiled."""
+        hint = profile_hint(column.get('profile'))
+        return f"- {column['name']}: {column['type']}" + (f" ({hint})" if hint else "")
+    
+    def _cache_key(self, database_name: str, table_name: str, column: Dict) -> str:
+        """Cache key for a column definition under the current model and prompts."""
+        return DefinitionCache.make_key(
+            database_name, table_name, column['name'], column['type'],
+            self.model_name, self.PROMPT_VERSION
+        )
     
+    def _chunk_columns(self, columns: List[Dict]) -> List[List[Dict]]:
+        """Split columns into chunks whose prompt and reply fit the token budget."""
+        chunks = []
+        current = []
+        used = 0
+        for column in columns:
+            cost = LLMDispatcher.estimate_tokens(self._column_line(column)) + self.BATCH_OUTPUT_TOKENS_PER_COLUMN
+            if current and used + cost > self.batch_token_budget:
+                chunks.append(current)
+                current = []
+                used = 0
+            current.append(column)
+            used += cost
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def _parse_definition_map(text: str) -> Dict[str, str]:
+        """Parse a JSON object mapping column names to definitions from a model reply."""
+        start = text.find('{')
+        end = text.rfind('}')
+        if start == -1 or end <= start:
+            raise ValueError("reply does not contain a JSON object")
+        data = json.loads(text[start:end + 1])
+        if not isinstance(data, dict):
+            raise ValueError("reply JSON is not an object")
+        return {
+            str(name): definition.strip()
+            for name, definition in data.items()
+            if isinstance(definition, str) and definition.strip()
+        }
+
+    def generate_column_definitions_batch(
+        self,
+        table_name: str,
+        columns: List[Dict],
+        database_name: str = None,
+        schema_name: str = None
+    ) -> Dict[str, str]:
+        """Generate definitions for several columns of one table in a single request."""
+        column_lines = "\n".join(self._column_line(column) for column in columns)
+        prompt = f"""
+Analyze these database columns and provide a clear, concise definition of what each column likely represents.
+
+Database: {database_name}
+Schema: {schema_name}
+Table: {table_name}
+Columns (name: type, with observed values for profiled columns):
+{column_lines}
+
+For each column, provide a brief, professional definition (1 to 2 sentences) focusing on business meaning rather than technical details.
+
+Respond with only a JSON object mapping each column name exactly as listed to its definition, e.g. {{"column_name": "Definition."}}
+""".strip()
+
+        response = self.dispatcher.generate(
+            prompt, expected_output_tokens=len(columns) * self.BATCH_OUTPUT_TOKENS_PER_COLUMN
+        )
+        return self._parse_definition_map(self._response_to_text(response))
+
+    def _request_definitions_batch(self, table_name: str, columns: List[Dict],
+                                   database_name: str = None, schema_name: str = None) -> Dict[str, str]:
+        """Batched request that reports failures as an empty reply."""
+        try:
+            return self.generate_column_definitions_batch(
+                table_name=table_name,
+                columns=columns,
+                database_name=database_name,
+                schema_name=schema_name
+            )
+        except Exception as e:
+            print(f"        Batched definition request failed for {table_name}: {e}")
+            return {}
+
     def analyze_table_structure(self, table_name: str, columns: List[Dict], 
                               database_name: str = None, schema_name: str = None) -> List[Dict]:
-        """Analyze all columns in a table and add definitions."""
+        """Analyze all columns in a table and add definitions.
+        
+        In batch mode the uncommented columns are sent in token-budgeted chunks
+        with one request per chunk; columns missing from a malformed or
+        incomplete reply fall back to one request per column.
+        
+        Uncommented columns matched by a column rule are defined locally and
+        never reach the cache or the LLM.
+        """
         print(f"      Analyzing table structure for: {table_name}")
         
+        pending = []
         for column in columns:
             if not column.get('comment') or column['comment'].strip() == '':
-                print(f"        Generating definition for column: {column['name']}")
-                definition = self.generate_column_definition(
+                pending.append(column)
+            else:
+                column['ai_definition'] = column['comment']
+        
+        if self.rules and pending:
+            remaining = self.rules.apply(pending, table_name)
+            if len(remaining) < len(pending):
+                print(f"        Defined {len(pending) - len(remaining)} columns from column rules")
+            pending = remaining
+        
+        cache_keys = {}
+        generated = []
+        if self.cache and pending:
+            cache_keys = {
+                column['name']: self._cache_key(database_name, table_name, column)
+                for column in pending
+            }
+            cached = self.cache.get_many(list(cache_keys.values()))
+            remaining = []
+            for column in pending:
+                if cached.get(cache_keys[column['name']]):
+                    column['ai_definition'] = cached[cache_keys[column['name']]]
+                else:
+                    remaining.append(column)
+            if len(remaining) < len(pending):
+                print(f"        Reused {len(pending) - len(remaining)} cached definitions")
+            pending = remaining
+        
+        if self.batch_mode and pending:
+            chunks = self._chunk_columns(pending)
+            print(f"        Generating definitions for {len(pending)} columns in {len(chunks)} requests")
+            replies = self.dispatcher.map(
+                lambda chunk: self._request_definitions_batch(table_name, chunk, database_name, schema_name),
+                chunks
+            )
+            
+            remaining = []
+            for chunk, definitions in zip(chunks, replies):
+                for column in chunk:
+                    if definitions.get(column['name']):
+                        column['ai_definition'] = definitions[column['name']]
+                        generated.append(column)
+                    else:
+                        remaining.append(column)
+            
+            if remaining:
+                print(f"        Falling back to per-column requests for {len(remaining)} columns")
+            pending = remaining
+        
+        if pending:
+            definitions = self.dispatcher.map(
+                lambda column: self.generate_column_definition(
                     table_name=table_name,
                     column_name=column['name'],
                     column_type=column['type'],
                     database_name=database_name,
-                    schema_name=schema_name
-                )
+                    schema_name=schema_name,
+                    profile=column.get('profile')
+                ),
+                pending
+            )
+            for column, definition in zip(pending, definitions):
                 column['ai_definition'] = definition
-                
-                # Add a small delay to avoid rate limiting
-                time.sleep(0.5)
-            else:
-                column['ai_definition'] = column['comment']
+                if definition != self._fallback_definition(column['name'], column['type']):
+                    generated.append(column)
+        
+        if self.cache and generated:
+            self.cache.put_many([
+                (cache_keys[column['name']], column['ai_definition']) for column in generated
+            ])
         
         return columns
 
@@ -120,43 +612,85 @@ Definition:
 class ClickHouseMetadataExtractor:
     """Extracts metadata from ClickHouse database."""
     
-    def __init__(self):
-        """Initialize the extractor with database connection."""
-        load_dotenv()
+    def __init__(self, config: ExtractorConfig = None,
+                 progress_callback: Callable[[ProgressEvent], None] = None,
+                 cancel_event: threading.Event = None, checkpoint=None,
+                 snapshot_writer: SnapshotWriter = None):
+        """Initialize the extractor with database connection.
+        
+        Without a config, settings are read from the environment and .env file.
+        ``progress_callback`` receives a ProgressEvent after each table (it may
+        be called from worker threads), and setting ``cancel_event`` stops the
+        run before the next table with ExtractionCancelled.
+        
+        ``checkpoint`` is an optional object with ``load()`` returning
+        {(database, schema, table): table_info} for tables completed by an
+        earlier attempt, and a thread-safe ``save(database, schema, table,
+        table_info)`` called as each table completes (see extraction_jobs).
+        
+        With a ``snapshot_writer`` the snapshot is written incrementally while
+        the extraction runs instead of all at once at the end.
+        """
+        if config is None:
+            load_dotenv()
+            config = ExtractorConfig.from_env()
+        self.config = config
+        self.progress_callback = progress_callback
+        self.checkpoint = checkpoint
+        self.snapshot_writer = snapshot_writer
+        self.cancel_event = cancel_event or threading.Event()
+        self._progress_lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._tables_done = 0
+        self._tables_total = 0
+        self._columns_annotated = 0
+        # Previous versions of altered tables, reused when their structure is unchanged
+        self._previous_tables: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._tables_reused = 0
+        self._table_statistics: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Tables with the same name pattern and structure share one annotation
+        self.table_groups = _TableGroups() if config.table_dedup else None
+        self.connection_params = config.connection_params
         self.client = self._create_client()
         
+        # Worker pool size; workers check clients out of the shared connection pool
+        self.workers = max(1, config.workers)
+        
+        # Optional sampled column profiles with their own concurrency and time limits
+        self.profiler = None
+        if config.column_profiling:
+            self.profiler = ColumnProfiler(
+                sample_rows=config.profile_sample_rows,
+                top_k=config.profile_top_k,
+                max_execution_time=config.profile_max_execution_time,
+                max_threads=config.profile_max_threads,
+                max_concurrency=config.profile_max_concurrency,
+                time_budget=config.profile_time_budget
+            )
+        
         # Initialize LLM analyzer if API key is available
         try:
-            self.llm_analyzer = GeminiLLMAnalyzer()
-            model_name = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+            self.llm_analyzer = GeminiLLMAnalyzer(config)
             self.llm_enabled = True
-            print(f"✅ LLM analysis enabled with Gemini model: {model_name}")
+            print(f"✅ LLM analysis enabled with Gemini model: {config.gemini_model}")
         except Exception as e:
             print(f"⚠️  LLM analysis disabled: {e}")
             self.llm_analyzer = None
             self.llm_enabled = False
         
     def _create_client(self) -> clickhouse_connect.driver.Client:
-        """Create ClickHouse client connection."""
+        """Check out a ClickHouse client from the shared connection pool."""
         try:
             # Debug: Print connection parameters
-            print("CLICKHOUSE_HOST:", os.getenv('CLICKHOUSE_HOST', 'localhost'))
-            print("CLICKHOUSE_PORT:", os.getenv('CLICKHOUSE_PORT', '8123'))
-            print("CLICKHOUSE_USER:", os.getenv('CLICKHOUSE_USER', 'default'))
-            print("CLICKHOUSE_PASSWORD:", os.getenv('CLICKHOUSE_PASSWORD', ''))
-            print("CLICKHOUSE_DATABASE:", os.getenv('CLICKHOUSE_DATABASE', 'default'))
+            print("CLICKHOUSE_HOST:", self.config.host)
+            print("CLICKHOUSE_PORT:", self.config.port)
+            print("CLICKHOUSE_USER:", self.config.user)
+            print("CLICKHOUSE_DATABASE:", self.config.database)
             
-            client = clickhouse_connect.get_client(
-                host=os.getenv('CLICKHOUSE_HOST'),
-                port=int(os.getenv('CLICKHOUSE_PORT')),
-                username=os.getenv('CLICKHOUSE_USER'),
-                password=os.getenv('CLICKHOUSE_PASSWORD'),
-                database=os.getenv('CLICKHOUSE_DATABASE')
-            )
-            return client
+            return get_pool().acquire(**self.connection_params)
         except Exception as e:
             print(f"Error connecting to ClickHouse: {e}")
-            sys.exit(1)
+            raise
     
     def get_databases(self) -> List[str]:
         """Get list of databases based on filtering."""
@@ -165,9 +699,8 @@ class ClickHouseMetadataExtractor:
             all_databases = [row[0] for row in result.result_rows]
             
             # Check if targeted schemas are specified
-            targeted_schemas_str = os.getenv('TARGETED_SCHEMAS', '').strip()
-            if targeted_schemas_str:
-                targeted_schemas = [db.strip() for db in targeted_schemas_str.split(',')]
+            targeted_schemas = self.config.targeted_schemas
+            if targeted_schemas:
                 # Filter databases
                 filtered_databases = [db for db in all_databases if db in targeted_schemas]
                 print(f"Filtering databases: {all_databases} -> {filtered_databases}")
@@ -195,9 +728,8 @@ class ClickHouseMetadataExtractor:
             all_tables = [row[0] for row in result.result_rows]
             
             # Check if target tables are specified
-            target_tables_str = os.getenv('TARGET_TABLES', '').strip()
-            if target_tables_str:
-                target_tables = [table.strip() for table in target_tables_str.split(',')]
+            target_tables = self.config.target_tables
+            if target_tables:
                 # Filter tables
                 filtered_tables = [table for table in all_tables if table in target_tables]
                 print(f"  Filtering tables in {database}: {all_tables} -> {filtered_tables}")
@@ -208,10 +740,11 @@ class ClickHouseMetadataExtractor:
             print(f"Error getting tables for database {database}: {e}")
             return []
     
-    def get_table_structure(self, database: str, table: str) -> List[Dict[str, Any]]:
+    def get_table_structure(self, database: str, table: str,
+                            client: clickhouse_connect.driver.Client = None) -> List[Dict[str, Any]]:
         """Get table structure including column information."""
         try:
-            result = self.client.query(f"DESCRIBE TABLE {database}.{table}")
+            result = (client or self.client).query(f"DESCRIBE TABLE {database}.{table}")
             columns = []
             for row in result.result_rows:
                 column_info = {
@@ -229,13 +762,514 @@ class ClickHouseMetadataExtractor:
             print(f"Error getting table structure for {database}.{table}: {e}")
             return []
     
+    def _analyze_columns(self, database: str, schema: str, table: str,
+                         columns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run LLM analysis on a table's columns if enabled."""
+        if self.llm_enabled and self.llm_analyzer:
+            try:
+                columns = self.llm_analyzer.analyze_table_structure(
+                    table_name=table,
+                    columns=columns,
+                    database_name=database,
+                    schema_name=schema
+                )
+            except Exception as e:
+                print(f"      Warning: LLM analysis failed for table {table}: {e}")
+                # Continue without LLM analysis if it fails
+        else:
+            print(f"      Skipping LLM analysis for table: {table}")
+        return columns
+    
+    def _annotate_columns(self, database: str, schema: str, table: str,
+                          columns: List[Dict[str, Any]]) -> Future:
+        """Analyze a table's columns, or copy the definitions of its group's representative.
+        
+        Returns a future of the columns. A member of a group whose
+        representative is still being analyzed does not wait for it: its
+        future is completed by the representative's thread when the
+        definitions are known, so the worker moves on to the next table.
+        """
+        if self.table_groups is None or not (self.llm_enabled and self.llm_analyzer) or not columns:
+            return _completed(self._analyze_columns(database, schema, table, columns))
+        
+        representative, group = self.table_groups.claim(self.table_groups.key(database, table, columns))
+        if representative:
+            try:
+                columns = self._analyze_columns(database, schema, table, columns)
+            except BaseException as e:
+                self.table_groups.finish(group, error=e)
+                raise
+            self.table_groups.finish(group, {column['name']: column.get('ai_definition') for column in columns})
+            return _completed(columns)
+        
+        future = Future()
+        
+        def copy_definitions():
+            if group['error'] is not None:
+                future.set_exception(group['error'])
+                return
+            if self.cancel_event.is_set():
+                future.set_exception(ExtractionCancelled("Metadata extraction cancelled"))
+                return
+            print(f"      Reusing definitions of a structurally identical table for: {table}")
+            definitions = group['definitions']
+            for column in columns:
+                if definitions.get(column['name']):
+                    column['ai_definition'] = definitions[column['name']]
+            self.table_groups.add_member(group)
+            future.set_result(columns)
+        
+        self.table_groups.when_done(group, copy_definitions)
+        return future
+    
+    def get_table_versions(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """Fetch the filtered database/table listing with version information.
+        
+        Returns an ordered mapping of database -> table -> {uuid,
+        metadata_modification_time} read from system.databases and
+        system.tables. The TARGETED_SCHEMAS and TARGET_TABLES filters are
+        pushed down into the WHERE clauses.
+        """
+        targeted_schemas = self.config.targeted_schemas
+        target_tables = self.config.target_tables
+        
+        if targeted_schemas:
+            result = self.client.query(
+                "SELECT name FROM system.databases WHERE name IN {databases:Array(String)} ORDER BY name",
+                parameters={'databases': targeted_schemas}
+            )
+        else:
+            result = self.client.query("SELECT name FROM system.databases ORDER BY name")
+        versions = {row[0]: {} for row in result.result_rows}
+        if not versions:
+            return versions
+        
+        parameters = {'databases': list(versions)}
+        if target_tables:
+            parameters['tables'] = target_tables
+        table_filter = "AND name IN {tables:Array(String)}" if target_tables else ""
+        result = self.client.query(
+            f"""
+            SELECT database, name, toString(uuid), toString(metadata_modification_time)
+            FROM system.tables
+            WHERE database IN {{databases:Array(String)}} AND NOT is_temporary {table_filter}
+            ORDER BY database, name
+            """,
+            parameters=parameters
+        )
+        for database, table, uuid, modification_time in result.result_rows:
+            versions[database][table] = {
+                'uuid': uuid,
+                'metadata_modification_time': modification_time
+            }
+        
+        return versions
+    
+    def get_bulk_columns(self, databases: List[str],
+                         tables: List[str] = None) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+        """Fetch column definitions for many tables with a single system.columns query."""
+        parameters = {'databases': databases}
+        if tables:
+            parameters['tables'] = tables
+        column_filter = "AND table IN {tables:Array(String)}" if tables else ""
+        result = self.client.query(
+            f"""
+            SELECT database, table, name, type, default_kind, default_expression,
+                   comment, compression_codec
+            FROM system.columns
+            WHERE database IN {{databases:Array(String)}} {column_filter}
+            ORDER BY database, table, position
+            """,
+            parameters=parameters
+        )
+        
+        columns_by_table = {}
+        for row in result.result_rows:
+            columns_by_table.setdefault((row[0], row[1]), []).append({
+                'name': row[2],
+                'type': row[3],
+                'default_type': row[4],
+                'default_expression': row[5],
+                'comment': row[6],
+                'codec_expression': row[7],
+                'ttl_expression': ''
+            })
+        self._fill_column_ttls(columns_by_table, databases, tables)
+        return columns_by_table
+    
+    def _fill_column_ttls(self, columns_by_table: Dict[Tuple[str, str], List[Dict[str, Any]]],
+                          databases: List[str], tables: List[str] = None):
+        """Set ttl_expression from DESCRIBE for the tables whose DDL has a TTL.
+        
+        system.columns does not expose column TTLs, so only tables whose
+        create_table_query mentions TTL (usually few) are described.
+        """
+        parameters = {'databases': databases}
+        if tables:
+            parameters['tables'] = tables
+        table_filter = "AND name IN {tables:Array(String)}" if tables else ""
+        result = self.client.query(
+            f"""
+            SELECT database, name
+            FROM system.tables
+            WHERE database IN {{databases:Array(String)}} {table_filter}
+                  AND NOT is_temporary AND position(create_table_query, ' TTL ') > 0
+            """,
+            parameters=parameters
+        )
+        for database, table in result.result_rows:
+            columns = columns_by_table.get((database, table))
+            if not columns:
+                continue
+            ttls = {column['name']: column['ttl_expression'] for column in self.get_table_structure(database, table)}
+            for column in columns:
+                column['ttl_expression'] = ttls.get(column['name'], column['ttl_expression'])
+    
+    def get_table_statistics(self, databases: List[str],
+                             tables: List[str] = None) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Fetch size and layout statistics for many tables with two aggregated queries.
+        
+        Engine and keys come from system.tables; rows, bytes, parts and
+        partitions are summed over the active parts in system.parts. Tables
+        without parts (views, Memory, Distributed) fall back to the
+        total_rows / total_bytes of system.tables, which may be NULL.
+        """
+        parameters = {'databases': databases}
+        if tables:
+            parameters['tables'] = tables
+        table_filter = "AND {column} IN {{tables:Array(String)}}" if tables else ""
+        
+        result = self.client.query(
+            f"""
+            SELECT database, name, engine, sorting_key, partition_key, primary_key, sampling_key,
+                   total_rows, total_bytes
+            FROM system.tables
+            WHERE database IN {{databases:Array(String)}} AND NOT is_temporary
+                  {table_filter.format(column='name')}
+            """,
+            parameters=parameters
+        )
+        statistics = {}
+        for row in result.result_rows:
+            database, table, engine, sorting_key, partition_key, primary_key, sampling_key, total_rows, total_bytes = row
+            statistics[(database, table)] = {
+                'engine': engine,
+                'sorting_key': sorting_key,
+                'partition_key': partition_key,
+                'primary_key': primary_key,
+                'sampling_key': sampling_key,
+                'rows': total_rows,
+                'compressed_bytes': total_bytes,
+                'uncompressed_bytes': 0 if total_bytes == 0 else None,
+                'parts': 0,
+                'partitions': 0
+            }
+        
+        result = self.client.query(
+            f"""
+            SELECT database, table, sum(rows), sum(data_compressed_bytes), sum(data_uncompressed_bytes),
+                   count(), uniqExact(partition_id)
+            FROM system.parts
+            WHERE active AND database IN {{databases:Array(String)}} {table_filter.format(column='table')}
+            GROUP BY database, table
+            """,
+            parameters=parameters
+        )
+        for database, table, rows, compressed, uncompressed, parts, partitions in result.result_rows:
+            if (database, table) in statistics:
+                statistics[(database, table)].update({
+                    'rows': rows,
+                    'compressed_bytes': compressed,
+                    'uncompressed_bytes': uncompressed,
+                    'parts': parts,
+                    'partitions': partitions
+                })
+        return statistics
+    
+    def _harvest_statistics(self, databases: List[str]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Table statistics when enabled; a failure only drops the statistics."""
+        if not self.config.table_statistics or not databases:
+            return {}
+        try:
+            statistics = self.get_table_statistics(databases, self.config.target_tables)
+        except Exception as e:
+            print(f"⚠️  Table statistics harvest failed, continuing without: {e}")
+            return {}
+        print(f"Collected statistics for {len(statistics)} tables")
+        return statistics
+    
+    def harvest_schema_bulk(self, versions: Dict[str, Dict[str, Dict[str, str]]] = None
+                            ) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """Fetch databases, tables and columns with a few queries on system tables.
+        
+        Returns an ordered mapping of database -> table -> columns for the
+        tables listed in ``versions`` (fetched with get_table_versions when
+        not given), so only the requested objects leave the server.
+        """
+        if versions is None:
+            versions = self.get_table_versions()
+        schema_map = {database: {} for database in versions}
+        if not schema_map:
+            return schema_map
+        
+        columns_by_table = self.get_bulk_columns(list(versions), self.config.target_tables)
+        for database, tables in versions.items():
+            for table in tables:
+                schema_map[database][table] = columns_by_table.get((database, table), [])
+        
+        return schema_map
+    
+    def _process_table(self, task: TableTask, client: clickhouse_connect.driver.Client = None) -> Future:
+        """Describe (unless columns are already known) and analyze a single table.
+        
+        Returns a future of the table info; it is already done unless the
+        table copies its definitions from a representative still in progress.
+        """
+        database, schema, table, columns = task
+        self._check_cancelled()
+        print(f"      Processing table: {database}.{table}")
+        
+        # Get table structure, on a pooled client when running on a worker thread
+        if columns is None:
+            columns = self._with_client(client, lambda c: self.get_table_structure(database, table, client=c))
+        
+        # Reuse the previous version's definitions if its structure is unchanged
+        previous_info = self._previous_tables.get((database, schema, table))
+        reused = previous_info is not None and \
+            table_fingerprint(previous_info.get('columns', [])) == table_fingerprint(columns)
+        if reused:
+            print(f"      Structure unchanged, reusing definitions for table: {table}")
+            columns = previous_info['columns']
+            with self._progress_lock:
+                self._tables_reused += 1
+        
+        # Profile before the LLM analysis so definitions can use the observed values
+        if self.profiler is not None:
+            self._with_client(client, lambda c: self._profile_columns(database, table, columns, c))
+        
+        # Analyze columns with LLM if enabled
+        annotation = _completed(columns) if reused else self._annotate_columns(database, schema, table, columns)
+        
+        def finish(columns: List[Dict[str, Any]]) -> Dict[str, Any]:
+            annotated = sum(1 for column in columns if column.get('ai_definition'))
+            with self._progress_lock:
+                self._tables_done += 1
+                self._columns_annotated += annotated
+            self._emit_progress('table_done', f"{database}.{table}")
+            return {
+                'columns': columns,
+                'column_count': len(columns)
+            }
+        
+        return _then(annotation, finish)
+    
+    def _with_client(self, client: Optional[clickhouse_connect.driver.Client],
+                     action: Callable[[clickhouse_connect.driver.Client], Any]) -> Any:
+        """Run ``action`` on ``client``, or on a client checked out of the shared pool."""
+        if client is not None:
+            return action(client)
+        with get_pool().connection(**self.connection_params) as worker_client:
+            return action(worker_client)
+    
+    def _profile_columns(self, database: str, table: str, columns: List[Dict[str, Any]],
+                         client: clickhouse_connect.driver.Client):
+        """Attach sampled profiles to a table's columns (skipped for tables known to be empty)."""
+        statistics = self._table_statistics.get((database, table), {})
+        if not columns or statistics.get('rows') == 0:
+            return
+        profiles = self.profiler.profile_table(client, database, table, columns, statistics.get('sampling_key'))
+        for column in columns:
+            if column['name'] in profiles:
+                column['profile'] = profiles[column['name']]
+    
+    def _check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise ExtractionCancelled("Metadata extraction cancelled")
+    
+    def _emit_progress(self, kind: str, message: str = ''):
+        """Send a ProgressEvent to the progress callback, if one is set."""
+        if self.progress_callback is None:
+            return
+        llm_stats = self.llm_analyzer.dispatcher.stats() if self.llm_analyzer else {}
+        with self._progress_lock:
+            done, total, annotated = self._tables_done, self._tables_total, self._columns_annotated
+        elapsed = time.monotonic() - self._started_at
+        eta = elapsed / done * (total - done) if done and total >= done else None
+        event = ProgressEvent(
+            kind=kind,
+            tables_done=done,
+            tables_total=total,
+            columns_annotated=annotated,
+            llm_calls=llm_stats.get('calls', 0),
+            llm_in_flight=llm_stats.get('in_flight', 0),
+            elapsed_seconds=elapsed,
+            eta_seconds=eta,
+            message=message
+        )
+        try:
+            self.progress_callback(event)
+        except Exception as e:
+            print(f"⚠️  Progress callback failed: {e}")
+    
+    def _load_checkpoint(self, versions: Dict[str, Dict[str, Dict[str, str]]] = None
+                         ) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+        """Return checkpointed tables that are still current.
+        
+        When table versions are known, a checkpointed table is only reused if
+        its UUID and metadata modification time still match.
+        """
+        if self.checkpoint is None:
+            return {}
+        completed = {}
+        for (database, schema, table), table_info in self.checkpoint.load().items():
+            version = (versions or {}).get(database, {}).get(table)
+            if version is not None and any(table_info.get(key) != value for key, value in version.items()):
+                continue
+            completed[(database, schema, table)] = table_info
+        return completed
+    
+    def process_tables(self, tasks: List[TableTask],
+                       versions: Dict[str, Dict[str, Dict[str, str]]] = None,
+                       on_result: Callable[[TableTask, Dict[str, Any]], None] = None) -> List[Dict[str, Any]]:
+        """Process tables on a bounded worker pool.
+        
+        Workers check ClickHouse clients out of the shared connection pool for
+        each DESCRIBE, so no client is used by two threads at once. Results
+        are returned in task order regardless of completion order, so the
+        metadata layout is deterministic for any worker count. ``on_result``
+        is called in task order as soon as each result and all results
+        before it are available.
+        
+        Tables found in the checkpoint are reused without being processed, and
+        every newly processed table is saved to it.
+        
+        Workers hand back futures, so a table waiting for the definitions of
+        its group's representative is only waited for here, in task order,
+        while the workers carry on with other tables.
+        """
+        completed = self._load_checkpoint(versions)
+        results = [completed.get(task[:3]) for task in tasks]
+        pending = [task for task, result in zip(tasks, results) if result is None]
+        
+        with self._progress_lock:
+            self._tables_total += len(tasks)
+            self._tables_done += len(tasks) - len(pending)
+        message = f"{len(pending)} tables to process"
+        if len(pending) < len(tasks):
+            message += f", {len(tasks) - len(pending)} resumed from checkpoint"
+            print(f"    Resuming: {len(tasks) - len(pending)} tables already checkpointed")
+        self._emit_progress('started', message)
+        
+        def process(task: TableTask, client: clickhouse_connect.driver.Client = None) -> Future:
+            if self.checkpoint is None:
+                return self._process_table(task, client=client)
+            
+            def save(table_info: Dict[str, Any]) -> Dict[str, Any]:
+                database, schema, table, _ = task
+                version = (versions or {}).get(database, {}).get(table, {})
+                self.checkpoint.save(database, schema, table, {**table_info, **version})
+                return table_info
+            
+            return _then(self._process_table(task, client=client), save)
+        
+        def collect(processed) -> List[Dict[str, Any]]:
+            processed = iter(processed)
+            for index, task in enumerate(tasks):
+                if results[index] is None:
+                    results[index] = next(processed).result()
+                if on_result is not None:
+                    on_result(task, results[index])
+            return results
+        
+        if self.workers <= 1 or len(pending) <= 1:
+            return collect(process(task, client=self.client) for task in pending)
+        
+        print(f"    Processing {len(pending)} tables with {min(self.workers, len(pending))} workers")
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(pending)),
+                                thread_name_prefix='extractor') as executor:
+            return collect(executor.map(process, pending))
+    
+    def _collect_tables(self, metadata: Dict[str, Any], tasks: List[TableTask],
+                        versions: Dict[str, Dict[str, Dict[str, str]]] = None,
+                        statistics: Dict[Tuple[str, str], Dict[str, Any]] = None):
+        """Process tables into their slots in the nested metadata structure.
+        
+        When table versions are known they are stored alongside each table so
+        that a later incremental refresh can detect unchanged tables, and
+        table statistics are stored under ``statistics``. With a
+        snapshot writer, each table is written as soon as every table before
+        it in the snapshot is done.
+        """
+        self._table_statistics.update(statistics or {})
+        for database, schema, table, _ in tasks:
+            # Reserve the slot so the output keeps the listing order
+            metadata['databases'][database]['schemas'][schema]['tables'][table] = None
+        stream = _SnapshotStream(metadata, self.snapshot_writer) if self.snapshot_writer else None
+        
+        def place(task: TableTask, table_info: Dict[str, Any]):
+            database, schema, table, _ = task
+            if versions and table in versions.get(database, {}):
+                table_info.update(versions[database][table])
+            if statistics and (database, table) in statistics:
+                table_info['statistics'] = statistics[(database, table)]
+            metadata['databases'][database]['schemas'][schema]['tables'][table] = table_info
+            if stream:
+                stream.flush()
+        
+        if stream:
+            stream.flush()
+        self.process_tables(tasks, versions, on_result=place)
+        if stream:
+            stream.flush()
+    
+    def extract_metadata_bulk(self, schema_map: Dict[str, Dict[str, List[Dict[str, Any]]]] = None,
+                              versions: Dict[str, Dict[str, Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Extract all metadata using bulk queries against system tables."""
+        print("Starting bulk metadata extraction...")
+        
+        if versions is None:
+            versions = self.get_table_versions()
+        if schema_map is None:
+            schema_map = self.harvest_schema_bulk(versions)
+        total_tables = sum(len(tables) for tables in schema_map.values())
+        print(f"Found {len(schema_map)} databases and {total_tables} tables: {list(schema_map)}")
+        
+        metadata = {
+            'databases': {}
+        }
+        tasks = []
+        
+        for database, tables in schema_map.items():
+            metadata['databases'][database] = {
+                'schemas': {}
+            }
+            
+            for schema in self.get_schemas(database):
+                metadata['databases'][database]['schemas'][schema] = {
+                    'tables': {}
+                }
+                tasks.extend((database, schema, table, columns) for table, columns in tables.items())
+        
+        self._collect_tables(metadata, tasks, versions, self._harvest_statistics(list(schema_map)))
+        return metadata
+    
     def extract_metadata(self) -> Dict[str, Any]:
         """Extract all metadata from ClickHouse database."""
+        if self.config.extraction_mode == 'bulk':
+            try:
+                versions = self.get_table_versions()
+                schema_map = self.harvest_schema_bulk(versions)
+            except Exception as e:
+                print(f"⚠️  Bulk schema harvest failed, falling back to per-table DESCRIBE: {e}")
+            else:
+                return self.extract_metadata_bulk(schema_map, versions)
+        
         print("Starting metadata extraction...")
         
         metadata = {
             'databases': {}
         }
+        tasks = []
         
         # Get all databases
         databases = self.get_databases()
@@ -260,71 +1294,213 @@ class ClickHouseMetadataExtractor:
                 tables = self.get_tables(database)
                 print(f"    Found {len(tables)} tables in schema {schema}")
                 
-                for table in tables:
-                    print(f"      Processing table: {table}")
-                    
-                    # Get table structure
-                    columns = self.get_table_structure(database, table)
+                tasks.extend((database, schema, table, None) for table in tables)
+        
+        # Describe and analyze the tables, concurrently if configured
+        self._collect_tables(metadata, tasks, statistics=self._harvest_statistics(databases))
+        return metadata
+    
+    def refresh_metadata(self, previous: Dict[str, Any]) -> Dict[str, Any]:
+        """Incrementally refresh a previous metadata snapshot.
+        
+        Tables whose UUID and metadata modification time in system.tables
+        match the previous snapshot are reused as-is, including their AI
+        definitions. Added or altered tables are re-described; altered tables
+        whose column fingerprint is unchanged (e.g. after a settings change or
+        a recreate) keep their AI definitions, the rest are re-analyzed.
+        Tables that no longer exist are dropped.
+        """
+        print("Starting incremental metadata refresh...")
+        
+        versions = self.get_table_versions()
+        statistics = self._harvest_statistics(list(versions))
+        previous_tables = {
+            (database, schema, table): table_info
+            for database, db_info in previous.get('databases', {}).items()
+            for schema, schema_info in db_info.get('schemas', {}).items()
+            for table, table_info in schema_info.get('tables', {}).items()
+        }
+        
+        metadata = {
+            'databases': {}
+        }
+        tasks = []
+        added = altered = unchanged = 0
+        
+        for database, tables in versions.items():
+            metadata['databases'][database] = {
+                'schemas': {}
+            }
+            
+            for schema in self.get_schemas(database):
+                metadata['databases'][database]['schemas'][schema] = {
+                    'tables': {}
+                }
+                
+                for table, version in tables.items():
+                    previous_info = previous_tables.pop((database, schema, table), None)
+                    if previous_info is not None and all(
+                        previous_info.get(key) == value for key, value in version.items()
+                    ):
+                        unchanged += 1
+                        # Sizes change without DDL, so unchanged tables get fresh statistics
+                        if (database, table) in statistics:
+                            previous_info = {**previous_info, 'statistics': statistics[(database, table)]}
+                        metadata['databases'][database]['schemas'][schema]['tables'][table] = previous_info
+                        continue
                     
-                    # Analyze columns with LLM if enabled
-                    if self.llm_enabled and self.llm_analyzer:
-                        try:
-                            columns = self.llm_analyzer.analyze_table_structure(
-                                table_name=table,
-                                columns=columns,
-                                database_name=database,
-                                schema_name=schema
-                            )
-                        except Exception as e:
-                            print(f"      Warning: LLM analysis failed for table {table}: {e}")
-                            # Continue without LLM analysis if it fails
+                    if previous_info is None:
+                        added += 1
                     else:
-                        print(f"      Skipping LLM analysis for table: {table}")
-                    
-                    metadata['databases'][database]['schemas'][schema]['tables'][table] = {
-                        'columns': columns,
-                        'column_count': len(columns)
-                    }
+                        altered += 1
+                        self._previous_tables[(database, schema, table)] = previous_info
+                    # Reserve the slot so the output keeps system.tables ordering
+                    metadata['databases'][database]['schemas'][schema]['tables'][table] = None
+                    tasks.append((database, schema, table, None))
+        
+        print(f"Tables unchanged: {unchanged}, added: {added}, altered: {altered}, "
+              f"removed: {len(previous_tables)}")
         
+        if tasks and self.config.extraction_mode == 'bulk':
+            changed_databases = list(dict.fromkeys(task[0] for task in tasks))
+            # Only narrow by table name while the parameter list stays small
+            changed_tables = list(dict.fromkeys(task[2] for task in tasks))
+            if len(changed_tables) > 1000:
+                changed_tables = None
+            try:
+                columns_by_table = self.get_bulk_columns(changed_databases, changed_tables)
+            except Exception as e:
+                print(f"⚠️  Bulk column harvest failed, falling back to per-table DESCRIBE: {e}")
+            else:
+                tasks = [
+                    (database, schema, table, columns_by_table.get((database, table), []))
+                    for database, schema, table, _ in tasks
+                ]
+        
+        self._collect_tables(metadata, tasks, versions, statistics)
+        if self._tables_reused:
+            print(f"Altered tables with unchanged structure: {self._tables_reused} (AI definitions reused)")
+        return metadata
+    
+    def run(self, previous: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Run a full extraction, or an incremental refresh of ``previous``
+        when the config enables it; a failed refresh falls back to a full run.
+        """
+        self._started_at = time.monotonic()
+        try:
+            metadata = None
+            if self.config.incremental and previous is not None:
+                try:
+                    metadata = self.refresh_metadata(previous)
+                except ExtractionCancelled:
+                    raise
+                except Exception as e:
+                    print(f"⚠️  Incremental refresh failed, running a full extraction: {e}")
+                    if self.snapshot_writer:
+                        self.snapshot_writer.reset()
+            if metadata is None:
+                metadata = self.extract_metadata()
+        except ExtractionCancelled:
+            self._emit_progress('cancelled', "Extraction cancelled")
+            raise
+        self._emit_progress('finished', "Extraction complete")
         return metadata
     
-    def save_metadata(self, metadata: Dict[str, Any], filename: str = 'clickhouse_metadata.json'):
-        """Save metadata to JSON file."""
+    @classmethod
+    def extract(cls, config: ExtractorConfig, previous: Dict[str, Any] = None,
+                progress_callback: Callable[[ProgressEvent], None] = None,
+                cancel_event: threading.Event = None, checkpoint=None) -> Dict[str, Any]:
+        """Library entry point: extract metadata for ``config`` and return it.
+        
+        Nothing is read from environment variables or written to disk, so
+        callers such as the Streamlit app can run extractions in-process.
+        """
+        extractor = cls(config, progress_callback=progress_callback, cancel_event=cancel_event,
+                        checkpoint=checkpoint)
+        try:
+            return extractor.run(previous)
+        finally:
+            extractor.close()
+    
+    def load_metadata(self, filename: str = 'clickhouse_metadata.json') -> Optional[Dict[str, Any]]:
+        """Load a previously saved metadata snapshot, if one exists."""
+        if not os.path.exists(filename):
+            return None
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
+            # JSON or binary; JSON is decoded table by table so the raw file text is never held in memory
+            return load_snapshot(filename)
+        except Exception as e:
+            print(f"Error loading metadata from {filename}: {e}")
+            return None
+    
+    def save_metadata(self, metadata: Dict[str, Any], filename: str = 'clickhouse_metadata.json',
+                      output_format: str = 'json'):
+        """Save metadata to a JSON or binary snapshot file."""
+        try:
+            save_snapshot(metadata, filename, output_format)
             print(f"\nMetadata saved to {filename}")
         except Exception as e:
             print(f"Error saving metadata: {e}")
     
     def close(self):
-        """Close the database connection."""
+        """Return the database connection to the pool and close the definition cache."""
+        if self.llm_analyzer:
+            self.llm_analyzer.dispatcher.close()
+            if self.llm_analyzer.cache:
+                self.llm_analyzer.cache.close()
         if self.client:
-            self.client.close()
-
-
-def set_env_from_args(args):
-    """Set environment variables from command line arguments."""
-    if args.host:
-        os.environ['CLICKHOUSE_HOST'] = args.host
-    if args.port:
-        os.environ['CLICKHOUSE_PORT'] = args.port
-    if args.user:
-        os.environ['CLICKHOUSE_USER'] = args.user
-    if args.password:
-        os.environ['CLICKHOUSE_PASSWORD'] = args.password
-    if args.database:
-        os.environ['CLICKHOUSE_DATABASE'] = args.database
-    if args.secure is not None:
-        os.environ['CLICKHOUSE_SECURE'] = str(args.secure).lower()
-    if args.gemini_key:
-        os.environ['GEMINI_API_KEY'] = args.gemini_key
-    if args.gemini_model:
-        os.environ['GEMINI_MODEL'] = args.gemini_model
-    if args.targeted_schemas:
-        os.environ['TARGETED_SCHEMAS'] = args.targeted_schemas
-    if args.target_tables:
-        os.environ['TARGET_TABLES'] = args.target_tables
+            get_pool().release(self.client)
+            self.client = None
+
+
+# Command line option -> setting it overrides when given
+_ARG_SETTINGS = {
+    'host': 'host',
+    'port': 'port',
+    'user': 'user',
+    'password': 'password',
+    'database': 'database',
+    'gemini_key': 'gemini_api_key',
+    'gemini_model': 'gemini_model',
+    'targeted_schemas': 'targeted_schemas',
+    'target_tables': 'target_tables',
+    'extraction_mode': 'extraction_mode',
+    'workers': 'workers',
+    'column_rules': 'column_rules_path',
+    'llm_rpm': 'llm_requests_per_minute',
+    'llm_tpm': 'llm_tokens_per_minute',
+    'llm_burst_seconds': 'llm_burst_seconds',
+    'profile_sample_rows': 'profile_sample_rows',
+    'output_format': 'output_format',
+}
+
+# Command line switch -> (setting, value it sets when given)
+_ARG_SWITCHES = {
+    'secure': ('secure', True),
+    'incremental': ('incremental', True),
+    'no_llm_batch': ('llm_batch_mode', False),
+    'no_definition_cache': ('definition_cache', False),
+    'no_column_rules': ('column_rules', False),
+    'no_table_dedup': ('table_dedup', False),
+    'profile_columns': ('column_profiling', True),
+    'no_table_statistics': ('table_statistics', False),
+}
+
+
+def apply_args(config: ExtractorConfig, args) -> ExtractorConfig:
+    """Override settings of ``config`` with the command line options that were given."""
+    for arg, setting in _ARG_SETTINGS.items():
+        value = getattr(args, arg)
+        if value is None or value == '':
+            continue
+        if setting in ExtractorConfig._SECRETS:
+            setattr(config, setting, str(value))
+        else:
+            setattr(config, setting, ExtractorConfig._convert(value, getattr(config, setting)))
+    for arg, (setting, value) in _ARG_SWITCHES.items():
+        if getattr(args, arg):
+            setattr(config, setting, value)
+    return config
 
 def main():
     """Main function to run the metadata extraction."""
@@ -343,78 +1519,121 @@ def main():
     parser.add_argument('--gemini-model', help='Gemini model name')
     parser.add_argument('--targeted-schemas', help='Comma-separated list of targeted schemas')
     parser.add_argument('--target-tables', help='Comma-separated list of target tables')
+    parser.add_argument('--extraction-mode', choices=['bulk', 'describe'],
+                        help='Schema extraction mode: bulk system table queries (default) or per-table DESCRIBE')
+    parser.add_argument('--workers', type=int, help='Number of concurrent table extraction workers (default 4)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Refresh only tables added or altered since the previous clickhouse_metadata.json')
+    parser.add_argument('--no-llm-batch', action='store_true',
+                        help='Request AI definitions one column at a time instead of one batch per table')
+    parser.add_argument('--no-definition-cache', action='store_true',
+                        help='Do not reuse or store AI definitions in the on-disk definition cache')
+    parser.add_argument('--no-column-rules', action='store_true',
+                        help='Send every uncommented column to the LLM instead of defining obvious ones by rule')
+    parser.add_argument('--column-rules', help='JSON file of column rules tried before the built-in rules')
+    parser.add_argument('--no-table-dedup', action='store_true',
+                        help='Annotate every table separately, even structurally identical partitions')
+    parser.add_argument('--profile-columns', action='store_true',
+                        help='Profile columns (distinct count, nulls, min/max, top values) on a bounded sample')
+    parser.add_argument('--profile-sample-rows', type=int, help='Rows sampled per table when profiling (default 100000)')
+    parser.add_argument('--no-table-statistics', action='store_true',
+                        help='Do not collect row counts, sizes, parts and keys from system.tables/system.parts')
+    parser.add_argument('--llm-rpm', type=int, help='Gemini requests-per-minute quota (default 60)')
+    parser.add_argument('--llm-tpm', type=int, help='Gemini tokens-per-minute quota (default 1000000)')
+    parser.add_argument('--llm-burst-seconds', type=int,
+                        help='Seconds of quota the rate limiter lets through in one burst (default 6)')
+    parser.add_argument('--output-format', choices=['json', 'msgpack'],
+                        help='Snapshot format: JSON (default) or compact binary MessagePack (needs msgpack)')
+    parser.add_argument('--job-id',
+                        help='Checkpoint completed tables under this job id and resume the job if it was interrupted')
     parser.add_argument('--config', help='Path to JSON configuration file')
     
     args = parser.parse_args()
     
-    # Load config from JSON file if provided
+    # Load environment variables from the .env file (variables already set take precedence)
+    load_dotenv()
+    
     if args.config:
+        # The config file replaces the environment; it uses the keys of the Streamlit form
         try:
             with open(args.config, 'r') as f:
-                config_data = json.load(f)
-            
-            # Set environment variables from config file
-            if config_data.get('host'):
-                os.environ['CLICKHOUSE_HOST'] = str(config_data['host'])
-            if config_data.get('port'):
-                os.environ['CLICKHOUSE_PORT'] = str(config_data['port'])
-            if config_data.get('user'):
-                os.environ['CLICKHOUSE_USER'] = str(config_data['user'])
-            if config_data.get('password'):
-                os.environ['CLICKHOUSE_PASSWORD'] = str(config_data['password'])
-            if config_data.get('database'):
-                os.environ['CLICKHOUSE_DATABASE'] = str(config_data['database'])
-            if config_data.get('secure') is not None:
-                os.environ['CLICKHOUSE_SECURE'] = str(config_data['secure']).lower()
-            if config_data.get('geminiApiKey'):
-                os.environ['GEMINI_API_KEY'] = str(config_data['geminiApiKey'])
-            if config_data.get('geminiModel'):
-                os.environ['GEMINI_MODEL'] = str(config_data['geminiModel'])
-            if config_data.get('targetedSchemas'):
-                os.environ['TARGETED_SCHEMAS'] = str(config_data['targetedSchemas'])
-            if config_data.get('targetTables'):
-                os.environ['TARGET_TABLES'] = str(config_data['targetTables'])
-            
+                config = ExtractorConfig.from_dict(json.load(f))
             print(f"✅ Configuration loaded from {args.config}")
         except Exception as e:
             print(f"❌ Error loading config file: {e}")
             sys.exit(1)
     else:
-        # Set environment variables from command line arguments
-        set_env_from_args(args)
+        # Check if .env file exists
+        if not os.path.exists('.env'):
+            print("Warning: .env file not found. Please create one based on env.example")
+            print("Using default connection parameters...")
+        config = ExtractorConfig.from_env()
     
-    # Load environment variables (fallback to .env file if not provided via args)
-    load_dotenv()
-    
-    # Check if .env file exists
-    if not os.path.exists('.env'):
-        print("Warning: .env file not found. Please create one based on env.example")
-        print("Using default connection parameters...")
+    # Command line options override the config file or environment
+    try:
+        apply_args(config, args)
+    except ValueError as e:
+        print(f"❌ Invalid command line option: {e}")
+        sys.exit(1)
     
     # Show filtering status
-    targeted_schemas = os.getenv('TARGETED_SCHEMAS', '').strip()
-    target_tables = os.getenv('TARGET_TABLES', '').strip()
-    
-    if targeted_schemas:
-        print(f"📋 Database filtering enabled: {targeted_schemas}")
+    if config.targeted_schemas:
+        print(f"📋 Database filtering enabled: {', '.join(config.targeted_schemas)}")
     else:
         print("📋 Extracting all databases")
     
-    if target_tables:
-        print(f"📋 Table filtering enabled: {target_tables}")
+    if config.target_tables:
+        print(f"📋 Table filtering enabled: {', '.join(config.target_tables)}")
     else:
         print("📋 Extracting all tables")
     
+    if config.output_format == 'msgpack' and not msgpack_available():
+        print("❌ msgpack is not installed; install it or use --output-format json")
+        sys.exit(1)
+    
     print()
     
-    extractor = ClickHouseMetadataExtractor()
+    # Checkpoint tables as they complete so an interrupted run can be resumed
+    job_store = checkpoint = progress_callback = None
+    if args.job_id:
+        from extraction_jobs import ExtractionJobRunner, JobCheckpoint, get_job_runner
+        job_store = get_job_runner().store
+        job_store.start_job(args.job_id, ExtractionJobRunner.describe(config))
+        checkpoint = JobCheckpoint(job_store, args.job_id)
+        progress_callback = checkpoint.record_progress
+        print(f"📋 Checkpointing to job {args.job_id} in {job_store.path}")
+    
+    # JSON tables are written to the output file as they finish; it is moved into place when complete.
+    # Binary snapshots are written in one go once the extraction is done.
+    writer = SnapshotWriter(config.output_file) if config.output_format == 'json' else None
+    
+    try:
+        extractor = ClickHouseMetadataExtractor(config, progress_callback=progress_callback, checkpoint=checkpoint,
+                                                snapshot_writer=writer)
+    except Exception as e:
+        if writer:
+            writer.abort()
+        if job_store:
+            job_store.finish_job(args.job_id, 'failed', error=str(e))
+        sys.exit(1)
     
     try:
-        # Extract metadata
-        metadata = extractor.extract_metadata()
+        # Extract metadata, reusing unchanged tables from the previous snapshot if requested
+        previous = None
+        if config.incremental:
+            previous = extractor.load_metadata(config.output_file)
+            if previous is None:
+                print("📋 No previous snapshot found, running a full extraction")
+        metadata = extractor.run(previous)
         
-        # Save to JSON file
-        extractor.save_metadata(metadata)
+        # Finish the JSON file written during extraction
+        if writer:
+            writer.close()
+        else:
+            save_snapshot(metadata, config.output_file, config.output_format)
+        print(f"\nMetadata saved to {config.output_file}")
+        if job_store:
+            job_store.finish_job(args.job_id, 'completed', metadata=metadata)
         
         # Print summary
         total_databases = len(metadata['databases'])
@@ -427,10 +1646,33 @@ def main():
         print(f"\nExtraction Summary:")
         print(f"  Total databases: {total_databases}")
         print(f"  Total tables: {total_tables}")
+        if extractor.llm_analyzer:
+            dispatch_stats = extractor.llm_analyzer.dispatcher.stats()
+            print(f"  LLM requests: {dispatch_stats['calls']} ({dispatch_stats['throttled']} throttled)")
+            if extractor.llm_analyzer.cache:
+                cache_stats = extractor.llm_analyzer.cache.stats()
+                print(f"  Definition cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+            if extractor.llm_analyzer.rules:
+                rule_stats = extractor.llm_analyzer.rules.stats()
+                print(f"  Column rules: {rule_stats['resolved']} of {rule_stats['columns']} uncommented columns "
+                      f"({rule_stats['share']:.0%}) defined locally")
+            if extractor.table_groups:
+                group_stats = extractor.table_groups.stats()
+                print(f"  Identical tables: {group_stats['tables_copied']} tables reused the definitions "
+                      f"of {group_stats['groups']} representatives")
+        if extractor.profiler:
+            profile_stats = extractor.profiler.stats()
+            print(f"  Column profiles: {profile_stats['profiled']} tables profiled, "
+                  f"{profile_stats['skipped']} skipped (time budget), {profile_stats['failed']} failed")
         print("Metadata extraction completed successfully!")
         
     except Exception as e:
+        if writer:
+            writer.abort()
         print(f"Error during metadata extraction: {e}")
+        if job_store:
+            job_store.finish_job(args.job_id, 'failed', error=str(e))
+            print(f"Completed tables are checkpointed; rerun with --job-id {args.job_id} to resume")
         sys.exit(1)
     finally:
         extractor.close()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+ClickHouse Connection Pool
+
+Process-wide pool of ``clickhouse_connect`` clients keyed by a fingerprint of
+the connection credentials, shared by the Streamlit chat path (across reruns
+and sessions) and by in-process metadata extraction.
+
+- Clients are handed out to one caller at a time and returned after use.
+- Each credential set is capped at ``max_size`` open clients; callers wait
+  for a free client when the cap is reached.
+- Clients idle for longer than ``health_check_interval`` are pinged before
+  reuse, and clients idle for longer than ``idle_timeout`` are closed, for
+  every credential set: on each acquire and by a background reaper thread,
+  started with the first idle client, that sweeps every ``reap_interval``
+  seconds (by default half the idle timeout, at most a minute).
+- All clients are closed at interpreter exit.
+"""
+
+import atexit
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+import clickhouse_connect
+from clickhouse_connect.driver.exceptions import OperationalError
+
+
+class _ClientSlot:
+    """Idle clients and usage counters for one credential fingerprint."""
+
+    def __init__(self, params: Dict[str, Any]):
+        self.params = params
+        self.idle: List[Tuple[Any, float]] = []
+        self.in_use = 0
+
+
+class ClickHousePool:
+    """Thread-safe pool of ClickHouse clients keyed by credential fingerprint."""
+
+    def __init__(self, max_size: int = 8, idle_timeout: float = 300.0,
+                 health_check_interval: float = 30.0, acquire_timeout: float = 30.0,
+                 reap_interval: float = None):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval if reap_interval is not None else min(60.0, idle_timeout / 2)
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.created = 0
+        self.reused = 0
+        self._slots: Dict[str, _ClientSlot] = {}
+        self._owners: Dict[int, str] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._reaper = None
+        self._stop_reaper = threading.Event()
+
+    @staticmethod
+    def fingerprint(params: Dict[str, Any]) -> str:
+        """Hash the connection parameters so credentials are never used as keys directly."""
+        payload = "\x1f".join(f"{key}={params[key]}" for key in sorted(params))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _close_client(client):
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def _evict_idle_locked(self, slot: _ClientSlot, now: float) -> List[Any]:
+        """Remove clients idle past the timeout; returns them for closing outside the lock."""
+        expired = [client for client, last_used in slot.idle if now - last_used > self.idle_timeout]
+        if expired:
+            slot.idle = [(client, last_used) for client, last_used in slot.idle
+                         if now - last_used <= self.idle_timeout]
+        return expired
+
+    def _evict_all_locked(self, now: float) -> List[Any]:
+        """Evict idle clients of every credential set and forget sets with no clients left."""
+        expired = []
+        for key, slot in list(self._slots.items()):
+            expired += self._evict_idle_locked(slot, now)
+            if not slot.idle and not slot.in_use:
+                del self._slots[key]
+        return expired
+
+    def _start_reaper_locked(self):
+        if self._reaper is not None or self.reap_interval <= 0 or self._closed:
+            return
+        self._reaper = threading.Thread(target=self._reap, name='clickhouse-pool-reaper', daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        while not self._stop_reaper.wait(self.reap_interval):
+            self.evict_idle()
+
+    def acquire(self, **params) -> clickhouse_connect.driver.Client:
+        """Check out a client for the given connection parameters.
+
+        Reuses an idle client when one is available (pinging it first if it
+        has been idle a while), opens a new one while under ``max_size``, and
+        otherwise waits up to ``acquire_timeout`` seconds for a release.
+        """
+        key = self.fingerprint(params)
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError("ClickHouse connection pool is closed")
+                # Sweep every credential set, not only this one, so unused credentials do not keep clients open
+                expired = self._evict_all_locked(time.time())
+                slot = self._slots.setdefault(key, _ClientSlot(dict(params)))
+                candidate = None
+                if slot.idle:
+                    # Most recently used first keeps the warmest connections busy
+                    candidate, last_used = slot.idle.pop()
+                    slot.in_use += 1
+                elif slot.in_use + len(slot.idle) < self.max_size:
+                    slot.in_use += 1
+                    last_used = None
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No ClickHouse connection available within {self.acquire_timeout}s")
+                    self._condition.wait(remaining)
+                    continue
+
+            for client in expired:
+                self._close_client(client)
+
+            try:
+                if candidate is not None and time.time() - last_used > self.health_check_interval \
+                        and not candidate.ping():
+                    self._close_client(candidate)
+                    candidate = None
+                reused = candidate is not None
+                if candidate is None:
+                    candidate = clickhouse_connect.get_client(**params)
+            except Exception:
+                with self._condition:
+                    slot.in_use -= 1
+                    self._condition.notify()
+                raise
+
+            with self._condition:
+                self._owners[id(candidate)] = key
+                if reused:
+                    self.reused += 1
+                else:
+                    self.created += 1
+            return candidate
+
+    def release(self, client, discard: bool = False):
+        """Return a client to the pool, or close it if ``discard`` is set or the pool is closed."""
+        with self._condition:
+            key = self._owners.pop(id(client), None)
+            slot = self._slots.get(key) if key else None
+            if slot is not None:
+                slot.in_use -= 1
+                if not discard and not self._closed:
+                    slot.idle.append((client, time.time()))
+                    client = None
+                    self._start_reaper_locked()
+            self._condition.notify()
+        if client is not None:
+            self._close_client(client)
+
+    @contextmanager
+    def connection(self, **params):
+        """Context manager that checks a client out and always returns it.
+
+        Clients that raised a connection-level error are discarded rather than
+        reused.
+        """
+        client = self.acquire(**params)
+        discard = False
+        try:
+            yield client
+        except OperationalError:
+            discard = True
+            raise
+        finally:
+            self.release(client, discard=discard)
+
+    def evict_idle(self):
+        """Close every client that has been idle longer than ``idle_timeout``."""
+        now = time.time()
+        with self._condition:
+            expired = self._evict_all_locked(now)
+        for client in expired:
+            self._close_client(client)
+
+    def stats(self) -> Dict[str, int]:
+        """Return pool counters and current sizes."""
+        with self._condition:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'idle': sum(len(slot.idle) for slot in self._slots.values()),
+                'in_use': sum(slot.in_use for slot in self._slots.values())
+            }
+
+    def close_all(self):
+        """Close all idle clients; clients still checked out are closed when released."""
+        with self._condition:
+            self._closed = True
+            self._stop_reaper.set()
+            idle = [client for slot in self._slots.values() for client, _ in slot.idle]
+            for slot in self._slots.values():
+                slot.idle = []
+            self._condition.notify_all()
+        for client in idle:
+            self._close_client(client)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool() -> ClickHousePool:
+    """Return the process-wide pool, creating it on first use."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ClickHousePool(
+                max_size=int(os.getenv('CLICKHOUSE_POOL_MAX_SIZE', '8')),
+                idle_timeout=float(os.getenv('CLICKHOUSE_POOL_IDLE_TIMEOUT', '300'))
+            )
+            atexit.register(_default_pool.close_all)
+        return _default_pool
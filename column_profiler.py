@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Column Profiler
+
+Sampled, cost-bounded column profiles for extracted tables: approximate
+distinct count, null fraction, min/max and top values per column.
+
+- One query per table covers all of its columns, using ClickHouse's
+  approximate aggregates (``uniq``, ``topK``).
+- Each query reads a bounded sample: ``SAMPLE n`` for tables with a
+  sampling key, otherwise the first ``n`` rows (``LIMIT``).
+- Each query runs with ``max_execution_time`` and
+  ``timeout_overflow_mode='break'``, so a slow table returns a partial
+  profile at its time budget instead of failing, and with a small
+  ``max_threads``.
+- A semaphore caps how many profiling queries run at once across extraction
+  workers, and an optional overall budget stops profiling once it is spent.
+
+Profiles are stored as ``column['profile']``.
+"""
+
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Types profiled with min/max (and without top values: they are rarely repetitive)
+_RANGE_TYPES = re.compile(r'^(Float|Decimal|Date|DateTime)')
+# Types profiled with top values (and min/max for integers)
+_DISCRETE_TYPES = re.compile(r'^(U?Int\d+|Bool|String|FixedString|Enum|UUID|IPv[46])')
+_INTEGER_TYPES = re.compile(r'^U?Int\d+')
+
+
+def _base_type(column_type: str) -> Tuple[str, bool]:
+    """Strip LowCardinality/Nullable wrappers; returns (base type, nullable)."""
+    nullable = False
+    while True:
+        match = re.match(r'^(LowCardinality|Nullable)\((.*)\)$', column_type)
+        if not match:
+            return column_type, nullable
+        nullable = nullable or match.group(1) == 'Nullable'
+        column_type = match.group(2)
+
+
+def _quote(identifier: str) -> str:
+    return '`' + identifier.replace('\\', '\\\\').replace('`', '\\`') + '`'
+
+
+class ColumnProfiler:
+    """Builds and runs the per-table profiling queries."""
+
+    def __init__(self, sample_rows: int = 100000, top_k: int = 5, max_execution_time: int = 10,
+                 max_threads: int = 2, max_concurrency: int = 2, time_budget: float = 0):
+        self.sample_rows = max(1, sample_rows)
+        self.top_k = max(0, top_k)
+        self.max_execution_time = max_execution_time
+        self.max_threads = max_threads
+        self._semaphore = threading.Semaphore(max(1, max_concurrency))
+        self.time_budget = time_budget
+        self._lock = threading.Lock()
+        self._deadline = None
+        self._profiled = 0
+        self._skipped = 0
+        self._failed = 0
+
+    def _aggregates(self, column: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """(profile key, aggregate expression) for one column; empty for unsupported types."""
+        base_type, nullable = _base_type(column.get('type') or '')
+        is_range = bool(_RANGE_TYPES.match(base_type))
+        is_discrete = bool(_DISCRETE_TYPES.match(base_type))
+        if not (is_range or is_discrete):
+            return []
+        name = _quote(column['name'])
+        aggregates = [('distinct', f"uniq({name})")]
+        if nullable:
+            aggregates.append(('nulls', f"countIf(isNull({name}))"))
+        if is_range or _INTEGER_TYPES.match(base_type):
+            aggregates.append(('min', f"toString(min({name}))"))
+            aggregates.append(('max', f"toString(max({name}))"))
+        if is_discrete and self.top_k:
+            aggregates.append(('top_values', f"arrayMap(x -> toString(x), topK({self.top_k})({name}))"))
+        return aggregates
+
+    def build_query(self, database: str, table: str, columns: List[Dict[str, Any]],
+                    sampling_key: str = None) -> Tuple[Optional[str], List[Tuple[str, List[str]]]]:
+        """The profiling query and, per profiled column, the profile keys of its result values."""
+        plan = []
+        expressions = ['count()']
+        for column in columns:
+            aggregates = self._aggregates(column)
+            if aggregates:
+                plan.append((column['name'], [key for key, _ in aggregates]))
+                expressions.extend(expression for _, expression in aggregates)
+        if not plan:
+            return None, plan
+
+        selected = ', '.join(_quote(name) for name, _ in plan)
+        source = f"{_quote(database)}.{_quote(table)}"
+        if sampling_key:
+            source = f"(SELECT {selected} FROM {source} SAMPLE {self.sample_rows})"
+        else:
+            source = f"(SELECT {selected} FROM {source} LIMIT {self.sample_rows})"
+        return f"SELECT {', '.join(expressions)} FROM {source}", plan
+
+    def settings(self) -> Dict[str, Any]:
+        """Per-query limits that keep profiling from loading the server."""
+        settings = {'max_threads': self.max_threads}
+        if self.max_execution_time:
+            settings['max_execution_time'] = self.max_execution_time
+            settings['timeout_overflow_mode'] = 'break'
+        return settings
+
+    def _budget_left(self) -> bool:
+        if not self.time_budget:
+            return True
+        with self._lock:
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.time_budget
+            return time.monotonic() < self._deadline
+
+    def profile_table(self, client, database: str, table: str, columns: List[Dict[str, Any]],
+                      sampling_key: str = None) -> Dict[str, Dict[str, Any]]:
+        """Profile a table's columns with one query; returns {column name: profile}.
+
+        Returns an empty mapping when the overall budget is spent or the
+        query fails, so profiling never fails an extraction.
+        """
+        if not self._budget_left():
+            with self._lock:
+                self._skipped += 1
+            return {}
+        sql_query, plan = self.build_query(database, table, columns, sampling_key)
+        if sql_query is None:
+            return {}
+
+        try:
+            with self._semaphore:
+                result = client.query(sql_query, settings=self.settings())
+            row = result.result_rows[0]
+        except Exception as e:
+            print(f"      Warning: profiling failed for {database}.{table}: {e}")
+            with self._lock:
+                self._failed += 1
+            return {}
+
+        sampled = row[0]
+        values = iter(row[1:])
+        profiles = {}
+        for name, keys in plan:
+            raw = dict(zip(keys, values))
+            profile = {'sampled_rows': sampled, 'distinct': raw['distinct']}
+            profile['null_fraction'] = round(raw['nulls'] / sampled, 4) if 'nulls' in raw and sampled else 0.0
+            if 'min' in raw:
+                profile['min'] = raw['min']
+                profile['max'] = raw['max']
+            if 'top_values' in raw:
+                profile['top_values'] = [value for value in raw['top_values'] if value is not None]
+            profiles[name] = profile
+        with self._lock:
+            self._profiled += 1
+        return profiles
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'profiled': self._profiled, 'skipped': self._skipped, 'failed': self._failed}
+
+
+def profile_hint(profile: Optional[Dict[str, Any]], max_values: int = 5) -> str:
+    """Short description of a column profile for LLM prompts, e.g. "~3 distinct; values: 'a', 'b'"."""
+    if not profile:
+        return ''
+    parts = [f"~{profile['distinct']} distinct"]
+    if profile.get('null_fraction'):
+        parts.append(f"{profile['null_fraction']:.0%} null")
+    if profile.get('min') is not None and profile.get('min') != profile.get('max'):
+        parts.append(f"range {profile['min']} .. {profile['max']}")
+    top_values = profile.get('top_values') or []
+    if top_values and profile['distinct'] <= 50:
+        parts.append("values: " + ", ".join(repr(value[:40]) for value in top_values[:max_values]))
+    return '; '.join(parts)
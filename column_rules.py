@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Column Rules
+
+Deterministic definitions for well-known columns (``id``, ``created_at``,
+``user_id``, ``is_deleted``, ...) from their name and type alone, so only
+ambiguous columns are sent to the LLM.
+
+A rule has a ``pattern`` matched against the whole column name (case
+insensitive), an optional ``types`` pattern matched against the column type
+with LowCardinality/Nullable unwrapped, and a ``definition`` template that
+can use ``{name}``, ``{table}``, ``{type}`` and any named group of the
+pattern (underscores become spaces)::
+
+    {"name": "foreign_key", "pattern": "(?P<entity>\\\\w+)_id", "types": "U?Int|UUID|String",
+     "definition": "Identifier of the related {entity}.",
+     "self_definition": "Unique identifier of each {entity} record."}
+
+The optional ``self_definition`` is used instead when the ``entity`` group
+names the table itself (``order_id`` in ``orders``).
+
+Rules are tried in order and the first match wins. A rule file (JSON, a list
+of rules or ``{"rules": [...], "replace_defaults": false}``) is tried before
+the built-in rules, or replaces them.
+
+All name patterns are compiled into one alternation, so a column name is
+matched with a single regex search, and results are cached per
+(name, type) since the same names repeat across tables.
+
+Run ``python3 column_rules.py clickhouse_metadata.json`` to see the share of
+a snapshot's columns the rules resolve.
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from snapshot_io import iter_snapshot_layout
+
+DEFAULT_RULES: List[Dict[str, str]] = [
+    {'name': 'primary_id', 'pattern': r'id', 'types': r'U?Int|UUID|String',
+     'definition': "Unique identifier of each record in {table}."},
+    {'name': 'uuid', 'pattern': r'uuid|guid', 'types': r'UUID|String|FixedString',
+     'definition': "Universally unique identifier of the record."},
+    {'name': 'created_at', 'pattern': r'created(_at|_on|_time|_date)?|creation_(time|date)|inserted_at|insert_time',
+     'types': r'Date', 'definition': "Timestamp when the record was created."},
+    {'name': 'updated_at', 'pattern': r'(updated|modified)(_at|_on|_time)?|last_(updated|modified)(_at)?',
+     'types': r'Date', 'definition': "Timestamp when the record was last updated."},
+    {'name': 'deleted_at', 'pattern': r'deleted(_at|_on|_time)?', 'types': r'Date',
+     'definition': "Timestamp when the record was deleted, if it was (soft delete)."},
+    {'name': 'is_deleted', 'pattern': r'is_deleted|deleted', 'types': r'U?Int8|Bool',
+     'definition': "Flag indicating whether the record has been deleted (soft delete)."},
+    {'name': 'flag_is', 'pattern': r'is_(?P<state>\w+)', 'types': r'U?Int8|Bool',
+     'definition': "Flag indicating whether the record is {state}."},
+    {'name': 'flag_has', 'pattern': r'has_(?P<thing>\w+)', 'types': r'U?Int8|Bool',
+     'definition': "Flag indicating whether the record has {thing}."},
+    {'name': 'foreign_key', 'pattern': r'(?P<entity>\w+)_(id|uuid)', 'types': r'U?Int|UUID|String|FixedString',
+     'definition': "Identifier of the related {entity}.",
+     'self_definition': "Unique identifier of each {entity} record."},
+    {'name': 'event_timestamp', 'pattern': r'ts|timestamp|event_time|event_ts|time', 'types': r'DateTime',
+     'definition': "Timestamp of the event recorded in this row."},
+    {'name': 'event_date', 'pattern': r'date|event_date|day', 'types': r'Date',
+     'definition': "Calendar date of the event recorded in this row."},
+    # Only past participles ("shipped_at", "paid_at"); other names such as response_time go to the LLM
+    {'name': 'action_at', 'pattern': r'(?P<action>\w*[^\We]ed|\w*(?:paid|sent|sold|seen|taken|given|written|'
+                                     r'won|lost|made|built|done|begun|spent))_(at|time|timestamp)',
+     'types': r'DateTime',
+     'definition': "Timestamp when the record was {action}."},
+    {'name': 'date_of', 'pattern': r'(?P<subject>\w+?)_(date|day)', 'types': r'Date',
+     'definition': "Date of the {subject}."},
+    # Only plural names ("orders_count", "num_users"); item_count or status_count go to the LLM
+    {'name': 'count', 'pattern': r'(?P<things>\w*[^\Wsui]s)_(count|cnt)|(num|number_of|n)_(?P<things2>\w*[^\Wsui]s)',
+     'types': r'U?Int', 'definition': "Number of {things}{things2}."},
+    {'name': 'email', 'pattern': r'e?mail|email_address', 'types': r'String',
+     'definition': "Email address."},
+    {'name': 'entity_email', 'pattern': r'(?P<entity>\w+?)_email(_address)?', 'types': r'String',
+     'definition': "Email address of the {entity}."},
+    {'name': 'phone', 'pattern': r'(?P<entity>\w+?_)?phone(_number)?', 'types': r'String',
+     'definition': "Phone number{entity_of}."},
+    {'name': 'ip_address', 'pattern': r'(?P<entity>\w+?_)?ip(_address|_addr)?', 'types': r'IPv[46]|String',
+     'definition': "IP address{entity_of}."},
+    {'name': 'user_agent', 'pattern': r'user_agent|ua', 'types': r'String',
+     'definition': "User agent string of the client that made the request."},
+    {'name': 'url', 'pattern': r'(?P<entity>\w+?_)?url', 'types': r'String',
+     'definition': "URL{entity_of}."},
+    {'name': 'country', 'pattern': r'country(_code|_iso)?', 'types': r'String|FixedString|Enum',
+     'definition': "Country associated with the record."},
+    {'name': 'currency', 'pattern': r'currency(_code)?', 'types': r'String|FixedString|Enum',
+     'definition': "Currency code of the monetary amounts in the record."},
+    {'name': 'latitude', 'pattern': r'lat|latitude', 'types': r'Float|Decimal',
+     'definition': "Latitude of the location in decimal degrees."},
+    {'name': 'longitude', 'pattern': r'lon|lng|longitude', 'types': r'Float|Decimal',
+     'definition': "Longitude of the location in decimal degrees."},
+    {'name': 'collapsing_sign', 'pattern': r'sign', 'types': r'Int8',
+     'definition': "Row sign for CollapsingMergeTree: 1 for a state row, -1 for a row that cancels it."},
+    {'name': 'row_version', 'pattern': r'version|ver|_version', 'types': r'U?Int|DateTime',
+     'definition': "Row version; the highest version of a key is kept when rows are deduplicated."},
+]
+
+_GROUP_NAME = re.compile(r'\(\?P<(\w+)>')
+_GROUP_REFERENCE = re.compile(r'\(\?P=(\w+)\)')
+
+
+def _base_type(column_type: str) -> str:
+    while True:
+        match = re.match(r'^(?:LowCardinality|Nullable)\((.*)\)$', column_type)
+        if not match:
+            return column_type
+        column_type = match.group(1)
+
+
+def _plural_forms(entity: str) -> Tuple[str, ...]:
+    """Table names that hold ``entity`` records: category -> category, categorys, categories."""
+    forms = (entity, f"{entity}s", f"{entity}es")
+    if entity.endswith('y') and entity[-2:-1] not in ('a', 'e', 'o', 'u'):
+        forms += (f"{entity[:-1]}ies",)
+    return forms
+
+
+class _Fields(dict):
+    """Template fields; unknown placeholders render as empty strings."""
+
+    def __missing__(self, key: str) -> str:
+        return ''
+
+
+def load_rules(path: str) -> List[Dict[str, str]]:
+    """Rules from a rule file, followed by the built-in rules unless it replaces them."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return data + DEFAULT_RULES
+    rules = data.get('rules', [])
+    return rules if data.get('replace_defaults') else rules + DEFAULT_RULES
+
+
+class ColumnRuleEngine:
+    """Compiled matcher that resolves column definitions from name and type."""
+
+    def __init__(self, rules: List[Dict[str, str]] = None):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        alternatives = []
+        self._types = []
+        for index, rule in enumerate(self.rules):
+            if 'pattern' not in rule or 'definition' not in rule:
+                raise ValueError(f"Rule {rule.get('name', index)} needs a pattern and a definition")
+            # Group names must be unique across the alternation
+            pattern = _GROUP_NAME.sub(lambda m: f"(?P<{m.group(1)}__{index}>", rule['pattern'])
+            pattern = _GROUP_REFERENCE.sub(lambda m: f"(?P={m.group(1)}__{index})", pattern)
+            alternatives.append(f"(?P<rule__{index}>{pattern})")
+            self._types.append(re.compile(f"^(?:{rule['types']})", re.IGNORECASE) if rule.get('types') else None)
+        self._pattern = re.compile(f"^(?:{'|'.join(alternatives)})$", re.IGNORECASE)
+        self._single = [re.compile(f"^(?:{rule['pattern']})$", re.IGNORECASE) for rule in self.rules]
+
+        self._cache: Dict[Tuple[str, str], Optional[Tuple[int, Dict[str, str]]]] = {}
+        self._lock = threading.Lock()
+        self.columns_seen = 0
+        self.columns_resolved = 0
+        self.rule_hits: Counter = Counter()
+
+    @classmethod
+    def from_file(cls, path: str = None) -> 'ColumnRuleEngine':
+        """Engine for a rule file, or the built-in rules without one."""
+        return cls(load_rules(path) if path else None)
+
+    def _match(self, name: str, base_type: str) -> Optional[Tuple[int, Dict[str, str]]]:
+        match = self._pattern.match(name)
+        if match is None:
+            return None
+        index = int(match.lastgroup.split('__')[1])
+        if self._types[index] is None or self._types[index].match(base_type):
+            suffix = f"__{index}"
+            return index, {key[:-len(suffix)]: value for key, value in match.groupdict().items()
+                           if key.endswith(suffix) and value}
+        # The first rule matching the name rejected the type; try the later ones
+        for later in range(index + 1, len(self.rules)):
+            match = self._single[later].match(name)
+            if match and (self._types[later] is None or self._types[later].match(base_type)):
+                return later, {key: value for key, value in match.groupdict().items() if value}
+        return None
+
+    def match(self, name: str, column_type: str) -> Optional[Tuple[int, Dict[str, str]]]:
+        """(rule index, named groups) of the first rule for this column, or None."""
+        key = (name, column_type)
+        if key not in self._cache:
+            self._cache[key] = self._match(name, _base_type(column_type))
+        return self._cache[key]
+
+    def define(self, column: Dict[str, Any], table: str = '') -> Optional[str]:
+        """Definition for one column, or None when no rule applies."""
+        found = self.match(column['name'], column.get('type') or '')
+        with self._lock:
+            self.columns_seen += 1
+            if found is not None:
+                self.columns_resolved += 1
+                self.rule_hits[self.rules[found[0]].get('name', str(found[0]))] += 1
+        if found is None:
+            return None
+        index, groups = found
+        fields = _Fields({key: value.strip('_').replace('_', ' ') for key, value in groups.items()})
+        for key in list(fields):
+            fields[f"{key}_of"] = f" of the {fields[key]}"
+        fields.update(name=column['name'], table=table, type=column.get('type') or '')
+        rule = self.rules[index]
+        entity = groups.get('entity', '').strip('_').lower()
+        if rule.get('self_definition') and entity and table.lower() in _plural_forms(entity):
+            return rule['self_definition'].format_map(fields)
+        return rule['definition'].format_map(fields)
+
+    def apply(self, columns: List[Dict[str, Any]], table: str = '') -> List[Dict[str, Any]]:
+        """Set ``ai_definition`` on the columns a rule resolves; returns the unresolved ones."""
+        unresolved = []
+        for column in columns:
+            definition = self.define(column, table)
+            if definition:
+                column['ai_definition'] = definition
+            else:
+                unresolved.append(column)
+        return unresolved
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            share = self.columns_resolved / self.columns_seen if self.columns_seen else 0.0
+            return {
+                'columns': self.columns_seen,
+                'resolved': self.columns_resolved,
+                'share': share,
+                'top_rules': self.rule_hits.most_common(5)
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the share of snapshot columns resolved by column rules')
+    parser.add_argument('snapshot', nargs='?', default='clickhouse_metadata.json', help='Snapshot (JSON or binary)')
+    parser.add_argument('--rules', help='Rule file (JSON) tried before the built-in rules')
+    parser.add_argument('--show', type=int, default=0, help='Print this many example resolved columns')
+    args = parser.parse_args()
+
+    try:
+        engine = ColumnRuleEngine.from_file(args.rules)
+        examples = []
+        for kind, database, schema, table, table_info in iter_snapshot_layout(args.snapshot):
+            if kind != 'table':
+                continue
+            for column in table_info.get('columns', []):
+                definition = engine.define(column, table)
+                if definition and len(examples) < args.show:
+                    examples.append(f"{database}.{table}.{column['name']} ({column.get('type')}): {definition}")
+    except Exception as e:
+        print(f"❌ Rule report failed: {e}")
+        return False
+
+    stats = engine.stats()
+    print(f"📋 {stats['resolved']} of {stats['columns']} columns ({stats['share']:.0%}) resolved by rules")
+    for rule, hits in stats['top_rules']:
+        print(f"  {rule}: {hits}")
+    for example in examples:
+        print(f"  {example}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Definition Cache
+
+Persistent, content-addressed cache for AI-generated column definitions.
+
+Entries are keyed by a hash of (database, table, column, type, model name,
+prompt version) and stored in a small SQLite file, so re-running an
+extraction only asks the LLM about columns it has never seen before. The
+cache is bounded by entry count and evicts the least recently used entries.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Tuple
+
+
+class DefinitionCache:
+    """SQLite-backed LRU cache for AI column definitions."""
+
+    # SQLite limits the number of bound parameters per statement
+    _LOOKUP_CHUNK = 500
+
+    def __init__(self, path: str = '.definition_cache.sqlite', max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS definitions (
+                key TEXT PRIMARY KEY,
+                definition TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_definitions_last_used ON definitions(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(database: str, table: str, column: str, column_type: str,
+                 model_name: str, prompt_version: str) -> str:
+        """Build the content hash identifying one column definition."""
+        payload = "\x1f".join(str(part) for part in (database, table, column, column_type, model_name, prompt_version))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Look up several keys at once, refreshing the recency of hits."""
+        found = {}
+        if not keys:
+            return found
+        with self._lock:
+            for i in range(0, len(keys), self._LOOKUP_CHUNK):
+                chunk = keys[i:i + self._LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, definition FROM definitions WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE definitions SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def get(self, key: str) -> str:
+        """Look up a single key; returns None on a miss."""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: List[Tuple[str, str]]):
+        """Store (key, definition) pairs and evict the least recently used overflow."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO definitions (key, definition, last_used) VALUES (?, ?, ?)",
+                [(key, definition, now) for key, definition in items]
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM definitions").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM definitions WHERE key IN "
+                    "(SELECT key FROM definitions ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def put(self, key: str, definition: str):
+        """Store a single definition."""
+        self.put_many([(key, definition)])
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters for this process."""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        """Close the underlying SQLite connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Extraction Jobs
+
+Background runner for metadata extractions with durable, resumable
+checkpoints.
+
+- Every job has a row in a small SQLite job store with its status, progress
+  counters and error.
+- Each table is checkpointed as soon as it has been described and analyzed,
+  AI definitions included, so a job that crashed, timed out or was cancelled
+  resumes with only the tables that are still missing.
+- The checkpoints of a completed job are its result: finishing writes the
+  final tables into them and records only the table layout on the job row,
+  and the metadata is assembled from both when it is read. Only the most
+  recent completed jobs are kept (``EXTRACTION_JOB_KEEP``).
+- Jobs run on daemon threads owned by a process-wide runner instead of a
+  Streamlit script run, so refreshing the browser does not stop them; the
+  page re-attaches by polling the runner.
+
+Credentials are never written to the job store; resuming a job takes a
+config again.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from clickhouse_metadata_extractor import (
+    ClickHouseMetadataExtractor,
+    ExtractionCancelled,
+    ExtractorConfig,
+    ProgressEvent,
+)
+
+
+# Jobs in these states can be picked up again with resume()
+RESUMABLE_STATUSES = ('interrupted', 'failed', 'cancelled')
+
+
+def metadata_layout(metadata: Dict[str, Any]) -> Dict[str, Dict[str, List[str]]]:
+    """Ordered database -> schema -> table names of a metadata tree."""
+    return {
+        database: {
+            schema: list(schema_info.get('tables', {}))
+            for schema, schema_info in db_info.get('schemas', {}).items()
+        }
+        for database, db_info in metadata.get('databases', {}).items()
+    }
+
+
+class JobStore:
+    """SQLite-backed store for extraction jobs and their table checkpoints."""
+
+    def __init__(self, path: str = '.extraction_jobs.sqlite', keep_completed: int = 10):
+        self.path = path
+        # Completed jobs beyond the most recent ones are deleted when a job completes
+        self.keep_completed = keep_completed
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                description TEXT NOT NULL,
+                status TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                tables_done INTEGER NOT NULL DEFAULT 0,
+                tables_total INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                job_id TEXT NOT NULL,
+                database_name TEXT NOT NULL,
+                schema_name TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                table_info TEXT NOT NULL,
+                PRIMARY KEY (job_id, database_name, schema_name, table_name)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _process_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        return True
+
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        keys = ('job_id', 'description', 'status', 'pid', 'tables_done', 'tables_total',
+                'error', 'created_at', 'updated_at')
+        job = dict(zip(keys, row))
+        # A job left 'running' by a process that no longer exists was interrupted
+        if job['status'] == 'running' and job['pid'] != os.getpid() and not self._process_alive(job['pid']):
+            job['status'] = 'interrupted'
+        return job
+
+    def start_job(self, job_id: str, description: str):
+        """Create a job, or mark an existing one as running again.
+
+        An unfinished job keeps its checkpoints so it resumes; rerunning a
+        completed job starts over, since its checkpoints hold its result.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM checkpoints WHERE job_id IN "
+                "(SELECT job_id FROM jobs WHERE job_id = ? AND status = 'completed')", (job_id,)
+            )
+            self._conn.execute(
+                """
+                INSERT INTO jobs (job_id, description, status, pid, created_at, updated_at)
+                VALUES (?, ?, 'running', ?, ?, ?)
+                ON CONFLICT(job_id) DO UPDATE SET
+                    description = excluded.description, status = 'running', pid = excluded.pid,
+                    error = NULL, result = NULL, updated_at = excluded.updated_at
+                """,
+                (job_id, description, os.getpid(), now, now)
+            )
+            self._conn.commit()
+
+    def update_progress(self, job_id: str, tables_done: int, tables_total: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET tables_done = ?, tables_total = ?, updated_at = ? WHERE job_id = ?",
+                (tables_done, tables_total, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def finish_job(self, job_id: str, status: str, error: str = None, metadata: Dict[str, Any] = None):
+        """Record the final status; a completed job's metadata is stored as its checkpoints.
+
+        Tables the extraction did not checkpoint (e.g. unchanged tables of an
+        incremental refresh) and fields added after checkpointing (statistics)
+        are written to the checkpoints, and the job row keeps only the table
+        layout to assemble them in order.
+        """
+        layout = None
+        rows = []
+        if metadata is not None:
+            layout = json.dumps(metadata_layout(metadata), ensure_ascii=False)
+            rows = [
+                (job_id, database, schema, table, json.dumps(table_info, ensure_ascii=False))
+                for database, db_info in metadata.get('databases', {}).items()
+                for schema, schema_info in db_info.get('schemas', {}).items()
+                for table, table_info in schema_info.get('tables', {}).items()
+            ]
+        with self._lock:
+            if rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO checkpoints (job_id, database_name, schema_name, table_name, table_info) "
+                    "VALUES (?, ?, ?, ?, ?)", rows
+                )
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, result = ?, updated_at = ? WHERE job_id = ?",
+                (status, error, layout, time.time(), job_id)
+            )
+            self._conn.commit()
+        if status == 'completed':
+            self.prune_jobs(self.keep_completed)
+
+    def prune_jobs(self, keep_completed: int):
+        """Delete completed jobs, and their checkpoints, beyond the ``keep_completed`` most recent."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'completed' ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+                (max(0, keep_completed),)
+            ).fetchall()
+            for (job_id,) in rows:
+                self._conn.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+        if rows:
+            print(f"🧹 Pruned {len(rows)} old completed extraction jobs")
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, description, status, pid, tables_done, tables_total, error, created_at, updated_at "
+                "FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Return the most recent jobs, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, description, status, pid, tables_done, tables_total, error, created_at, updated_at "
+                "FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def get_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the metadata of a completed job, assembled from its layout and checkpoints."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM jobs WHERE job_id = ? AND status = 'completed'", (job_id,)
+            ).fetchone()
+        if not row or not row[0]:
+            return None
+        layout = json.loads(row[0])
+        if 'databases' in layout:
+            # Job stores written before results were kept as checkpoints hold the full metadata
+            return layout
+        tables = self.load_tables(job_id)
+        return {
+            'databases': {
+                database: {
+                    'schemas': {
+                        schema: {'tables': {table: tables.get((database, schema, table)) for table in table_names}}
+                        for schema, table_names in schemas.items()
+                    }
+                }
+                for database, schemas in layout.items()
+            }
+        }
+
+    def save_table(self, job_id: str, database: str, schema: str, table: str, table_info: Dict[str, Any]):
+        """Checkpoint one completed table."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, database_name, schema_name, table_name, table_info) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, database, schema, table, json.dumps(table_info, ensure_ascii=False))
+            )
+            self._conn.commit()
+
+    def load_tables(self, job_id: str) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+        """Return the checkpointed tables of a job."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT database_name, schema_name, table_name, table_info FROM checkpoints WHERE job_id = ?",
+                (job_id,)
+            ).fetchall()
+        return {(database, schema, table): json.loads(info) for database, schema, table, info in rows}
+
+    def delete_job(self, job_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def close(self):
+        """Close the underlying SQLite connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class JobCheckpoint:
+    """Checkpoint interface handed to ClickHouseMetadataExtractor for one job."""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+
+    def load(self) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+        return self.store.load_tables(self.job_id)
+
+    def save(self, database: str, schema: str, table: str, table_info: Dict[str, Any]):
+        self.store.save_table(self.job_id, database, schema, table, table_info)
+
+    def record_progress(self, event: ProgressEvent):
+        """Progress callback that keeps the job's table counters up to date."""
+        if event.kind in ('started', 'table_done'):
+            self.store.update_progress(self.job_id, event.tables_done, event.tables_total)
+
+
+class ExtractionJobRunner:
+    """Runs checkpointed extraction jobs on background threads."""
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self._threads: Dict[str, threading.Thread] = {}
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self._progress: Dict[str, ProgressEvent] = {}
+
+    @staticmethod
+    def describe(config: ExtractorConfig) -> str:
+        """Human-readable, credential-free summary of what a job extracts."""
+        scope = ", ".join(config.targeted_schemas) or "all databases"
+        return f"{config.host}:{config.port} ({scope})"
+
+    def run(self, config: ExtractorConfig, job_id: str = None,
+            previous: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Run a job in the calling thread and return its metadata.
+
+        An existing job id resumes from that job's checkpoints.
+        """
+        job_id = job_id or uuid.uuid4().hex[:12]
+        with self._lock:
+            cancel_event = self._cancel_events.setdefault(job_id, threading.Event())
+        self.store.start_job(job_id, self.describe(config))
+        checkpoint = JobCheckpoint(self.store, job_id)
+
+        def on_progress(event: ProgressEvent):
+            self._progress[job_id] = event
+            checkpoint.record_progress(event)
+
+        try:
+            metadata = ClickHouseMetadataExtractor.extract(
+                config, previous,
+                progress_callback=on_progress,
+                cancel_event=cancel_event,
+                checkpoint=checkpoint
+            )
+        except ExtractionCancelled:
+            self.store.finish_job(job_id, 'cancelled')
+            raise
+        except Exception as e:
+            self.store.finish_job(job_id, 'failed', error=str(e))
+            raise
+        else:
+            self.store.finish_job(job_id, 'completed', metadata=metadata)
+            return metadata
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+
+    def submit(self, config: ExtractorConfig, job_id: str = None, previous: Dict[str, Any] = None) -> str:
+        """Start a job on a background thread and return its id."""
+        job_id = job_id or uuid.uuid4().hex[:12]
+        with self._lock:
+            if self.is_running(job_id):
+                raise ValueError(f"Job {job_id} is already running")
+            self._cancel_events[job_id] = threading.Event()
+            self._progress.pop(job_id, None)
+
+        def run_job():
+            try:
+                self.run(config, job_id, previous)
+            except Exception as e:
+                print(f"❌ Extraction job {job_id} stopped: {e}")
+
+        thread = threading.Thread(target=run_job, name=f'extraction-{job_id}', daemon=True)
+        with self._lock:
+            self._threads[job_id] = thread
+        thread.start()
+        return job_id
+
+    def resume(self, job_id: str, config: ExtractorConfig, previous: Dict[str, Any] = None) -> str:
+        """Restart an interrupted, failed or cancelled job from its checkpoints."""
+        job = self.store.get_job(job_id)
+        if job is None:
+            raise ValueError(f"Unknown job {job_id}")
+        if job['status'] not in RESUMABLE_STATUSES:
+            raise ValueError(f"Job {job_id} is {job['status']} and cannot be resumed")
+        return self.submit(config, job_id, previous)
+
+    def cancel(self, job_id: str):
+        """Ask a running job to stop before its next table."""
+        with self._lock:
+            cancel_event = self._cancel_events.get(job_id)
+        if cancel_event is not None:
+            cancel_event.set()
+
+    def is_running(self, job_id: str) -> bool:
+        thread = self._threads.get(job_id)
+        return thread is not None and thread.is_alive()
+
+    def running_jobs(self) -> List[str]:
+        """Ids of jobs running on threads of this process."""
+        with self._lock:
+            return [job_id for job_id, thread in self._threads.items() if thread.is_alive()]
+
+    def progress(self, job_id: str) -> Optional[ProgressEvent]:
+        """Latest progress event of a job run by this process."""
+        return self._progress.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get_job(job_id)
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.store.list_jobs(limit)
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get_result(job_id)
+
+
+_default_runner = None
+_default_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> ExtractionJobRunner:
+    """Return the process-wide job runner, creating it on first use."""
+    global _default_runner
+    with _default_runner_lock:
+        if _default_runner is None:
+            _default_runner = ExtractionJobRunner(JobStore(
+                os.getenv('EXTRACTION_JOB_STORE', '.extraction_jobs.sqlite'),
+                keep_completed=int(os.getenv('EXTRACTION_JOB_KEEP', '10'))
+            ))
+        return _default_runner
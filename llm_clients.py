@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+LLM Clients
+
+Process-wide registry of Gemini model handles keyed by API key and model
+name, shared by the chat interface (across reruns and sessions) and the
+metadata extractor, so a question costs only the model call.
+
+``genai.configure`` sets the API key for the whole process. The registry
+calls it only when a handle is created for a key other than the active one,
+and pins each handle to the client created for its key, so handles for
+different keys can be used side by side.
+
+``warm_up`` creates a handle ahead of the first question and can send a
+token-count request in the background to open the connection.
+"""
+
+import hashlib
+import threading
+from typing import Any, Dict, Tuple
+
+import google.generativeai as genai
+
+
+class LLMClientRegistry:
+    """Lazily created, shared Gemini model handles."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._active_key = None
+        self._warmed = set()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(api_key: str, model_name: str) -> Tuple[str, str]:
+        # Keyed by a hash so the registry does not hold API keys
+        return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16], model_name
+
+    @staticmethod
+    def _pin_client(model):
+        """Bind the model to the client of the key configured now.
+
+        Otherwise the model picks the default client lazily at its first
+        request, which may belong to a key configured later.
+        """
+        if not hasattr(model, '_client'):
+            return
+        try:
+            from google.generativeai import client as genai_client
+            model._client = genai_client.get_default_generative_client()
+        except Exception as e:
+            print(f"Warning: could not pin Gemini client: {e}")
+
+    def get_model(self, api_key: str, model_name: str):
+        """The shared handle for an API key and model, created on first use."""
+        if not api_key:
+            raise ValueError("Gemini API key not configured (GEMINI_API_KEY)")
+        key = self._key(api_key, model_name)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self.reused += 1
+                return model
+            if self._active_key != key[0]:
+                genai.configure(api_key=api_key)
+                self._active_key = key[0]
+            model = genai.GenerativeModel(model_name)
+            self._pin_client(model)
+            self._models[key] = model
+            self.created += 1
+            return model
+
+    def warm_up(self, api_key: str, model_name: str, ping: bool = True):
+        """Create the handle now and, with ``ping``, open its connection in the background (once per handle)."""
+        key = self._key(api_key, model_name)
+        with self._lock:
+            if key in self._warmed:
+                return
+            self._warmed.add(key)
+        model = self.get_model(api_key, model_name)
+        if ping and hasattr(model, 'count_tokens'):
+            def send_ping():
+                try:
+                    model.count_tokens("warm-up")
+                except Exception as e:
+                    print(f"Warning: Gemini warm-up request failed: {e}")
+            threading.Thread(target=send_ping, name='gemini-warm-up', daemon=True).start()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'models': len(self._models), 'created': self.created, 'reused': self.reused}
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_llm_registry() -> LLMClientRegistry:
+    """Return the process-wide registry, creating it on first use."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = LLMClientRegistry()
+        return _default_registry
+
+
+def get_model(api_key: str, model_name: str):
+    """Shared Gemini model handle for an API key and model."""
+    return get_llm_registry().get_model(api_key, model_name)
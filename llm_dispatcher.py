@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+LLM Dispatcher
+
+Runs Gemini requests concurrently while staying inside the account quota.
+
+Requests are admitted by two token buckets, one for requests per minute and
+one for (estimated) tokens per minute, and executed on a bounded thread
+pool. Each bucket holds a few seconds' worth of its rate (``burst_seconds``),
+so a burst at startup stays well below a minute's quota. Quota errors (HTTP 429 / ResourceExhausted) pause all callers for the
+server-suggested delay, retry with exponential backoff, and temporarily
+lower the admitted rate, which then recovers gradually on success.
+"""
+
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a per-minute rate.
+
+    The capacity (the largest burst) defaults to a tenth of the rate, at
+    least one token.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate_per_minute = float(rate_per_minute)
+        self.capacity = max(1.0, float(capacity if capacity is not None else self.rate_per_minute / 10))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_minute / 60.0)
+        self._updated = now
+
+    def set_rate(self, rate_per_minute: float):
+        """Change the refill rate without losing the current fill level."""
+        with self._lock:
+            self._refill()
+            self.rate_per_minute = float(rate_per_minute)
+
+    def acquire(self, amount: float = 1.0):
+        """Block until ``amount`` tokens are available and take them.
+
+        Requests larger than the bucket capacity are admitted once the bucket
+        is full and leave it in debt, so later requests wait for the excess.
+        """
+        amount = float(amount)
+        needed = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return
+                wait = (needed - self._tokens) * 60.0 / max(self.rate_per_minute, 1e-6)
+            time.sleep(min(wait, 1.0))
+
+
+class LLMDispatcher:
+    """Rate-limited, concurrent front end for ``GenerativeModel.generate_content``."""
+
+    # Lowest fraction of the configured rate the adaptive limiter backs off to
+    MIN_RATE_FRACTION = 0.1
+
+    def __init__(self, model, requests_per_minute: int = 60, tokens_per_minute: int = 1000000,
+                 max_concurrency: int = 8, max_retries: int = 5, burst_seconds: float = 6):
+        self.model = model
+        self.requests_per_minute = requests_per_minute
+        # Each bucket holds burst_seconds of its rate (a tenth of a minute by default)
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute * burst_seconds / 60.0)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute * burst_seconds / 60.0)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.calls = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self._rate_fraction = 1.0
+        self._pause_until = 0.0
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='llm')
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token estimate (about four characters per token)."""
+        return len(text) // 4 + 1
+
+    @staticmethod
+    def _is_quota_error(error: Exception) -> bool:
+        text = f"{type(error).__name__} {error}".lower()
+        return any(marker in text for marker in ('429', 'resourceexhausted', 'resource exhausted', 'quota', 'rate limit'))
+
+    @staticmethod
+    def _suggested_delay(error: Exception) -> float:
+        """Extract the server-suggested retry delay from a quota error, if any."""
+        match = re.search(r'retry(?:_delay)?[^0-9]{0,20}(\d+(?:\.\d+)?)\s*s', str(error), re.IGNORECASE)
+        return float(match.group(1)) if match else 0.0
+
+    def _on_throttled(self, delay: float):
+        """Pause all callers and multiplicatively lower the admitted rate."""
+        with self._lock:
+            self.throttled += 1
+            self._pause_until = max(self._pause_until, time.monotonic() + delay)
+            self._rate_fraction = max(self.MIN_RATE_FRACTION, self._rate_fraction * 0.7)
+            self.request_bucket.set_rate(self.requests_per_minute * self._rate_fraction)
+
+    def _on_success(self):
+        """Additively restore the admitted rate towards the configured ceiling."""
+        with self._lock:
+            self.calls += 1
+            if self._rate_fraction < 1.0:
+                self._rate_fraction = min(1.0, self._rate_fraction + 0.05)
+                self.request_bucket.set_rate(self.requests_per_minute * self._rate_fraction)
+
+    def _track_in_flight(self, delta: int):
+        with self._lock:
+            self.in_flight += delta
+
+    def _wait_for_pause(self):
+        while True:
+            with self._lock:
+                wait = self._pause_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 1.0))
+
+    def generate(self, prompt: str, expected_output_tokens: int = 0):
+        """Send one prompt, blocking until it is admitted by the rate limits.
+
+        Quota errors are retried with backoff up to ``max_retries`` times;
+        any other error, or running out of retries, is raised to the caller.
+        """
+        tokens = self.estimate_tokens(prompt) + expected_output_tokens
+        attempt = 0
+        while True:
+            self._wait_for_pause()
+            self.request_bucket.acquire()
+            self.token_bucket.acquire(tokens)
+            try:
+                with self._in_flight:
+                    self._track_in_flight(1)
+                    try:
+                        response = self.model.generate_content(prompt)
+                    finally:
+                        self._track_in_flight(-1)
+            except Exception as e:
+                if not self._is_quota_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = max(self._suggested_delay(e), min(60.0, 2 ** attempt)) + random.uniform(0, 1)
+                print(f"        Gemini quota reached, backing off {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                self._on_throttled(delay)
+                attempt += 1
+                continue
+            self._on_success()
+            return response
+
+    def map(self, fn: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        """Run ``fn`` over ``items`` on the shared pool, returning results in input order."""
+        futures = [self._executor.submit(fn, item) for item in items]
+        return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        """Return request counters for this process."""
+        with self._lock:
+            return {'calls': self.calls, 'throttled': self.throttled, 'in_flight': self.in_flight}
+
+    def close(self):
+        """Shut down the worker pool."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Metadata Store
+
+SQLite-backed store for extracted ClickHouse metadata, used by the Streamlit
+app instead of holding the whole ``clickhouse_metadata.json`` snapshot in
+session state.
+
+- Databases, schemas, tables and columns live in their own tables, indexed
+  by name, so a table is read with a point lookup and an edited definition
+  is saved with a point update.
+- Whole snapshots are imported in one transaction after an extraction and
+  can be exported back to the JSON layout written by the extractor.
+- A revision counter changes on every write so derived structures (such as
+  the schema retrieval index) know when to rebuild.
+
+Run ``python3 metadata_store.py import|export [file.json]`` to convert
+between the JSON snapshot and the store.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from snapshot_io import LayoutEvent, SnapshotWriter, iter_metadata, iter_snapshot_layout
+
+# Column attributes stored in their own SQLite columns, in snapshot key order
+COLUMN_FIELDS = ('name', 'type', 'default_type', 'default_expression', 'comment',
+                 'codec_expression', 'ttl_expression', 'ai_definition')
+
+# Key of the extra blob listing the COLUMN_FIELDS a column did not have, so a None
+# value and a missing key both survive the round trip
+_ABSENT_KEY = '_absent_fields'
+
+# Table attributes stored in their own SQLite columns (column_count is derived)
+TABLE_FIELDS = ('uuid', 'metadata_modification_time')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS store_info (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS databases (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS schemas (
+    id INTEGER PRIMARY KEY,
+    database_id INTEGER NOT NULL REFERENCES databases(id),
+    name TEXT NOT NULL,
+    UNIQUE (database_id, name)
+);
+CREATE TABLE IF NOT EXISTS tables (
+    id INTEGER PRIMARY KEY,
+    schema_id INTEGER NOT NULL REFERENCES schemas(id),
+    name TEXT NOT NULL,
+    uuid TEXT,
+    metadata_modification_time TEXT,
+    extra TEXT,
+    UNIQUE (schema_id, name)
+);
+CREATE TABLE IF NOT EXISTS columns (
+    id INTEGER PRIMARY KEY,
+    table_id INTEGER NOT NULL REFERENCES tables(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT,
+    default_type TEXT,
+    default_expression TEXT,
+    comment TEXT,
+    codec_expression TEXT,
+    ttl_expression TEXT,
+    ai_definition TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tables_name ON tables(name);
+CREATE INDEX IF NOT EXISTS idx_columns_table ON columns(table_id, position);
+CREATE INDEX IF NOT EXISTS idx_columns_name ON columns(name);
+"""
+
+
+class MetadataStore:
+    """Indexed SQLite store for one metadata snapshot."""
+
+    def __init__(self, path: str = 'clickhouse_metadata.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("INSERT OR IGNORE INTO store_info (key, value) VALUES ('revision', 0)")
+        self._conn.commit()
+
+    # Writes
+
+    def _bump_revision(self):
+        self._conn.execute("UPDATE store_info SET value = value + 1 WHERE key = 'revision'")
+
+    @staticmethod
+    def _column_row(column: Dict[str, Any]) -> Tuple:
+        """Split a snapshot column into its stored fields and a JSON blob of the rest."""
+        extra = {key: value for key, value in column.items() if key not in COLUMN_FIELDS}
+        absent = [key for key in COLUMN_FIELDS if key not in column]
+        if absent:
+            extra[_ABSENT_KEY] = absent
+        return tuple(column.get(key) for key in COLUMN_FIELDS) + (json.dumps(extra) if extra else None,)
+
+    @staticmethod
+    def _mark_present(extra: Optional[str], keys: Iterable[str]) -> Optional[str]:
+        """The extra blob with ``keys`` no longer listed as absent, after they were set."""
+        if not extra:
+            return extra
+        data = json.loads(extra)
+        absent = [key for key in data.get(_ABSENT_KEY, ()) if key not in keys]
+        if absent:
+            data[_ABSENT_KEY] = absent
+        else:
+            data.pop(_ABSENT_KEY, None)
+        return json.dumps(data) if data else None
+
+    def _insert_table(self, schema_id: int, table: str, table_info: Dict[str, Any]):
+        extra = {key: value for key, value in table_info.items()
+                 if key not in TABLE_FIELDS and key not in ('columns', 'column_count')}
+        cursor = self._conn.execute(
+            "INSERT INTO tables (schema_id, name, uuid, metadata_modification_time, extra) VALUES (?, ?, ?, ?, ?)",
+            (schema_id, table, table_info.get('uuid'), table_info.get('metadata_modification_time'),
+             json.dumps(extra) if extra else None)
+        )
+        self._conn.executemany(
+            f"INSERT INTO columns (table_id, position, {', '.join(COLUMN_FIELDS)}, extra) "
+            f"VALUES (?, ?, {', '.join('?' * len(COLUMN_FIELDS))}, ?)",
+            [(cursor.lastrowid, position) + self._column_row(column)
+             for position, column in enumerate(table_info.get('columns', []))]
+        )
+
+    def replace_metadata(self, metadata: Dict[str, Any]):
+        """Replace the stored snapshot with ``metadata`` in a single transaction."""
+        self.replace_layout(iter_metadata(metadata))
+
+    def replace_layout(self, events: Iterable[LayoutEvent]):
+        """Replace the stored snapshot from snapshot layout events in a single transaction.
+
+        Events are consumed one at a time, so a snapshot streamed from
+        SnapshotReader is never fully held in memory.
+        """
+        with self._lock:
+            try:
+                for name in ('columns', 'tables', 'schemas', 'databases'):
+                    self._conn.execute(f"DELETE FROM {name}")
+                database_ids, schema_ids = {}, {}
+                for kind, database, schema, table, table_info in events:
+                    if kind == 'database':
+                        database_ids[database] = self._conn.execute(
+                            "INSERT INTO databases (name) VALUES (?)", (database,)
+                        ).lastrowid
+                    elif kind == 'schema':
+                        schema_ids[(database, schema)] = self._conn.execute(
+                            "INSERT INTO schemas (database_id, name) VALUES (?, ?)", (database_ids[database], schema)
+                        ).lastrowid
+                    else:
+                        self._insert_table(schema_ids[(database, schema)], table, table_info)
+                self._bump_revision()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _table_id(self, database: str, schema: str, table: str) -> Optional[int]:
+        row = self._conn.execute(
+            """
+            SELECT t.id FROM tables t
+            JOIN schemas s ON s.id = t.schema_id
+            JOIN databases d ON d.id = s.database_id
+            WHERE d.name = ? AND s.name = ? AND t.name = ?
+            """,
+            (database, schema, table)
+        ).fetchone()
+        return row[0] if row else None
+
+    def update_column(self, database: str, schema: str, table: str, column: str, **fields):
+        """Point-update stored fields (e.g. ``ai_definition``) of one column."""
+        unknown = set(fields) - set(COLUMN_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown column fields: {sorted(unknown)}")
+        if not fields:
+            return
+        with self._lock:
+            table_id = self._table_id(database, schema, table)
+            if table_id is None:
+                raise KeyError(f"{database}.{schema}.{table}")
+            row = self._conn.execute(
+                "SELECT id, extra FROM columns WHERE table_id = ? AND name = ?", (table_id, column)
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"{database}.{schema}.{table}.{column}")
+            assignments = "".join(f", {key} = ?" for key in fields)
+            self._conn.execute(
+                f"UPDATE columns SET extra = ?{assignments} WHERE id = ?",
+                (self._mark_present(row[1], fields), *fields.values(), row[0])
+            )
+            self._bump_revision()
+            self._conn.commit()
+
+    def update_columns(self, database: str, schema: str, table: str, columns: List[Dict[str, Any]]):
+        """Apply an edited column list to one table.
+
+        Columns are matched by name: fields present in an edited column are
+        updated, fields it does not mention are kept, new names are inserted
+        and names no longer listed are deleted. Only this table's rows are
+        touched.
+        """
+        with self._lock:
+            table_id = self._table_id(database, schema, table)
+            if table_id is None:
+                raise KeyError(f"{database}.{schema}.{table}")
+            try:
+                existing = {name: (column_id, extra) for name, column_id, extra in self._conn.execute(
+                    "SELECT name, id, extra FROM columns WHERE table_id = ?", (table_id,)
+                )}
+                for position, column in enumerate(columns):
+                    fields = {key: value for key, value in column.items() if key in COLUMN_FIELDS}
+                    column_id, extra = existing.pop(column.get('name'), (None, None))
+                    if column_id is None:
+                        self._conn.execute(
+                            f"INSERT INTO columns (table_id, position, {', '.join(COLUMN_FIELDS)}, extra) "
+                            f"VALUES (?, ?, {', '.join('?' * len(COLUMN_FIELDS))}, ?)",
+                            (table_id, position) + self._column_row(column)
+                        )
+                    else:
+                        assignments = "".join(f", {key} = ?" for key in fields)
+                        self._conn.execute(
+                            f"UPDATE columns SET position = ?, extra = ?{assignments} WHERE id = ?",
+                            (position, self._mark_present(extra, fields), *fields.values(), column_id)
+                        )
+                self._conn.executemany("DELETE FROM columns WHERE id = ?",
+                                       [(column_id,) for column_id, _ in existing.values()])
+                self._bump_revision()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    # Reads
+
+    @property
+    def revision(self) -> int:
+        """Counter that changes whenever the stored metadata changes."""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM store_info WHERE key = 'revision'").fetchone()[0]
+
+    def has_metadata(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM databases LIMIT 1").fetchone() is not None
+
+    def list_databases(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT name FROM databases ORDER BY id")]
+
+    def list_schemas(self, database: str) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT s.name FROM schemas s JOIN databases d ON d.id = s.database_id "
+                "WHERE d.name = ? ORDER BY s.id", (database,)
+            )]
+
+    def list_tables(self, database: str, schema: str) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                """
+                SELECT t.name FROM tables t
+                JOIN schemas s ON s.id = t.schema_id
+                JOIN databases d ON d.id = s.database_id
+                WHERE d.name = ? AND s.name = ? ORDER BY t.id
+                """,
+                (database, schema)
+            )]
+
+    @staticmethod
+    def _column_from_row(row: Tuple) -> Dict[str, Any]:
+        column = dict(zip(COLUMN_FIELDS, row))
+        if row[len(COLUMN_FIELDS)]:
+            extra = json.loads(row[len(COLUMN_FIELDS)])
+            for key in extra.pop(_ABSENT_KEY, ()):
+                column.pop(key, None)
+            column.update(extra)
+        return column
+
+    @staticmethod
+    def _table_from_row(row: Tuple, columns: List[Dict[str, Any]]) -> Dict[str, Any]:
+        uuid, modification_time, extra = row
+        table_info = {'columns': columns, 'column_count': len(columns)}
+        if uuid is not None:
+            table_info['uuid'] = uuid
+        if modification_time is not None:
+            table_info['metadata_modification_time'] = modification_time
+        if extra:
+            table_info.update(json.loads(extra))
+        return table_info
+
+    def _load_tables(self, table_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Read several tables by id with one query for tables and one for columns."""
+        placeholders = ",".join("?" * len(table_ids))
+        columns_by_table = {table_id: [] for table_id in table_ids}
+        for row in self._conn.execute(
+            f"SELECT table_id, {', '.join(COLUMN_FIELDS)}, extra FROM columns "
+            f"WHERE table_id IN ({placeholders}) ORDER BY table_id, position", table_ids
+        ):
+            columns_by_table[row[0]].append(self._column_from_row(row[1:]))
+        return {
+            row[0]: self._table_from_row(row[1:], columns_by_table[row[0]])
+            for row in self._conn.execute(
+                f"SELECT id, uuid, metadata_modification_time, extra FROM tables WHERE id IN ({placeholders})",
+                table_ids
+            )
+        }
+
+    def get_table(self, database: str, schema: str, table: str) -> Optional[Dict[str, Any]]:
+        """Read one table in the snapshot layout ({'columns', 'column_count', ...})."""
+        with self._lock:
+            table_id = self._table_id(database, schema, table)
+            if table_id is None:
+                return None
+            return self._load_tables([table_id])[table_id]
+
+    def iter_tables(self, batch_size: int = 500) -> Iterator[Tuple[str, str, str, Dict[str, Any]]]:
+        """Yield (database, schema, table, table_info) for every table.
+
+        Tables are read in batches, so only ``batch_size`` tables are held in
+        memory at a time.
+        """
+        with self._lock:
+            keys = self._conn.execute(
+                """
+                SELECT t.id, d.name, s.name, t.name FROM tables t
+                JOIN schemas s ON s.id = t.schema_id
+                JOIN databases d ON d.id = s.database_id
+                ORDER BY d.id, s.id, t.id
+                """
+            ).fetchall()
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            with self._lock:
+                tables = self._load_tables([key[0] for key in batch])
+            for table_id, database, schema, table in batch:
+                if table_id in tables:
+                    yield database, schema, table, tables[table_id]
+
+    def find_tables(self, name: str) -> List[Tuple[str, str, str]]:
+        """Return (database, schema, table) for every table with this name."""
+        with self._lock:
+            return self._conn.execute(
+                """
+                SELECT d.name, s.name, t.name FROM tables t
+                JOIN schemas s ON s.id = t.schema_id
+                JOIN databases d ON d.id = s.database_id
+                WHERE t.name = ? ORDER BY t.id
+                """,
+                (name,)
+            ).fetchall()
+
+    def find_columns(self, name: str) -> List[Tuple[str, str, str, Dict[str, Any]]]:
+        """Return (database, schema, table, column) for every column with this name."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT d.name, s.name, t.name, {', '.join('c.' + key for key in COLUMN_FIELDS)}, c.extra
+                FROM columns c
+                JOIN tables t ON t.id = c.table_id
+                JOIN schemas s ON s.id = t.schema_id
+                JOIN databases d ON d.id = s.database_id
+                WHERE c.name = ? ORDER BY t.id
+                """,
+                (name,)
+            ).fetchall()
+        return [(*row[:3], self._column_from_row(row[3:])) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        """Return object counts."""
+        with self._lock:
+            return {
+                name: self._conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+                for name in ('databases', 'schemas', 'tables', 'columns')
+            }
+
+    # JSON compatibility
+
+    def export_metadata(self) -> Dict[str, Any]:
+        """Rebuild the full snapshot in the extractor's JSON layout."""
+        metadata = {'databases': {}}
+        for database in self.list_databases():
+            schemas = metadata['databases'].setdefault(database, {'schemas': {}})['schemas']
+            for schema in self.list_schemas(database):
+                schemas[schema] = {'tables': {}}
+        for database, schema, table, table_info in self.iter_tables():
+            metadata['databases'][database]['schemas'][schema]['tables'][table] = table_info
+        return metadata
+
+    def iter_layout(self) -> Iterator[LayoutEvent]:
+        """Yield the stored snapshot as layout events, reading tables in batches."""
+        tables = self.iter_tables()
+        pending = next(tables, None)
+        for database in self.list_databases():
+            yield 'database', database, None, None, None
+            for schema in self.list_schemas(database):
+                yield 'schema', database, schema, None, None
+                while pending is not None and pending[:2] == (database, schema):
+                    yield ('table',) + pending
+                    pending = next(tables, None)
+
+    def export_json(self, filename: str = 'clickhouse_metadata.json'):
+        """Write the snapshot as a JSON file readable by the extractor and older app versions.
+
+        Tables are streamed to the file in batches rather than assembled first.
+        """
+        with SnapshotWriter(filename) as writer:
+            for event in self.iter_layout():
+                writer.write_event(event)
+
+    def import_json(self, filename: str = 'clickhouse_metadata.json'):
+        """Replace the stored snapshot with the contents of a snapshot file (JSON or binary)."""
+        self.replace_layout(iter_snapshot_layout(filename))
+
+    def close(self):
+        """Close the underlying SQLite connection."""
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_metadata_store() -> MetadataStore:
+    """Return the process-wide metadata store, creating it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = MetadataStore(os.getenv('METADATA_STORE_PATH', 'clickhouse_metadata.sqlite'))
+        return _default_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert between clickhouse_metadata.json and the metadata store')
+    parser.add_argument('action', choices=['import', 'export'],
+                        help='import a JSON snapshot into the store, or export the store to JSON')
+    parser.add_argument('file', nargs='?', default='clickhouse_metadata.json', help='Snapshot file (import also reads binary snapshots)')
+    parser.add_argument('--store', help='Metadata store path (default METADATA_STORE_PATH or clickhouse_metadata.sqlite)')
+    args = parser.parse_args()
+
+    store = MetadataStore(args.store) if args.store else get_metadata_store()
+    try:
+        if args.action == 'import':
+            store.import_json(args.file)
+            print(f"✅ Imported {args.file} into {store.path}: {store.stats()}")
+        else:
+            store.export_json(args.file)
+            print(f"✅ Exported {store.path} to {args.file}")
+    except Exception as e:
+        print(f"❌ {args.action.capitalize()} failed: {e}")
+        return False
+    finally:
+        store.close()
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Query Results
+
+Helpers that run a ClickHouse query and return a pandas DataFrame.
+
+Two result paths are available:
+- ``arrow``: the server streams the result in Arrow format and the DataFrame
+  is built directly on the Arrow buffers, without per-row Python objects.
+- ``rows``: the classic path that materializes ``result_rows`` as Python
+  tuples and builds the DataFrame row by row.
+
+The Arrow path needs ``pyarrow``; without it queries fall back to rows.
+"""
+
+from typing import Any, Dict
+
+import pandas as pd
+
+RESULT_FORMATS = ('arrow', 'rows')
+
+
+def arrow_available() -> bool:
+    """Whether pyarrow is installed so the Arrow path can be used."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def rows_to_dataframe(result) -> pd.DataFrame:
+    """Build a DataFrame from a row-oriented ``QueryResult``."""
+    if not getattr(result, 'result_rows', None):
+        return pd.DataFrame(columns=list(getattr(result, 'column_names', None) or []))
+
+    if getattr(result, 'column_names', None):
+        column_names = list(result.column_names)
+    else:
+        # Generate column names if not available
+        column_names = [f'col_{i}' for i in range(len(result.result_rows[0]))]
+    return pd.DataFrame(result.result_rows, columns=column_names)
+
+
+def query_dataframe(client, sql_query: str, result_format: str = 'arrow',
+                    settings: Dict[str, Any] = None) -> pd.DataFrame:
+    """Run ``sql_query`` on ``client`` and return the result as a DataFrame.
+
+    With ``result_format='arrow'`` the DataFrame columns are Arrow-backed
+    (``pd.ArrowDtype``), so no Python object is created per value.
+    ``settings`` are passed to ClickHouse with the query.
+    """
+    if result_format not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format: {result_format}")
+
+    if result_format == 'arrow' and arrow_available():
+        table = client.query_arrow(sql_query, settings=settings, use_strings=True)
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    return rows_to_dataframe(client.query(sql_query, settings=settings))
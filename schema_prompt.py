@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Schema Prompt
+
+Renders the schema context of NL-to-SQL prompts.
+
+- ``prompt_tables`` picks the tables (and columns) relevant to a question
+  from a SchemaIndex, in relevance order.
+- The ``compact`` format writes each table as one DDL-like line,
+  ``db.table(col Type, ...) -- rows, size, engine, keys``, followed by the
+  column definitions and observed values that are known. Types are
+  abbreviated (``LC(Str)`` for ``LowCardinality(String)``, ``T?`` for
+  ``Nullable(T)``, Enum values without their codes) with a legend of the
+  abbreviations used, and columns with the same name, type and meaning in
+  several tables are described once in a shared section.
+- The ``json`` format is the indented JSON the prompt used before.
+- ``fit_schema`` keeps the rendered schema within a token budget by dropping
+  detail from the least relevant tables first: observed values, then
+  definitions, then trailing columns, then whole tables.
+
+Tokens are estimated locally (``estimate_tokens``); pass ``count_tokens``
+(e.g. the model's token counter) for exact numbers.
+"""
+
+import json
+import math
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from column_profiler import profile_hint
+from schema_retrieval import SchemaIndex
+from table_statistics import format_count, prompt_statistics
+
+SCHEMA_FORMATS = ('compact', 'json')
+
+# How each format is introduced in the prompt
+FORMAT_DESCRIPTIONS = {
+    'compact': ("one line per table: database.table(column Type, ...) -- row count, size, engine and keys, "
+                "then 'column: definition' notes; columns listed by name only are described under Shared columns"),
+    'json': "database.table with columns and, where known, row count, size, engine and keys"
+}
+
+# Type abbreviations of the compact format, longest names first
+_TYPE_ABBREVIATIONS = (
+    ('LowCardinality', 'LC'),
+    ('FixedString', 'FStr'),
+    ('DateTime64', 'DT64'),
+    ('DateTime', 'DT'),
+    ('String', 'Str'),
+)
+_TYPE_WORD = re.compile(r"\b(" + "|".join(name for name, _ in _TYPE_ABBREVIATIONS) + r")\b")
+_QUOTED = re.compile(r"('(?:[^'\\]|\\.)*')")
+_ENUM_CODE = re.compile(r"\s*=\s*-?\d+")
+# A word takes the space before it, as in subword vocabularies
+_TOKEN_PIECE = re.compile(r" ?[^\W\d_]+|\d+|\s+|[^\w\s]|_")
+
+# Fewest columns a table is trimmed to before tables are dropped
+_MIN_COLUMNS = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count: words by length, digit groups, whitespace runs and punctuation."""
+    tokens = 0
+    for piece in _TOKEN_PIECE.findall(text):
+        if piece[-1].isalpha():
+            tokens += math.ceil(len(piece.lstrip()) / 6)
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+
+def prompt_column(col: Dict[str, Any]) -> Dict[str, Any]:
+    """A column as described in NL-to-SQL prompts."""
+    prompt_col = {
+        'name': col.get('name', ''),
+        'type': col.get('type', ''),
+        'definition': col.get('ai_definition') or col.get('comment') or ''
+    }
+    # Observed values help the model pick the right literals in filters
+    if col.get('profile'):
+        prompt_col['values'] = profile_hint(col['profile'])
+    return prompt_col
+
+
+def prompt_tables(schema_index: SchemaIndex, question: str, top_k: int = 8,
+                  max_columns: int = 50) -> Dict[str, Dict[str, Any]]:
+    """The tables most relevant to a question, most relevant first, as described in prompts."""
+    tables = {}
+    for score, db_name, schema_name, table_name, table_data in schema_index.search(question, top_k=top_k):
+        columns = SchemaIndex.rank_columns(question, table_data.get('columns', []), max_columns)
+        tables[f"{db_name}.{table_name}"] = {'columns': [prompt_column(col) for col in columns]}
+        statistics = prompt_statistics(table_data.get('statistics'))
+        if statistics:
+            tables[f"{db_name}.{table_name}"]['statistics'] = statistics
+    return tables
+
+
+def abbreviate_type(type_name: str) -> str:
+    """Compact spelling of a ClickHouse type, e.g. LowCardinality(Nullable(String)) -> LC(Str?)."""
+    parts = _QUOTED.split(type_name)
+    for i in range(0, len(parts), 2):
+        parts[i] = _TYPE_WORD.sub(lambda m: dict(_TYPE_ABBREVIATIONS)[m.group(1)], parts[i])
+        parts[i] = parts[i].replace(', ', ',')
+        if 'Enum' in type_name:
+            parts[i] = _ENUM_CODE.sub('', parts[i])
+    type_name = ''.join(parts)
+    # Nullable(T) -> T?, innermost first
+    while True:
+        start = type_name.find('Nullable(')
+        if start == -1:
+            return type_name
+        depth, end = 0, start + len('Nullable(')
+        for end in range(start + len('Nullable'), len(type_name)):
+            if type_name[end] == '(':
+                depth += 1
+            elif type_name[end] == ')':
+                depth -= 1
+                if depth == 0:
+                    break
+        inner = type_name[start + len('Nullable('):end]
+        type_name = f"{type_name[:start]}{inner}?{type_name[end + 1:]}"
+
+
+def _type_legend(types: List[str]) -> str:
+    joined = ' '.join(types)
+    legend = [f"{short}={name}" for name, short in _TYPE_ABBREVIATIONS if re.search(rf"\b{short}\b", joined)]
+    if '?' in joined:
+        legend.append("T?=Nullable(T)")
+    if 'Enum' in joined:
+        legend.append("Enum codes omitted")
+    return f"Types: {', '.join(legend)}" if legend else ''
+
+
+def _table_summary(statistics: Dict[str, Any]) -> str:
+    summary = []
+    if statistics.get('rows') is not None:
+        summary.append(f"{format_count(statistics['rows'])} rows")
+    for key in ('size', 'engine'):
+        if statistics.get(key):
+            summary.append(str(statistics[key]))
+    if statistics.get('sorting_key') and statistics['sorting_key'] != 'tuple()':
+        summary.append(f"ORDER BY {statistics['sorting_key']}")
+    if statistics.get('partition_key'):
+        summary.append(f"PARTITION BY {statistics['partition_key']}")
+    return ', '.join(summary)
+
+
+def _column_note(column: Dict[str, Any]) -> str:
+    return '; '.join(part for part in (column.get('definition'), column.get('values')) if part)
+
+
+def render_compact(tables: Dict[str, Dict[str, Any]]) -> str:
+    """DDL-like lines with abbreviated types and shared columns described once."""
+    # Columns with the same name, type and note in more than one table
+    signatures: Dict[Tuple[str, str, str], int] = {}
+    for table in tables.values():
+        for column in table.get('columns', []):
+            key = (column['name'], abbreviate_type(column.get('type', '')), _column_note(column))
+            signatures[key] = signatures.get(key, 0) + 1
+    shared = {key for key, count in signatures.items() if count > 1}
+
+    lines, types = [], []
+    for table_name, table in tables.items():
+        entries, notes = [], []
+        for column in table.get('columns', []):
+            column_type = abbreviate_type(column.get('type', ''))
+            note = _column_note(column)
+            if (column['name'], column_type, note) in shared:
+                entries.append(column['name'])
+                continue
+            types.append(column_type)
+            entries.append(f"{column['name']} {column_type}".rstrip())
+            if note:
+                notes.append(f"  {column['name']}: {note}")
+        line = f"{table_name}({', '.join(entries)})"
+        summary = _table_summary(table.get('statistics') or {})
+        lines.append(f"{line} -- {summary}" if summary else line)
+        lines += notes
+
+    if shared:
+        shared_lines = ["Shared columns:"]
+        for name, column_type, note in sorted(shared):
+            types.append(column_type)
+            shared_lines.append(f"  {name} {column_type}" + (f": {note}" if note else ''))
+        lines = shared_lines + lines
+    legend = _type_legend(types)
+    return '\n'.join(([legend] if legend else []) + lines)
+
+
+def render_json(tables: Dict[str, Dict[str, Any]]) -> str:
+    """The indented JSON format."""
+    return json.dumps(tables, indent=2)
+
+
+RENDERERS = {'compact': render_compact, 'json': render_json}
+
+
+@dataclass
+class SchemaPrompt:
+    """Rendered schema context and how it was fitted into the budget."""
+    text: str
+    format: str
+    tokens: int
+    tables: int
+    tables_available: int
+    # The most lossy reduction applied (each includes the ones before it), '' if none
+    reduction: str = ''
+    fitted: bool = True
+
+    @property
+    def description(self) -> str:
+        return FORMAT_DESCRIPTIONS[self.format]
+
+
+def _reduce(tables: Dict[str, Dict[str, Any]], drop_values: int, drop_definitions: int,
+            max_columns: Optional[int], keep_tables: int) -> Dict[str, Dict[str, Any]]:
+    """Copy of ``tables`` with detail dropped from the last tables."""
+    reduced = {}
+    names = list(tables)[:keep_tables]
+    for position, name in enumerate(names):
+        from_end = len(tables) - position
+        columns = tables[name].get('columns', [])
+        if max_columns is not None:
+            columns = columns[:max_columns]
+        columns = [
+            {key: value for key, value in column.items()
+             if not (key == 'values' and from_end <= drop_values)
+             and not (key == 'definition' and from_end <= drop_definitions)}
+            for column in columns
+        ]
+        reduced[name] = dict(tables[name], columns=columns)
+    return reduced
+
+
+def fit_schema(tables: Dict[str, Dict[str, Any]], schema_format: str = 'compact', max_tokens: int = 0,
+               count_tokens: Callable[[str], int] = None) -> SchemaPrompt:
+    """Render ``tables`` (most relevant first) within ``max_tokens`` (0 for no budget)."""
+    if schema_format not in RENDERERS:
+        raise ValueError(f"Unknown schema prompt format '{schema_format}' (expected one of {', '.join(SCHEMA_FORMATS)})")
+    render = RENDERERS[schema_format]
+    count_tokens = count_tokens or estimate_tokens
+    table_count = len(tables)
+    widest = max((len(table.get('columns', [])) for table in tables.values()), default=0)
+
+    def has(key: str, count: int) -> bool:
+        # Whether the count-th table from the end has something to drop
+        table = list(tables.values())[table_count - count]
+        return any(column.get(key) for column in table.get('columns', []))
+
+    # Reductions from least to most lossy, each applied to the least relevant tables first;
+    # steps that would not change the rendering are skipped
+    steps = [((0, 0, None, table_count), None)]
+    steps += [((count, 0, None, table_count), f"values dropped from {count} tables")
+              for count in range(1, table_count + 1) if has('values', count)]
+    steps += [((table_count, count, None, table_count), f"definitions dropped from {count} tables")
+              for count in range(1, table_count + 1) if has('definition', count)]
+    limit = widest
+    while limit > _MIN_COLUMNS:
+        limit = max(_MIN_COLUMNS, limit // 2)
+        steps.append(((table_count, table_count, limit, table_count), f"columns limited to {limit} per table"))
+    steps += [((table_count, table_count, _MIN_COLUMNS, keep), f"{keep} of {table_count} tables kept")
+              for keep in range(table_count - 1, 0, -1)]
+
+    for (drop_values, drop_definitions, max_columns, keep_tables), reduction in steps:
+        reduced = _reduce(tables, drop_values, drop_definitions, max_columns, keep_tables)
+        text = render(reduced)
+        tokens = count_tokens(text)
+        if not max_tokens or tokens <= max_tokens:
+            return SchemaPrompt(text, schema_format, tokens, len(reduced), table_count, reduction or '')
+    # Even the smallest rendering is over budget; send it anyway
+    return SchemaPrompt(text, schema_format, tokens, len(reduced), table_count, reduction or '', fitted=False)
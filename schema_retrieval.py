@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Schema Retrieval
+
+Local BM25 index over extracted ClickHouse metadata, used to pick the tables
+that are relevant to a natural-language question before building the
+NL-to-SQL prompt.
+
+Each table is indexed as one document made of its database and table name,
+column names, column types, comments and AI definitions. Names are split on
+snake_case and camelCase boundaries so "order date" matches ``orderDate`` and
+``order_date``.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+_WORD_RE = re.compile(r'[A-Za-z]+|\d+')
+_CAMEL_RE = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+
+# Repeat name tokens so matches on names outrank matches in free-text definitions
+_TABLE_NAME_WEIGHT = 3
+_COLUMN_NAME_WEIGHT = 2
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens, breaking snake_case and camelCase."""
+    if not text:
+        return []
+    text = _CAMEL_RE.sub(' ', str(text))
+    return [token.lower() for token in _WORD_RE.findall(text)]
+
+
+class SchemaIndex:
+    """BM25 inverted index of tables in a metadata snapshot."""
+
+    def __init__(self, metadata: Dict[str, Any], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.tables: List[Tuple[str, str, str, Dict[str, Any]]] = []
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_lengths: List[int] = []
+        self._loader = None
+
+        for db_name, db_data in metadata.get('databases', {}).items():
+            for schema_name, schema_data in db_data.get('schemas', {}).items():
+                for table_name, table_data in schema_data.get('tables', {}).items():
+                    self._add_table(db_name, schema_name, table_name, table_data)
+        self._update_avg_length()
+
+    @classmethod
+    def from_store(cls, store, k1: float = 1.5, b: float = 0.75) -> 'SchemaIndex':
+        """Build the index from a MetadataStore.
+
+        Only postings are kept in memory; the tables returned by search are
+        read back from the store.
+        """
+        index = cls({}, k1, b)
+        index._loader = store.get_table
+        for db_name, schema_name, table_name, table_data in store.iter_tables():
+            index._add_table(db_name, schema_name, table_name, table_data, keep_data=False)
+        index._update_avg_length()
+        return index
+
+    def _update_avg_length(self):
+        total = sum(self._doc_lengths)
+        self._avg_length = total / len(self._doc_lengths) if self._doc_lengths else 0.0
+
+    def _add_table(self, db_name: str, schema_name: str, table_name: str, table_data: Dict[str, Any],
+                   keep_data: bool = True):
+        tokens = tokenize(db_name) + tokenize(table_name) * _TABLE_NAME_WEIGHT
+        for column in table_data.get('columns', []):
+            tokens += tokenize(column.get('name', '')) * _COLUMN_NAME_WEIGHT
+            tokens += tokenize(column.get('type', ''))
+            tokens += tokenize(column.get('comment', ''))
+            if column.get('ai_definition') != column.get('comment'):
+                tokens += tokenize(column.get('ai_definition', ''))
+
+        doc_id = len(self.tables)
+        self.tables.append((db_name, schema_name, table_name, table_data if keep_data else None))
+        self._doc_lengths.append(len(tokens))
+        for token, count in Counter(tokens).items():
+            self._postings.setdefault(token, {})[doc_id] = count
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def search(self, question: str, top_k: int = 8) -> List[Tuple[float, str, str, str, Dict[str, Any]]]:
+        """Return up to ``top_k`` (score, database, schema, table, table_data) by BM25 relevance.
+
+        Only the posting lists of the question's terms are visited, so the cost
+        depends on how many tables mention those terms rather than on catalog
+        size. If nothing matches, the first tables of the snapshot are returned.
+        """
+        scores: Dict[int, float] = {}
+        doc_count = len(self.tables)
+        for token in set(tokenize(question)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / (self._avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        if scores:
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        else:
+            ranked = [(doc_id, 0.0) for doc_id in range(min(top_k, doc_count))]
+        results = []
+        for doc_id, score in ranked:
+            db_name, schema_name, table_name, table_data = self.tables[doc_id]
+            if table_data is None:
+                table_data = self._loader(db_name, schema_name, table_name) or {}
+            results.append((score, db_name, schema_name, table_name, table_data))
+        return results
+
+    @staticmethod
+    def rank_columns(question: str, columns: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        """Keep at most ``limit`` columns, preferring those that mention question terms.
+
+        Columns keep their original table order within the result.
+        """
+        if len(columns) <= limit:
+            return columns
+        terms = set(tokenize(question))
+
+        def overlap(column: Dict[str, Any]) -> int:
+            text = f"{column.get('name', '')} {column.get('ai_definition') or column.get('comment') or ''}"
+            return len(terms.intersection(tokenize(text)))
+
+        ranked = sorted(range(len(columns)), key=lambda i: (-overlap(columns[i]), i))[:limit]
+        return [columns[i] for i in sorted(ranked)]
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Semantic Cache
+
+Reuses validated SQL for paraphrased chat questions ("revenue by month",
+"monthly revenue"), which miss the exact and normalized tiers of the SQL
+cache.
+
+- Questions are embedded locally on the CPU as hashed feature vectors: word
+  stems and their character trigrams for the words that are not stopwords,
+  plus a grouping feature for words after "by", "per" or "each" and for
+  "daily", "monthly", ... (so "revenue by month" matches "monthly revenue"
+  but "orders per user" does not match "users per order"). Features are
+  hashed into a fixed number of signed buckets and L2-normalized; no model
+  or network call is involved.
+- Vectors live in one numpy matrix, so a lookup is a single matrix-vector
+  product. The best match is reused when its cosine similarity reaches the
+  threshold and its numbers, quoted literals and polarity are exactly the
+  question's: "top 10" never reuses the SQL of "top 20", "never paid" never
+  reuses "paid", and "inactive" never reuses "active". Polarity is the set of
+  negations (not, never, no, without, excluding, ...) and of words with a
+  negating prefix (un-, in-, im-, non-, dis-).
+- Only SQL that executed successfully is added. Entries belong to a schema
+  version and model, expire after a TTL, and the least recently used entry is
+  evicted when the index is full.
+- Hit rate and lookup latency are tracked for the app to display.
+"""
+
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from sql_cache import normalize_question
+
+_WORD_RE = re.compile(r"[^\W\d_]+")
+# Phrasings of "count": "how many orders" must not match "list orders"
+_COUNT_RE = re.compile(r"\b(?:how many|number of|count of|count)\b")
+_LITERAL_RE = re.compile(r"""'[^']*'|"[^"]*"|\d+(?:\.\d+)?""")
+# Negations, and words that may carry a negating prefix ("inactive", "unpaid", "non-premium")
+_NEGATION_RE = re.compile(r"\b(?:not|never|no|none|nothing|nobody|without|excluding|except|neither|nor)\b|n't\b")
+_PREFIXED_RE = re.compile(r"\b(?:un|in|im|non|dis)-?[a-z]{4,}")
+_STOPWORDS = frozenset("""
+a an the of by for in on per to at from with and or me us i we my our you your
+show give list get find tell display return what which who how many much is are was were
+do does did be been can could would should please all each every there
+""".split())
+
+# Words introducing the dimension a question groups by, and adjectives naming one
+_GROUPING_WORDS = frozenset(('by', 'per', 'each'))
+_PERIOD_ADJECTIVES = {'hourly': 'hour', 'daily': 'day', 'weekly': 'week', 'monthly': 'month',
+                      'quarterly': 'quarter', 'yearly': 'year', 'annual': 'year', 'annually': 'year'}
+
+# Weights of a word stem, each of its character trigrams, and a grouping dimension
+_WORD_WEIGHT = 1.0
+_TRIGRAM_WEIGHT = 0.35
+_GROUPING_WEIGHT = 1.0
+
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping so "monthly", "months" and "month" share a stem."""
+    for suffix, replacement in (('ies', 'y'), ('ly', ''), ('es', ''), ('s', '')):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def question_literals(question: str) -> Tuple[str, ...]:
+    """Numbers and quoted literals of a question; a reused query must have the same ones."""
+    return tuple(sorted(_LITERAL_RE.findall(question)))
+
+
+def question_polarity(question: str) -> Tuple[str, ...]:
+    """Negations and negatively prefixed words of a question; a reused query must have the same ones."""
+    text = question.casefold()
+    negations = {'not' if match.endswith("n't") else match for match in _NEGATION_RE.findall(text)}
+    prefixed = {_stem(word.replace('-', '')) for word in _PREFIXED_RE.findall(_LITERAL_RE.sub(' ', text))}
+    return tuple(sorted(negations | prefixed))
+
+
+def question_guards(question: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """What must match exactly, besides similarity, for a cached query to be reused."""
+    return question_literals(question), question_polarity(question)
+
+
+def embed_question(question: str, dim: int = 512) -> np.ndarray:
+    """Hashed word-stem, character-trigram and grouping vector of a question, L2-normalized."""
+    features = []
+    grouping = False
+    for word in _WORD_RE.findall(_COUNT_RE.sub(' count ', normalize_question(question))):
+        if word in _GROUPING_WORDS:
+            grouping = True
+            continue
+        if word in _STOPWORDS:
+            continue
+        stem = _PERIOD_ADJECTIVES.get(word) or _stem(word)
+        padded = f"#{stem}#"
+        features.append((f"w:{stem}", _WORD_WEIGHT))
+        features += [(padded[i:i + 3], _TRIGRAM_WEIGHT) for i in range(len(padded) - 2)]
+        if grouping or word in _PERIOD_ADJECTIVES:
+            features.append((f"g:{stem}", _GROUPING_WEIGHT))
+        grouping = False
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in features:
+        bucket = zlib.crc32(feature.encode('utf-8'))
+        vector[bucket % dim] += weight if bucket & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Fixed-capacity vector index of questions and their validated SQL."""
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 2000, ttl: float = 86400, dim: int = 512):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._used = np.zeros(self.max_entries, dtype=bool)
+        self._last_used = np.zeros(self.max_entries, dtype=np.float64)
+        # Per slot: (partition, guards, question, sql, created)
+        self._entries: List[Optional[Tuple[str, Tuple, str, str, float]]] = [None] * self.max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lookup_seconds = 0.0
+        self._lookups = 0
+
+    @staticmethod
+    def _partition(version: str, model_name: str) -> str:
+        return f"{version}\x1f{model_name}"
+
+    def _expire(self, now: float):
+        if not self.ttl:
+            return
+        for slot in np.flatnonzero(self._used):
+            if now - self._entries[slot][4] > self.ttl:
+                self._used[slot] = False
+                self._entries[slot] = None
+
+    def get(self, question: str, version: str, model_name: str) -> Optional[Dict[str, Any]]:
+        """Best cached match for a question, or None.
+
+        Returns {'sql', 'question', 'similarity'}; ``question`` is the one the
+        SQL was originally generated for.
+        """
+        started = time.perf_counter()
+        vector = embed_question(question, self.dim)
+        partition = self._partition(version, model_name)
+        guards = question_guards(question)
+        match = None
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            if self._used.any():
+                scores = self._vectors @ vector
+                scores[~self._used] = -1.0
+                # Best candidates first; wrong partitions, literals and polarity are skipped
+                for slot in np.argsort(-scores)[:8]:
+                    if scores[slot] < self.threshold:
+                        break
+                    entry = self._entries[slot]
+                    if entry[0] == partition and entry[1] == guards:
+                        self._last_used[slot] = now
+                        match = {'sql': entry[3], 'question': entry[2], 'similarity': float(scores[slot])}
+                        break
+            if match:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._lookups += 1
+            self._lookup_seconds += time.perf_counter() - started
+        return match
+
+    def add(self, question: str, version: str, model_name: str, sql: str):
+        """Index a question whose SQL executed successfully."""
+        vector = embed_question(question, self.dim)
+        if not vector.any():
+            return
+        partition = self._partition(version, model_name)
+        guards = question_guards(question)
+        with self._lock:
+            now = time.time()
+            # Replace an existing entry for the same question, else take a free or the LRU slot
+            slot = next((slot for slot in np.flatnonzero(self._used)
+                         if self._entries[slot][0] == partition and self._entries[slot][2] == question), None)
+            if slot is None:
+                free = np.flatnonzero(~self._used)
+                if len(free):
+                    slot = free[0]
+                else:
+                    slot = int(np.argmin(self._last_used))
+                    self.evictions += 1
+            self._vectors[slot] = vector
+            self._used[slot] = True
+            self._last_used[slot] = now
+            self._entries[slot] = (partition, guards, question, sql, now)
+
+    def discard_sql(self, sql: str):
+        """Drop every entry holding ``sql``, e.g. after it failed to execute."""
+        with self._lock:
+            for slot in np.flatnonzero(self._used):
+                if self._entries[slot][3] == sql:
+                    self._used[slot] = False
+                    self._entries[slot] = None
+
+    def clear(self):
+        with self._lock:
+            self._used[:] = False
+            self._entries = [None] * self.max_entries
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'avg_lookup_ms': 1000 * self._lookup_seconds / self._lookups if self._lookups else 0.0,
+                'entries': int(self._used.sum()),
+                'evictions': self.evictions
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the process-wide semantic cache, creating it on first use; None when SEMANTIC_CACHE=false."""
+    global _default_cache
+    if os.getenv('SEMANTIC_CACHE', 'true').strip().lower() != 'true':
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SemanticCache(
+                threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95')),
+                max_entries=int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '2000')),
+                ttl=float(os.getenv('SEMANTIC_CACHE_TTL', '86400'))
+            )
+        return _default_cache
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Snapshot Diff
+
+Schema drift between two metadata snapshots: added and removed databases
+and tables, and for altered tables the added, removed, retyped and modified
+columns.
+
+Every table gets a fingerprint, a hash of its column structure (names,
+types, defaults, comments, codecs and TTLs, in order; AI definitions are
+not part of it). Tables with equal fingerprints are unchanged without
+looking at their columns, so the diff runs in a single pass over each
+snapshot. Only the old snapshot's fingerprints and column summaries are
+kept in memory; the new snapshot is streamed.
+
+Run ``python3 snapshot_diff.py old.json new.json`` for a report; both files
+may be JSON or binary snapshots.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
+
+from snapshot_io import LayoutEvent, iter_metadata, iter_snapshot_layout
+
+# Column fields that make up a table's structure
+STRUCTURE_FIELDS = ('name', 'type', 'default_type', 'default_expression', 'comment',
+                    'codec_expression', 'ttl_expression')
+
+TableKey = Tuple[str, str, str]
+
+
+def _structure(column: Dict[str, Any]) -> Tuple[str, ...]:
+    return tuple('' if column.get(name) is None else str(column.get(name)) for name in STRUCTURE_FIELDS)
+
+
+def table_fingerprint(columns: List[Dict[str, Any]]) -> str:
+    """Stable hash of a table's column structure, ignoring AI definitions."""
+    digest = hashlib.blake2b(digest_size=16)
+    for column in columns:
+        digest.update('\x1f'.join(_structure(column)).encode('utf-8'))
+        digest.update(b'\x1e')
+    return digest.hexdigest()
+
+
+@dataclass
+class TableChange:
+    """Column-level changes of one altered table."""
+    database: str
+    schema: str
+    table: str
+    columns_added: List[Tuple[str, str]] = field(default_factory=list)      # (column, type)
+    columns_removed: List[Tuple[str, str]] = field(default_factory=list)    # (column, type)
+    type_changes: List[Tuple[str, str, str]] = field(default_factory=list)  # (column, old type, new type)
+    columns_modified: List[str] = field(default_factory=list)  # default, comment, codec or TTL changed
+    reordered: bool = False
+
+
+@dataclass
+class SnapshotDiff:
+    """Structured drift report between an old and a new snapshot."""
+    databases_added: List[str] = field(default_factory=list)
+    databases_removed: List[str] = field(default_factory=list)
+    tables_added: List[TableKey] = field(default_factory=list)
+    tables_removed: List[TableKey] = field(default_factory=list)
+    tables_altered: List[TableChange] = field(default_factory=list)
+    tables_unchanged: int = 0
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.databases_added or self.databases_removed or self.tables_added
+                    or self.tables_removed or self.tables_altered)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            'databases_added': len(self.databases_added),
+            'databases_removed': len(self.databases_removed),
+            'tables_added': len(self.tables_added),
+            'tables_removed': len(self.tables_removed),
+            'tables_altered': len(self.tables_altered),
+            'tables_unchanged': self.tables_unchanged,
+            'columns_added': sum(len(change.columns_added) for change in self.tables_altered),
+            'columns_removed': sum(len(change.columns_removed) for change in self.tables_altered),
+            'type_changes': sum(len(change.type_changes) for change in self.tables_altered)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        report = asdict(self)
+        report['summary'] = self.summary()
+        return report
+
+    def rows(self) -> List[Dict[str, str]]:
+        """One row per change, for tabular display."""
+        rows = [{'change': 'added', 'object': 'database', 'name': name, 'details': ''}
+                for name in self.databases_added]
+        rows += [{'change': 'removed', 'object': 'database', 'name': name, 'details': ''}
+                 for name in self.databases_removed]
+        rows += [{'change': 'added', 'object': 'table', 'name': '.'.join(key), 'details': ''}
+                 for key in self.tables_added]
+        rows += [{'change': 'removed', 'object': 'table', 'name': '.'.join(key), 'details': ''}
+                 for key in self.tables_removed]
+        for change in self.tables_altered:
+            table = f"{change.database}.{change.schema}.{change.table}"
+            rows += [{'change': 'added', 'object': 'column', 'name': f"{table}.{column}", 'details': column_type}
+                     for column, column_type in change.columns_added]
+            rows += [{'change': 'removed', 'object': 'column', 'name': f"{table}.{column}", 'details': column_type}
+                     for column, column_type in change.columns_removed]
+            rows += [{'change': 'retyped', 'object': 'column', 'name': f"{table}.{column}",
+                      'details': f"{old_type} -> {new_type}"}
+                     for column, old_type, new_type in change.type_changes]
+            rows += [{'change': 'modified', 'object': 'column', 'name': f"{table}.{column}",
+                      'details': 'default, comment, codec or TTL'}
+                     for column in change.columns_modified]
+            if change.reordered:
+                rows.append({'change': 'reordered', 'object': 'table', 'name': table, 'details': 'column order'})
+        return rows
+
+    def format_report(self) -> str:
+        """Plain-text report, one line per change."""
+        summary = self.summary()
+        lines = [
+            f"Schema drift: {summary['tables_added']} tables added, {summary['tables_removed']} removed, "
+            f"{summary['tables_altered']} altered, {summary['tables_unchanged']} unchanged"
+        ]
+        symbols = {'added': '+', 'removed': '-'}
+        for row in self.rows():
+            symbol = symbols.get(row['change'], '~')
+            details = f" ({row['details']})" if row['details'] else ''
+            if row['change'] in ('retyped', 'modified', 'reordered'):
+                details = f" {row['change']}{details}"
+            lines.append(f"  {symbol} {row['object']} {row['name']}{details}")
+        return '\n'.join(lines)
+
+
+def _column_summary(columns: List[Dict[str, Any]]) -> List[Tuple[str, str, int]]:
+    """(name, type, structure hash) per column; hashes only need to match within one process."""
+    return [(structure[0], structure[1], hash(structure)) for structure in map(_structure, columns)]
+
+
+def _compare_columns(key: TableKey, old: List[Tuple[str, str, int]],
+                     new: List[Tuple[str, str, int]]) -> TableChange:
+    change = TableChange(*key)
+    old_by_name = {name: (column_type, digest) for name, column_type, digest in old}
+    new_names = {name for name, _, _ in new}
+    for name, column_type, digest in new:
+        if name not in old_by_name:
+            change.columns_added.append((name, column_type))
+            continue
+        old_type, old_digest = old_by_name[name]
+        if old_type != column_type:
+            change.type_changes.append((name, old_type, column_type))
+        elif old_digest != digest:
+            change.columns_modified.append(name)
+    change.columns_removed = [(name, column_type) for name, column_type, _ in old if name not in new_names]
+    change.reordered = ([name for name, _, _ in old if name in new_names]
+                        != [name for name, _, _ in new if name in old_by_name])
+    return change
+
+
+def diff_layouts(old_events: Iterable[LayoutEvent], new_events: Iterable[LayoutEvent]) -> SnapshotDiff:
+    """Diff two snapshots given as layout events (see snapshot_io)."""
+    old_databases = {}
+    old_tables = {}
+    for kind, database, schema, table, table_info in old_events:
+        if kind == 'database':
+            old_databases[database] = True
+        elif kind == 'table':
+            columns = table_info.get('columns', [])
+            old_tables[(database, schema, table)] = (table_fingerprint(columns), _column_summary(columns))
+
+    diff = SnapshotDiff()
+    new_databases = set()
+    for kind, database, schema, table, table_info in new_events:
+        if kind == 'database':
+            new_databases.add(database)
+            if database not in old_databases:
+                diff.databases_added.append(database)
+        elif kind == 'table':
+            key = (database, schema, table)
+            previous = old_tables.pop(key, None)
+            columns = table_info.get('columns', [])
+            if previous is None:
+                diff.tables_added.append(key)
+            elif previous[0] == table_fingerprint(columns):
+                diff.tables_unchanged += 1
+            else:
+                diff.tables_altered.append(_compare_columns(key, previous[1], _column_summary(columns)))
+
+    diff.databases_removed = [database for database in old_databases if database not in new_databases]
+    diff.tables_removed = list(old_tables)
+    return diff
+
+
+def diff_metadata(old: Dict[str, Any], new: Dict[str, Any]) -> SnapshotDiff:
+    """Diff two in-memory snapshots."""
+    return diff_layouts(iter_metadata(old), iter_metadata(new))
+
+
+def diff_files(old_file: str, new_file: str) -> SnapshotDiff:
+    """Diff two snapshot files (JSON or binary), reading them table by table."""
+    return diff_layouts(iter_snapshot_layout(old_file), iter_snapshot_layout(new_file))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report schema drift between two metadata snapshots')
+    parser.add_argument('old', help='Earlier snapshot (JSON or binary)')
+    parser.add_argument('new', help='Later snapshot (JSON or binary)')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    parser.add_argument('--fail-on-changes', action='store_true',
+                        help='Exit with status 2 when the snapshots differ')
+    args = parser.parse_args()
+
+    try:
+        diff = diff_files(args.old, args.new)
+    except Exception as e:
+        print(f"❌ Diff failed: {e}")
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(diff.to_dict(), indent=2, ensure_ascii=False))
+    else:
+        print(diff.format_report())
+    sys.exit(2 if args.fail_on_changes and diff.has_changes else 0)
+
+
+if __name__ == "__main__":
+    main()
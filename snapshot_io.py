@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+"""
+Snapshot I/O
+
+Streaming writer and lazy reader for metadata snapshots in the nested
+``clickhouse_metadata.json`` layout::
+
+    {"databases": {db: {"schemas": {schema: {"tables": {table: {...}}}}}}}
+
+- ``SnapshotWriter`` writes one table at a time, so a snapshot can be
+  written while the extraction is still running, without serializing the
+  whole tree at once. The output is byte-for-byte what
+  ``json.dump(metadata, indent=2, ensure_ascii=False)`` produces. It goes to
+  a temporary file that replaces the target only when the snapshot is
+  complete.
+- ``SnapshotReader`` scans a snapshot in fixed-size chunks and decodes one
+  table at a time. It can iterate tables, or record their byte offsets to
+  seek to a single table later, without materializing the whole document.
+
+Both work on any JSON file with this layout, including snapshots written
+with ``json.dump``.
+
+Snapshots can also be stored in a compact MessagePack format (needs
+``msgpack``). Every distinct string is stored once in a string table, and each
+table's columns are stored as rows of string ids under one shared field list.
+``load_snapshot`` reads either format; ``python3 snapshot_io.py convert``
+converts between them.
+"""
+
+import argparse
+import codecs
+import gc
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# (kind, database, schema, table, table_info) where kind is 'database', 'schema' or 'table'
+LayoutEvent = Tuple[str, str, Optional[str], Optional[str], Optional[Dict[str, Any]]]
+
+SNAPSHOT_FORMATS = ('json', 'msgpack')
+
+# Identifies binary snapshots and their layout version; version 1 files
+# (string-only column fields) are still read
+BINARY_FORMAT_NAME = 'auralytics-metadata'
+BINARY_FORMAT_VERSION = 2
+_BINARY_READABLE_VERSIONS = (1, 2)
+
+# Marks a column field that a column does not have
+_MISSING = object()
+
+# Indentation of each nesting level in json.dump(indent=2) output
+_DATABASE_INDENT = ' ' * 4
+_SCHEMA_INDENT = ' ' * 8
+_TABLE_INDENT = ' ' * 12
+
+
+def iter_metadata(metadata: Dict[str, Any]) -> Iterator[LayoutEvent]:
+    """Yield the layout events of an in-memory snapshot."""
+    for database, db_info in metadata.get('databases', {}).items():
+        yield 'database', database, None, None, None
+        for schema, schema_info in db_info.get('schemas', {}).items():
+            yield 'schema', database, schema, None, None
+            for table, table_info in schema_info.get('tables', {}).items():
+                yield 'table', database, schema, table, table_info
+
+
+class SnapshotWriter:
+    """Incremental writer for the nested snapshot layout.
+
+    Databases, schemas and tables must be written in snapshot order (all
+    tables of a schema together); a table implicitly opens its database and
+    schema. Use as a context manager, or call ``close()`` to finish the file
+    and ``abort()`` to discard it.
+    """
+
+    def __init__(self, filename: str = 'clickhouse_metadata.json'):
+        self.filename = filename
+        self._temp_filename = f"{filename}.tmp"
+        self._file = open(self._temp_filename, 'w', encoding='utf-8')
+        self._start()
+
+    def _start(self):
+        self._file.write('{\n  "databases": {')
+        self._database = self._schema = None
+        self._database_count = self._schema_count = self._table_count = 0
+        self.tables_written = 0
+
+    def _close_schema(self):
+        if self._schema is not None:
+            self._file.write(f'\n{_SCHEMA_INDENT}  }}' if self._table_count else '}')
+            self._file.write(f'\n{_SCHEMA_INDENT}}}')
+            self._schema = None
+
+    def _close_database(self):
+        self._close_schema()
+        if self._database is not None:
+            self._file.write(f'\n{_DATABASE_INDENT}  }}' if self._schema_count else '}')
+            self._file.write(f'\n{_DATABASE_INDENT}}}')
+            self._database = None
+
+    def write_database(self, database: str):
+        """Open a database; a no-op if it is the current one."""
+        if database == self._database:
+            return
+        self._close_database()
+        separator = ',' if self._database_count else ''
+        self._file.write(f'{separator}\n{_DATABASE_INDENT}{json.dumps(database, ensure_ascii=False)}: {{'
+                         f'\n{_DATABASE_INDENT}  "schemas": {{')
+        self._database = database
+        self._database_count += 1
+        self._schema_count = 0
+
+    def write_schema(self, database: str, schema: str):
+        """Open a schema (and its database); a no-op if it is the current one."""
+        if database == self._database and schema == self._schema:
+            return
+        self.write_database(database)
+        self._close_schema()
+        separator = ',' if self._schema_count else ''
+        self._file.write(f'{separator}\n{_SCHEMA_INDENT}{json.dumps(schema, ensure_ascii=False)}: {{'
+                         f'\n{_SCHEMA_INDENT}  "tables": {{')
+        self._schema = schema
+        self._schema_count += 1
+        self._table_count = 0
+
+    def write_table(self, database: str, schema: str, table: str, table_info: Dict[str, Any]):
+        """Append one table to its schema."""
+        self.write_schema(database, schema)
+        separator = ',' if self._table_count else ''
+        value = json.dumps(table_info, indent=2, ensure_ascii=False).replace('\n', '\n' + _TABLE_INDENT)
+        self._file.write(f'{separator}\n{_TABLE_INDENT}{json.dumps(table, ensure_ascii=False)}: {value}')
+        self._table_count += 1
+        self.tables_written += 1
+
+    def write_event(self, event: LayoutEvent):
+        """Write one layout event as produced by iter_metadata or SnapshotReader.iter_layout."""
+        kind, database, schema, table, table_info = event
+        if kind == 'database':
+            self.write_database(database)
+        elif kind == 'schema':
+            self.write_schema(database, schema)
+        else:
+            self.write_table(database, schema, table, table_info)
+
+    def reset(self):
+        """Discard everything written so far and start an empty snapshot."""
+        self._file.seek(0)
+        self._file.truncate()
+        self._start()
+
+    def close(self):
+        """Finish the document and move it into place."""
+        if self._file.closed:
+            return
+        self._close_database()
+        self._file.write('\n  }' if self._database_count else '}')
+        self._file.write('\n}')
+        self._file.close()
+        os.replace(self._temp_filename, self.filename)
+
+    def abort(self):
+        """Drop the partial snapshot, leaving any previous file untouched."""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._temp_filename):
+            os.remove(self._temp_filename)
+
+    def __enter__(self) -> 'SnapshotWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_snapshot(metadata: Dict[str, Any], filename: str = 'clickhouse_metadata.json'):
+    """Write an in-memory snapshot with SnapshotWriter."""
+    with SnapshotWriter(filename) as writer:
+        for event in iter_metadata(metadata):
+            writer.write_event(event)
+
+
+class _Scanner:
+    """Chunked JSON tokenizer that decodes one value at a time.
+
+    Tracks the byte offset of every position it hands out so values can be
+    read back later with a single seek.
+    """
+
+    _WHITESPACE = re.compile(r'[ \t\n\r]*')
+    _DECODER = json.JSONDecoder()
+
+    def __init__(self, f, chunk_size: int):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._eof = False
+        self._ascii = True
+        self.buf = ''
+        self.pos = 0
+        # Byte offset of buf[_mark]; advanced monotonically so each character is encoded once
+        self._mark = 0
+        self._mark_bytes = 0
+
+    def _fill(self, size: int = None) -> bool:
+        """Read more text into the buffer; returns False at end of file."""
+        if self._eof:
+            return False
+        data = self._file.read(size or self._chunk_size)
+        if not data:
+            self._eof = True
+        text = self._decoder.decode(data, final=not data)
+        if self.pos > self._chunk_size:
+            # Drop the consumed prefix so the buffer stays around one chunk
+            self.byte_offset(self.pos)
+            self.buf = self.buf[self.pos:]
+            self.pos = self._mark = 0
+        self.buf += text
+        self._ascii = self._ascii and text.isascii()
+        return bool(data) or bool(text)
+
+    def byte_offset(self, index: int) -> int:
+        """Byte offset in the file of ``buf[index]`` (index must not move backwards)."""
+        if self._ascii:
+            self._mark_bytes += index - self._mark
+        else:
+            self._mark_bytes += len(self.buf[self._mark:index].encode('utf-8'))
+        self._mark = index
+        return self._mark_bytes
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = self._WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return
+
+    def next_char(self) -> str:
+        """Consume and return the next non-whitespace character."""
+        self._skip_whitespace()
+        if self.pos >= len(self.buf):
+            raise json.JSONDecodeError("Unexpected end of snapshot", self.buf, self.pos)
+        char = self.buf[self.pos]
+        self.pos += 1
+        return char
+
+    def expect(self, char: str):
+        found = self.next_char()
+        if found != char:
+            raise json.JSONDecodeError(f"Expected {char!r}, found {found!r}", self.buf, self.pos - 1)
+
+    def value(self) -> Tuple[Any, int, int]:
+        """Decode the next JSON value; returns (value, start byte, end byte)."""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # The value continues past the buffer; read at least as much again
+                if not self._fill(max(self._chunk_size, len(self.buf))):
+                    raise
+                continue
+            if end >= len(self.buf) and not isinstance(value, (dict, list, str)) and self._fill():
+                # A number at the end of the buffer may continue in the next chunk
+                continue
+            start = self.byte_offset(self.pos)
+            self.pos = end
+            return value, start, self.byte_offset(end)
+
+    def members(self) -> Iterator[str]:
+        """Iterate the keys of an object whose '{' was just consumed.
+
+        The caller must consume each member's value before asking for the
+        next key.
+        """
+        self._skip_whitespace()
+        if self.buf[self.pos:self.pos + 1] == '}':
+            self.pos += 1
+            return
+        while True:
+            key, _, _ = self.value()
+            self.expect(':')
+            yield key
+            char = self.next_char()
+            if char == '}':
+                return
+            if char != ',':
+                raise json.JSONDecodeError(f"Expected ',' or '}}', found {char!r}", self.buf, self.pos - 1)
+
+
+class SnapshotReader:
+    """Lazy reader for snapshots in the nested layout."""
+
+    def __init__(self, filename: str = 'clickhouse_metadata.json', chunk_size: int = 1 << 20):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        # (database, schema, table) -> (byte offset, byte length) of the table's JSON value
+        self._offsets: Optional[Dict[Tuple[str, str, str], Tuple[int, int]]] = None
+
+    def iter_layout(self, decode_tables: bool = True) -> Iterator[LayoutEvent]:
+        """Yield databases, schemas and tables in file order, one table decoded at a time.
+
+        With ``decode_tables=False`` table events carry None instead of the
+        table (each table is still parsed to find where it ends).
+        """
+        offsets = {}
+        with open(self.filename, 'rb') as f:
+            scanner = _Scanner(f, self.chunk_size)
+            scanner.expect('{')
+            for key in scanner.members():
+                if key != 'databases':
+                    scanner.value()
+                    continue
+                scanner.expect('{')
+                for database in scanner.members():
+                    yield 'database', database, None, None, None
+                    scanner.expect('{')
+                    for db_key in scanner.members():
+                        if db_key != 'schemas':
+                            scanner.value()
+                            continue
+                        scanner.expect('{')
+                        for schema in scanner.members():
+                            yield 'schema', database, schema, None, None
+                            scanner.expect('{')
+                            for schema_key in scanner.members():
+                                if schema_key != 'tables':
+                                    scanner.value()
+                                    continue
+                                scanner.expect('{')
+                                for table in scanner.members():
+                                    table_info, start, end = scanner.value()
+                                    offsets[(database, schema, table)] = (start, end - start)
+                                    yield 'table', database, schema, table, table_info if decode_tables else None
+        self._offsets = offsets
+
+    def iter_tables(self) -> Iterator[Tuple[str, str, str, Dict[str, Any]]]:
+        """Yield (database, schema, table, table_info) for every table."""
+        for kind, database, schema, table, table_info in self.iter_layout():
+            if kind == 'table':
+                yield database, schema, table, table_info
+
+    def build_index(self):
+        """Scan the file once to record where each table is stored."""
+        for _ in self.iter_layout(decode_tables=False):
+            pass
+
+    def tables(self) -> List[Tuple[str, str, str]]:
+        """Return (database, schema, table) for every table, building the index if needed."""
+        if self._offsets is None:
+            self.build_index()
+        return list(self._offsets)
+
+    def get_table(self, database: str, schema: str, table: str) -> Optional[Dict[str, Any]]:
+        """Read a single table by seeking to its recorded offset."""
+        if self._offsets is None:
+            self.build_index()
+        location = self._offsets.get((database, schema, table))
+        if location is None:
+            return None
+        offset, length = location
+        with open(self.filename, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length).decode('utf-8'))
+
+    def load(self) -> Dict[str, Any]:
+        """Materialize the whole snapshot (without holding the raw file text in memory)."""
+        metadata = {'databases': {}}
+        for kind, database, schema, table, table_info in self.iter_layout():
+            if kind == 'database':
+                metadata['databases'][database] = {'schemas': {}}
+            elif kind == 'schema':
+                metadata['databases'][database]['schemas'][schema] = {'tables': {}}
+            else:
+                metadata['databases'][database]['schemas'][schema]['tables'][table] = table_info
+        return metadata
+
+
+def msgpack_available() -> bool:
+    """Whether msgpack is installed so binary snapshots can be used."""
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _StringTable:
+    """Assigns each distinct string a stable integer id."""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def intern(self, value: str) -> int:
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = self._ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+
+def _pack_table(strings: _StringTable, table_info: Dict[str, Any]) -> List[Any]:
+    """Encode one table as [table fields, column field name ids, values per field].
+
+    The table fields keep their order, with the columns left as a None
+    placeholder. Column fields holding only strings are stored as string
+    ids, with -1 for a column that lacks the field. Other fields (such as
+    column profiles) are stored as {'values': [...], 'missing': [indices]}.
+    Tables whose columns are not all non-empty dicts keep their columns as-is.
+    """
+    columns = table_info.get('columns')
+    if not isinstance(columns, list) or not all(isinstance(column, dict) and column for column in columns):
+        return [table_info, None, None]
+
+    fields = list(dict.fromkeys(key for column in columns for key in column))
+    field_ids = [strings.intern(field) for field in fields]
+    values = []
+    for field in fields:
+        field_values = [column.get(field, _MISSING) for column in columns]
+        if all(isinstance(value, str) or value is _MISSING for value in field_values):
+            values.append([-1 if value is _MISSING else strings.intern(value) for value in field_values])
+        else:
+            values.append({
+                'values': [None if value is _MISSING else value for value in field_values],
+                'missing': [index for index, value in enumerate(field_values) if value is _MISSING]
+            })
+    table_fields = {key: None if key == 'columns' else value for key, value in table_info.items()}
+    return [table_fields, field_ids, values]
+
+
+def _unpack_table(strings: List[str], packed: List[Any]) -> Dict[str, Any]:
+    table_info, field_ids, values = packed
+    if field_ids is None:
+        return table_info
+
+    fields = [strings[field_id] for field_id in field_ids]
+    decoded = []
+    complete = True
+    for field_values in values:
+        if isinstance(field_values, dict):
+            column_values = field_values['values']
+            if field_values['missing']:
+                complete = False
+                for index in field_values['missing']:
+                    column_values[index] = _MISSING
+        elif -1 in field_values:
+            complete = False
+            column_values = [strings[value_id] if value_id >= 0 else _MISSING for value_id in field_values]
+        else:
+            column_values = [strings[value_id] for value_id in field_values]
+        decoded.append(column_values)
+
+    if complete:
+        table_info['columns'] = [dict(zip(fields, row)) for row in zip(*decoded)]
+    else:
+        table_info['columns'] = [
+            {field: value for field, value in zip(fields, row) if value is not _MISSING}
+            for row in zip(*decoded)
+        ]
+    return table_info
+
+
+def pack_snapshot(metadata: Dict[str, Any]) -> bytes:
+    """Encode a snapshot in the binary format."""
+    import msgpack
+
+    strings = _StringTable()
+    databases = []
+    for database, db_info in metadata.get('databases', {}).items():
+        schemas = []
+        for schema, schema_info in db_info.get('schemas', {}).items():
+            tables = [[strings.intern(table)] + _pack_table(strings, table_info)
+                      for table, table_info in schema_info.get('tables', {}).items()]
+            schemas.append([strings.intern(schema), tables])
+        databases.append([strings.intern(database), schemas])
+    return msgpack.packb({
+        'format': BINARY_FORMAT_NAME,
+        'version': BINARY_FORMAT_VERSION,
+        'strings': strings.strings,
+        'databases': databases
+    }, use_bin_type=True)
+
+
+def unpack_snapshot(data: bytes) -> Dict[str, Any]:
+    """Decode a binary snapshot into the nested layout.
+
+    Repeated strings such as column types decode to one shared object.
+    """
+    import msgpack
+
+    # Decoding allocates one dict per column; pausing the cyclic GC avoids
+    # repeated full scans of the growing tree
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _unpack_document(msgpack.unpackb(data, raw=False, strict_map_key=False))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _unpack_document(document: Any) -> Dict[str, Any]:
+    if not isinstance(document, dict) or document.get('format') != BINARY_FORMAT_NAME:
+        raise ValueError("Not a binary metadata snapshot")
+    if document.get('version') not in _BINARY_READABLE_VERSIONS:
+        raise ValueError(f"Unsupported binary snapshot version: {document.get('version')}")
+
+    strings = document['strings']
+    metadata = {'databases': {}}
+    for database_id, schemas in document['databases']:
+        db_schemas = metadata['databases'].setdefault(strings[database_id], {'schemas': {}})['schemas']
+        for schema_id, tables in schemas:
+            db_schemas[strings[schema_id]] = {'tables': {
+                strings[packed[0]]: _unpack_table(strings, packed[1:]) for packed in tables
+            }}
+    return metadata
+
+
+def write_binary_snapshot(metadata: Dict[str, Any], filename: str = 'clickhouse_metadata.msgpack'):
+    """Write a binary snapshot, replacing the target only once it is complete."""
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'wb') as f:
+        f.write(pack_snapshot(metadata))
+    os.replace(temp_filename, filename)
+
+
+def read_binary_snapshot(filename: str = 'clickhouse_metadata.msgpack') -> Dict[str, Any]:
+    with open(filename, 'rb') as f:
+        return unpack_snapshot(f.read())
+
+
+def snapshot_format(filename: str) -> str:
+    """Detect whether a snapshot file is JSON or binary from its first byte."""
+    with open(filename, 'rb') as f:
+        head = f.read(64).lstrip()
+    return 'json' if head.startswith(b'{') else 'msgpack'
+
+
+def load_snapshot(filename: str) -> Dict[str, Any]:
+    """Load a snapshot in either format."""
+    if snapshot_format(filename) == 'msgpack':
+        return read_binary_snapshot(filename)
+    return SnapshotReader(filename).load()
+
+
+def iter_snapshot_layout(filename: str) -> Iterator[LayoutEvent]:
+    """Yield the layout events of a snapshot file in either format."""
+    if snapshot_format(filename) == 'msgpack':
+        return iter_metadata(read_binary_snapshot(filename))
+    return SnapshotReader(filename).iter_layout()
+
+
+def save_snapshot(metadata: Dict[str, Any], filename: str, output_format: str = 'json'):
+    """Write a snapshot in the given format."""
+    if output_format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format: {output_format}")
+    if output_format == 'msgpack':
+        write_binary_snapshot(metadata, filename)
+    else:
+        write_snapshot(metadata, filename)
+
+
+def convert_snapshot(source: str, target: str, output_format: str = None):
+    """Convert a snapshot between formats; the target format defaults to its file extension."""
+    if output_format is None:
+        output_format = 'msgpack' if target.endswith(('.msgpack', '.mpk')) else 'json'
+    if output_format == 'json' and snapshot_format(source) == 'msgpack':
+        # Stream straight from the decoded tables
+        with SnapshotWriter(target) as writer:
+            for event in iter_snapshot_layout(source):
+                writer.write_event(event)
+        return
+    save_snapshot(load_snapshot(source), target, output_format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert metadata snapshots between JSON and binary formats')
+    parser.add_argument('action', choices=['convert'], help='convert a snapshot')
+    parser.add_argument('source', help='Snapshot to read (JSON or binary, detected automatically)')
+    parser.add_argument('target', help='Snapshot to write')
+    parser.add_argument('--format', choices=SNAPSHOT_FORMATS,
+                        help='Target format (default: msgpack for .msgpack files, otherwise json)')
+    args = parser.parse_args()
+
+    if not msgpack_available():
+        print("❌ msgpack is not installed; binary snapshots are unavailable")
+        return False
+    try:
+        convert_snapshot(args.source, args.target, args.format)
+    except Exception as e:
+        print(f"❌ Conversion failed: {e}")
+        return False
+    print(f"✅ Converted {args.source} ({os.path.getsize(args.source):,} bytes) "
+          f"to {args.target} ({os.path.getsize(args.target):,} bytes)")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+SQL Cache
+
+Process-wide cache of generated SQL for chat questions, shared by all
+Streamlit sessions, so a question asked again (by the same or another
+analyst) returns its SQL without a Gemini round trip.
+
+Lookups have two tiers:
+
+- the exact question text, and
+- the normalized question: case-folded outside quoted literals, with
+  punctuation, repeated whitespace and polite fillers ("please", "can you")
+  removed, so "Show me all users?" and "show me all  users" share an entry.
+
+Both tiers are keyed together with a schema version (a hash of the schema
+context the prompt would include) and the model name, so entries are never
+served for a schema or model they were not generated for.
+
+Entries expire after a TTL and the least recently used entries are evicted
+beyond a maximum count. They live in memory and, with a path, also in a
+SQLite file that survives restarts and is shared between processes.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Quoted literals are kept verbatim: 'Bob' and 'bob' are different filters
+_QUOTED = re.compile(r"""('[^']*'|"[^"]*")""")
+# Punctuation outside numbers, dates and identifiers; comparison and arithmetic operators are kept
+_PUNCTUATION = re.compile(r"[^\w\s.'\"<>=!%+*/-]|(?<!\d)\.|\.(?!\d)|!(?!=)")
+_FILLERS = re.compile(r"^(?:(?:please|kindly|can you|could you|would you)\s+)+|\s+please$")
+
+
+def normalize_question(question: str) -> str:
+    """Normalized form of a question for the second cache tier."""
+    question = unicodedata.normalize('NFKC', question)
+    parts = _QUOTED.split(question)
+    for i in range(0, len(parts), 2):
+        parts[i] = _PUNCTUATION.sub(' ', parts[i].casefold())
+    normalized = ' '.join(''.join(parts).split())
+    return _FILLERS.sub('', normalized)
+
+
+def schema_version(*parts: str) -> str:
+    """Hash identifying the schema context (and prompt) a query was generated from."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()[:32]
+
+
+class SQLCache:
+    """In-memory LRU cache with TTL, optionally backed by SQLite."""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, path: str = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.path = path or None
+        self._lock = threading.Lock()
+        # key -> (sql, created)
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self.exact_hits = 0
+        self.normalized_hits = 0
+        self.misses = 0
+        self._conn = None
+        if self.path:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sql_cache (
+                    key TEXT PRIMARY KEY,
+                    sql TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sql_cache_last_used ON sql_cache(last_used)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(tier: str, question: str, version: str, model_name: str) -> str:
+        payload = "\x1f".join((tier, question, version, model_name))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _keys(self, question: str, version: str, model_name: str):
+        return (self.make_key('exact', question.strip(), version, model_name),
+                self.make_key('normalized', normalize_question(question), version, model_name))
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.ttl) and now - created > self.ttl
+
+    def _lookup(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if not self._expired(entry[1], now):
+                self._entries.move_to_end(key)
+                return entry[0]
+            del self._entries[key]
+        if self._conn is None:
+            return None
+        row = self._conn.execute("SELECT sql, created FROM sql_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[1], now):
+            self._conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+            self._conn.commit()
+            return None
+        self._conn.execute("UPDATE sql_cache SET last_used = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self._remember(key, row[0], row[1])
+        return row[0]
+
+    def _remember(self, key: str, sql: str, created: float):
+        self._entries[key] = (sql, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, question: str, version: str, model_name: str) -> Optional[str]:
+        """Cached SQL for a question, trying the exact text first; None on a miss."""
+        exact_key, normalized_key = self._keys(question, version, model_name)
+        now = time.time()
+        with self._lock:
+            sql = self._lookup(exact_key, now)
+            if sql is not None:
+                self.exact_hits += 1
+                return sql
+            sql = self._lookup(normalized_key, now)
+            if sql is not None:
+                self.normalized_hits += 1
+                return sql
+            self.misses += 1
+            return None
+
+    def put(self, question: str, version: str, model_name: str, sql: str):
+        """Store generated SQL under both tiers of a question."""
+        now = time.time()
+        keys = self._keys(question, version, model_name)
+        with self._lock:
+            for key in keys:
+                self._remember(key, sql, now)
+            if self._conn is None:
+                return
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sql_cache (key, sql, created, last_used) VALUES (?, ?, ?, ?)",
+                [(key, sql, now, now) for key in keys]
+            )
+            if self.ttl:
+                self._conn.execute("DELETE FROM sql_cache WHERE created < ?", (now - self.ttl,))
+            count = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM sql_cache WHERE key IN "
+                    "(SELECT key FROM sql_cache ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def discard_sql(self, sql: str):
+        """Drop every entry holding ``sql``, e.g. after it failed to execute."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == sql]:
+                del self._entries[key]
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM sql_cache WHERE sql = ?", (sql,))
+                self._conn.commit()
+
+    def clear(self):
+        """Drop all entries, in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM sql_cache")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'exact_hits': self.exact_hits,
+                'normalized_hits': self.normalized_hits,
+                'misses': self.misses,
+                'entries': len(self._entries)
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_sql_cache() -> Optional[SQLCache]:
+    """Return the process-wide SQL cache, creating it on first use; None when SQL_CACHE=false."""
+    global _default_cache
+    if os.getenv('SQL_CACHE', 'true').strip().lower() != 'true':
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SQLCache(
+                max_entries=int(os.getenv('SQL_CACHE_MAX_ENTRIES', '1000')),
+                ttl=float(os.getenv('SQL_CACHE_TTL', '3600')),
+                path=os.getenv('SQL_CACHE_PATH', '')
+            )
+        return _default_cache
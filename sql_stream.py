@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+SQL Stream
+
+Helpers for streaming NL-to-SQL generation in the chat interface:
+
+- ``iter_response_text`` yields the text of a streamed Gemini reply chunk
+  by chunk (a non-streamed reply is a single chunk).
+- ``StatementDetector`` finds the end of the first SQL statement while the
+  reply is still streaming: a ``;`` or a closing code fence outside quotes
+  and comments.
+- ``EarlyQueryRunner`` validates the detected statement with ``EXPLAIN``
+  and, optionally, executes it on a background thread, so the database works
+  while the model finishes its reply and the result is ready sooner.
+- ``clean_generated_sql`` is the cleanup applied to every generated query.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+def clean_generated_sql(text: str) -> str:
+    """Strip code fences, FORMAT clauses, trailing semicolons and extra whitespace."""
+    sql_query = text.strip()
+    if sql_query.startswith('```sql'):
+        sql_query = sql_query[6:]
+    if sql_query.startswith('```'):
+        sql_query = sql_query[3:]
+    if sql_query.endswith('```'):
+        sql_query = sql_query[:-3]
+    # The app picks the result format itself
+    if 'FORMAT' in sql_query.upper():
+        sql_query = sql_query.split('FORMAT')[0].strip()
+    sql_query = sql_query.rstrip(';')
+    return ' '.join(sql_query.split()).strip()
+
+
+def chunk_text(chunk) -> str:
+    """Text of one streamed chunk, keeping its whitespace (tokens are joined as they come)."""
+    texts = []
+    try:
+        for candidate in getattr(chunk, 'candidates', None) or []:
+            content = getattr(candidate, 'content', None)
+            for part in getattr(content, 'parts', None) or []:
+                if isinstance(getattr(part, 'text', None), str):
+                    texts.append(part.text)
+    except Exception:
+        pass
+    if not texts:
+        for part in getattr(chunk, 'parts', None) or []:
+            if isinstance(getattr(part, 'text', None), str):
+                texts.append(part.text)
+    return ''.join(texts)
+
+
+def iter_response_text(response) -> Iterator[str]:
+    """Text chunks of a streamed reply; a reply that is not iterable is one chunk."""
+    try:
+        chunks = iter(response)
+    except TypeError:
+        chunks = iter([response])
+    for chunk in chunks:
+        text = chunk_text(chunk)
+        if text:
+            yield text
+
+
+class StatementDetector:
+    """Incrementally detects the first complete SQL statement in streamed text."""
+
+    def __init__(self):
+        self.text = ''
+        self.statement = None
+
+    @staticmethod
+    def _statement_end(text: str) -> Optional[int]:
+        """Index just past the first statement, or None while it may still continue."""
+        start = 0
+        stripped = text.lstrip()
+        if stripped.startswith('```'):
+            # Skip the opening fence and its language tag
+            newline = text.find('\n', text.find('```'))
+            if newline == -1:
+                return None
+            start = newline + 1
+        quote = None
+        i = start
+        while i < len(text):
+            char = text[i]
+            if quote:
+                if char == '\\':
+                    i += 1
+                elif char == quote:
+                    quote = None
+            elif char in ("'", '"', '`') and not text.startswith('```', i):
+                quote = char
+            elif text.startswith('--', i):
+                newline = text.find('\n', i)
+                if newline == -1:
+                    return None
+                i = newline
+            elif text.startswith('/*', i):
+                close = text.find('*/', i + 2)
+                if close == -1:
+                    return None
+                i = close + 1
+            elif char == ';':
+                return i + 1
+            elif text.startswith('```', i) and text[start:i].strip():
+                return i
+            i += 1
+        return None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Add streamed text; returns the cleaned statement the first time it is complete."""
+        self.text += chunk
+        if self.statement is not None:
+            return None
+        end = self._statement_end(self.text)
+        if end is None:
+            return None
+        self.statement = clean_generated_sql(self.text[:end])
+        return self.statement or None
+
+
+class EarlyQueryRunner:
+    """Validates, and optionally executes, a statement on a background thread.
+
+    ``validate(sql)`` returns an error message or None; ``execute(sql)``
+    returns the query result. Both must not touch Streamlit session state,
+    since they run outside the script thread.
+    """
+
+    # Statements EXPLAIN can validate; others are left to the normal execution path
+    _EXPLAINABLE = ('SELECT', 'WITH')
+
+    def __init__(self, validate: Callable[[str], Optional[str]],
+                 execute: Callable[[str], Any] = None):
+        self.validate = validate
+        self.execute = execute
+        self.sql = None
+        self.error = None
+        self.result = None
+        self.timings: Dict[str, float] = {}
+        self._started_at = time.monotonic()
+        self._done = threading.Event()
+
+    def mark(self, event: str):
+        """Record when an event (first token, statement complete, ...) happened."""
+        self.timings.setdefault(event, time.monotonic() - self._started_at)
+
+    def start(self, sql: str):
+        """Start validating (and executing) ``sql`` unless a statement was already started."""
+        if self.sql is not None or not sql.lstrip().upper().startswith(self._EXPLAINABLE):
+            return
+        self.sql = sql
+        self.mark('statement')
+        threading.Thread(target=self._run, name='early-query', daemon=True).start()
+
+    def _run(self):
+        try:
+            self.error = self.validate(self.sql)
+            self.mark('validated')
+            if self.error is None and self.execute is not None:
+                self.result = self.execute(self.sql)
+                self.mark('executed')
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self._done.set()
+
+    def outcome(self, sql: str, timeout: float = None) -> Optional[Dict[str, Any]]:
+        """{'error', 'result'} for ``sql`` once the background work finishes, or None if it was not started for it.
+
+        ``result`` is None when the statement was only validated.
+        """
+        if self.sql is None or self.sql != sql:
+            return None
+        if not self._done.wait(timeout):
+            return None
+        return {'error': self.error, 'result': self.result}
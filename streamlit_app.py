@@ -5,16 +5,48 @@ A complete Python solution without APIs or file downloads
 """
 
 import streamlit as st
-import subprocess
-import json
 import os
-import sys
+import time
 from typing import Dict, Any
 import pandas as pd
 import speech_recognition as sr
 import io
 import wave
 import tempfile
+from schema_prompt import fit_schema, prompt_tables
+from schema_retrieval import SchemaIndex
+from clickhouse_pool import get_pool
+from llm_clients import get_llm_registry, get_model
+from query_results import RESULT_FORMATS, query_dataframe
+from clickhouse_metadata_extractor import ExtractorConfig
+from extraction_jobs import RESUMABLE_STATUSES, get_job_runner
+from metadata_store import get_metadata_store
+from snapshot_diff import SnapshotDiff, diff_layouts
+from snapshot_io import iter_metadata
+from semantic_cache import get_semantic_cache
+from sql_cache import get_sql_cache, schema_version
+from sql_stream import EarlyQueryRunner, StatementDetector, clean_generated_sql, iter_response_text
+from table_statistics import estimate_query_cost, format_bytes, format_count, guardrail_settings
+
+# Number of relevant tables (and columns per table) included in NL-to-SQL prompts
+SCHEMA_TOP_K = 8
+SCHEMA_MAX_COLUMNS = 50
+
+# Query-cost guardrails for generated queries (0 disables a limit)
+QUERY_MAX_ROWS_TO_READ = int(os.getenv('QUERY_MAX_ROWS_TO_READ', '10000000000'))
+QUERY_MAX_BYTES_TO_READ = int(os.getenv('QUERY_MAX_BYTES_TO_READ', '1000000000000'))
+
+# Schema context format of NL-to-SQL prompts ('compact' or 'json') and its token budget (0 disables)
+SCHEMA_PROMPT_FORMAT = os.getenv('SCHEMA_PROMPT_FORMAT', 'compact').strip().lower()
+SCHEMA_PROMPT_MAX_TOKENS = int(os.getenv('SCHEMA_PROMPT_MAX_TOKENS', '6000'))
+
+# Bump when the NL-to-SQL prompt changes so cached queries are regenerated
+SQL_PROMPT_VERSION = 'v2'
+
+# Stream generated SQL and validate it with EXPLAIN as soon as the statement is complete;
+# early execution also runs it before the reply has finished
+SQL_STREAMING = os.getenv('SQL_STREAMING', 'true').strip().lower() == 'true'
+SQL_EARLY_EXECUTION = os.getenv('SQL_EARLY_EXECUTION', 'false').strip().lower() == 'true'
 
 # Page configuration
 st.set_page_config(
@@ -105,6 +137,8 @@ def main():
     # Main header
     st.markdown('<h1 class="main-header">🗄️ Auralytics</h1>', unsafe_allow_html=True)
     
+    warm_up_llm()
+    
     # Sidebar for navigation
     st.sidebar.title("Navigation")
     page = st.sidebar.selectbox(
@@ -123,6 +157,17 @@ def save_credentials(credentials):
     """Save database credentials to session state"""
     st.session_state.saved_credentials = credentials
     st.success("✅ Credentials saved successfully!")
+    warm_up_llm()
+
+def warm_up_llm():
+    """Create the shared Gemini handle for the saved credentials before the first question"""
+    saved_creds = st.session_state.get('saved_credentials', {})
+    if saved_creds.get('gemini_api_key'):
+        try:
+            get_llm_registry().warm_up(saved_creds['gemini_api_key'],
+                                       saved_creds.get('gemini_model', 'gemini-1.5-flash'))
+        except Exception as e:
+            print(f"Warning: Gemini warm-up failed: {e}")
 
 def show_database_connection():
     """Database connection configuration page"""
@@ -156,6 +201,8 @@ def show_database_connection():
             )
             targeted_schemas = st.text_input("Targeted Databases (comma-separated)", value=saved_creds.get('targeted_schemas', ''), help="Optional: specific databases to extract")
             target_tables = st.text_input("Target Tables (comma-separated)", value=saved_creds.get('target_tables', ''), help="Optional: specific tables to extract")
+            incremental = st.checkbox("Incremental refresh", value=saved_creds.get('incremental', False), help="Reuse stored tables whose structure has not changed instead of re-analyzing them")
+            column_profiling = st.checkbox("Profile columns", value=saved_creds.get('column_profiling', False), help="Sample each table for distinct counts, nulls, ranges and top values (bounded by PROFILE_* limits)")
         
         # Action buttons
         col1, col2 = st.columns(2)
@@ -164,6 +211,22 @@ def show_database_connection():
         with col2:
             submitted = st.form_submit_button("🚀 Extract Metadata", type="primary")
         
+    # Extractor settings from the current form values
+    form_config = {
+        'host': host,
+        'port': port,
+        'user': user,
+        'password': password,
+        'database': database,
+        'secure': secure,
+        'geminiApiKey': gemini_api_key,
+        'geminiModel': gemini_model,
+        'targetedSchemas': targeted_schemas,
+        'targetTables': target_tables,
+        'incremental': incremental,
+        'columnProfiling': column_profiling
+    }
+    
             # Handle save credentials
     if save_creds:
         credentials = {
@@ -176,7 +239,9 @@ def show_database_connection():
             'gemini_api_key': gemini_api_key,
             'gemini_model': gemini_model,
             'targeted_schemas': targeted_schemas,
-            'target_tables': target_tables
+            'target_tables': target_tables,
+            'incremental': incremental,
+            'column_profiling': column_profiling
         }
         save_credentials(credentials)
     
@@ -214,162 +279,245 @@ def show_database_connection():
                 st.error("❌ Please fill in all required fields (Host, Port, Username, and Gemini API Key)")
                 return
             
-            # Show progress
-            with st.spinner("🔄 Extracting metadata from ClickHouse database..."):
-                try:
-                    # Execute the metadata extraction
-                    result = execute_metadata_extraction({
-                        'host': host,
-                        'port': port,
-                        'user': user,
-                        'password': password,
-                        'database': database,
-                        'secure': secure,
-                        'geminiApiKey': gemini_api_key,
-                        'geminiModel': gemini_model,
-                        'targetedSchemas': targeted_schemas,
-                        'targetTables': target_tables
-                    })
-                    
-                    if result['success']:
-                        st.success("✅ Metadata extraction completed successfully!")
-                        st.json(result['metadata'])
-                        
-                        # Store the metadata in session state
-                        st.session_state.metadata = result['metadata']
-                        st.session_state.extraction_success = True
-                        
-                        # Show success message with navigation
-                        st.markdown("""
-                        <div class="success-box">
-                            <h4>🎉 Extraction Complete!</h4>
-                            <p>Your ClickHouse metadata has been successfully extracted and analyzed with AI-powered column definitions.</p>
-                            <p>Navigate to the <strong>Schema Viewer</strong> tab to explore your database structure.</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                    else:
-                        st.error(f"❌ Extraction failed: {result['error']}")
-                        
-                except Exception as e:
-                    st.error(f"❌ An error occurred: {str(e)}")
+            if get_job_runner().running_jobs():
+                st.warning("⏳ An extraction is already running")
+            else:
+                start_metadata_extraction(form_config)
+    
+    # Follow a running extraction; jobs outlive reruns and browser refreshes
+    running = get_job_runner().running_jobs()
+    if running:
+        show_extraction_progress(running[-1])
+    
+    show_extraction_jobs(form_config)
 
-def execute_metadata_extraction(config: Dict[str, Any]) -> Dict[str, Any]:
-    """Execute the metadata extraction Python script"""
+def start_metadata_extraction(config: Dict[str, Any], job_id: str = None):
+    """Start (or resume) a checkpointed extraction job in the background.
+    
+    The job runs on a thread owned by the process-wide job runner, so the
+    page can redraw, be refreshed, or cancel it while the extraction runs.
+    """
+    extractor_config = ExtractorConfig.from_dict(config)
+    st.info(f"🔧 Extracting from {extractor_config.host}:{extractor_config.port} "
+            f"({extractor_config.extraction_mode} mode, {extractor_config.workers} workers)")
+    
+    # An incremental refresh starts from the stored metadata
+    previous = None
+    if extractor_config.incremental and has_metadata():
+        previous = get_metadata_store().export_metadata()
+    
     try:
-        # Build command line arguments
-        args = [
-            sys.executable, 'clickhouse_metadata_extractor.py',
-            '--host', config['host'],
-            '--port', config['port'],
-            '--user', config['user'],
-            '--password', config['password'],
-            '--database', config['database'],
-            '--gemini-key', config['geminiApiKey'],
-            '--gemini-model', config['geminiModel']
-        ]
-        
-        # Add secure flag only if True
-        if config['secure']:
-            args.append('--secure')
-        
-        # Add optional arguments
-        if config.get('targetedSchemas'):
-            args.extend(['--targeted-schemas', config['targetedSchemas']])
-        if config.get('targetTables'):
-            args.extend(['--target-tables', config['targetTables']])
-        
-        # Execute the script
-        st.info(f"🔧 Executing: {' '.join(args[:4])} ... [credentials hidden]")
-        
-        # Debug: Show the full command (without sensitive data)
-        debug_args = args.copy()
-        debug_args[6] = '[PASSWORD_HIDDEN]'  # Hide password
-        debug_args[8] = '[API_KEY_HIDDEN]'   # Hide API key
-        st.code(f"Command: {' '.join(debug_args)}", language="bash")
-        
-        result = subprocess.run(
-            args,
-            capture_output=True,
-            text=True,
-            cwd=os.getcwd()
-        )
-        
-        if result.returncode != 0:
-            error_msg = result.stderr.strip()
-            if "unrecognized arguments" in error_msg:
-                error_msg = "Invalid command line arguments. Please check your configuration."
-            return {
-                'success': False,
-                'error': f"Script execution failed: {error_msg}"
-            }
-        
-        # Read the generated JSON file
-        json_file = 'clickhouse_metadata.json'
-        if not os.path.exists(json_file):
-            return {
-                'success': False,
-                'error': f"Generated JSON file {json_file} not found"
-            }
-        
-        with open(json_file, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
-        
-        return {
-            'success': True,
-            'metadata': metadata,
-            'output': result.stdout
-        }
+        if job_id:
+            get_job_runner().resume(job_id, extractor_config, previous)
+        else:
+            get_job_runner().submit(extractor_config, previous=previous)
+    except ValueError as e:
+        st.error(f"❌ {str(e)}")
+
+def format_seconds(seconds) -> str:
+    """Format a duration as m:ss for the progress display"""
+    if seconds is None:
+        return "–"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+def show_extraction_progress(job_id: str):
+    """Stream progress of a running extraction job until it finishes or is cancelled"""
+    runner = get_job_runner()
+    
+    st.subheader(f"⏳ Extraction Progress (job {job_id})")
+    if st.button("⏹️ Cancel Extraction", type="secondary"):
+        runner.cancel(job_id)
+    
+    progress_bar = st.progress(0.0, text="Connecting to ClickHouse...")
+    metric_cols = st.columns(4)
+    placeholders = [col.empty() for col in metric_cols]
+    
+    while True:
+        running = runner.is_running(job_id)
+        event = runner.progress(job_id)
+        if event is not None:
+            status = f"{event.tables_done}/{event.tables_total} tables - {event.message}"
+            progress_bar.progress(min(event.fraction, 1.0), text=status)
+            placeholders[0].metric("Tables", f"{event.tables_done}/{event.tables_total}",
+                                   f"{event.tables_per_second:.1f}/s")
+            placeholders[1].metric("Columns Annotated", event.columns_annotated,
+                                   f"{event.columns_per_second:.1f}/s")
+            placeholders[2].metric("LLM Calls", event.llm_calls, f"{event.llm_in_flight} in flight")
+            placeholders[3].metric("Elapsed / ETA", format_seconds(event.elapsed_seconds),
+                                   format_seconds(event.eta_seconds), delta_color="off")
         
-    except Exception as e:
-        return {
+        if not running:
+            break
+        time.sleep(0.25)
+    
+    job = runner.status(job_id) or {}
+    if job.get('status') == 'completed':
+        handle_extraction_result({'success': True, 'metadata': runner.result(job_id)})
+    else:
+        handle_extraction_result({
             'success': False,
-            'error': str(e)
-        }
+            'cancelled': job.get('status') == 'cancelled',
+            'error': job.get('error') or 'Extraction stopped unexpectedly'
+        })
+
+def show_extraction_jobs(form_config: Dict[str, Any]):
+    """List recent extraction jobs with actions to resume or load them"""
+    runner = get_job_runner()
+    jobs = [job for job in runner.list_jobs(limit=5) if not runner.is_running(job['job_id'])]
+    if not jobs:
+        return
+    
+    st.subheader("🗂️ Recent Extraction Jobs")
+    for job in jobs:
+        col1, col2, col3 = st.columns([3, 2, 1])
+        with col1:
+            st.write(f"**{job['job_id']}** · {job['description']}")
+            if job['error']:
+                st.caption(f"Error: {job['error']}")
+        with col2:
+            st.write(f"{job['status'].capitalize()} · {job['tables_done']}/{job['tables_total']} tables")
+        with col3:
+            if job['status'] == 'completed':
+                if st.button("📥 Load", key=f"load_job_{job['job_id']}"):
+                    handle_extraction_result({'success': True, 'metadata': runner.result(job['job_id'])})
+            elif job['status'] in RESUMABLE_STATUSES:
+                if st.button("▶️ Resume", key=f"resume_job_{job['job_id']}"):
+                    if not form_config.get('geminiApiKey'):
+                        st.error("❌ Enter the credentials above to resume this job")
+                    else:
+                        start_metadata_extraction(form_config, job['job_id'])
+                        st.rerun()
 
-def save_metadata_changes(metadata):
-    """Save the edited metadata back to the JSON file"""
+def handle_extraction_result(result: Dict[str, Any]):
+    """Show the outcome of a finished extraction and store its metadata"""
+    if result['success']:
+        st.success("✅ Metadata extraction completed successfully!")
+        st.json(result['metadata'])
+        
+        # Compare with the stored metadata before replacing it
+        store = get_metadata_store()
+        if store.has_metadata():
+            st.session_state.schema_drift = diff_layouts(store.iter_layout(), iter_metadata(result['metadata']))
+            show_schema_drift(st.session_state.schema_drift)
+        
+        # Store the metadata in the indexed metadata store
+        store.replace_metadata(result['metadata'])
+        get_schema_index()
+        
+        # Show success message with navigation
+        st.markdown("""
+        <div class="success-box">
+            <h4>🎉 Extraction Complete!</h4>
+            <p>Your ClickHouse metadata has been successfully extracted and analyzed with AI-powered column definitions.</p>
+            <p>Navigate to the <strong>Schema Viewer</strong> tab to explore your database structure.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+    elif result.get('cancelled'):
+        st.warning("⏹️ Extraction cancelled")
+    else:
+        st.error(f"❌ Extraction failed: {result['error']}")
+
+def show_schema_drift(diff: SnapshotDiff):
+    """Show what changed between the stored metadata and a new extraction"""
+    st.subheader("🔀 Schema Changes Since Last Extraction")
+    if not diff.has_changes:
+        st.info(f"No schema changes ({diff.tables_unchanged} tables unchanged)")
+        return
+    
+    summary = diff.summary()
+    metric_cols = st.columns(4)
+    metric_cols[0].metric("Tables Added", summary['tables_added'])
+    metric_cols[1].metric("Tables Removed", summary['tables_removed'])
+    metric_cols[2].metric("Tables Altered", summary['tables_altered'])
+    metric_cols[3].metric("Tables Unchanged", summary['tables_unchanged'])
+    
+    changes_df = pd.DataFrame(diff.rows())
+    changes_df.columns = ['Change', 'Object', 'Name', 'Details']
+    st.dataframe(changes_df, use_container_width=True, hide_index=True)
+
+def has_metadata():
+    """Whether extracted metadata is available in the metadata store"""
+    return get_metadata_store().has_metadata()
+
+def get_schema_index():
+    """Return the retrieval index for the stored metadata, rebuilding it after changes"""
+    store = get_metadata_store()
+    revision = store.revision
+    if st.session_state.get('schema_index_revision') != revision or 'schema_index' not in st.session_state:
+        st.session_state.schema_index = SchemaIndex.from_store(store)
+        st.session_state.schema_index_revision = revision
+    return st.session_state.schema_index
+
+def save_metadata_changes():
+    """Write the pending table edits to the metadata store, one table at a time"""
+    pending = st.session_state.get('pending_table_edits', {})
     try:
-        with open('clickhouse_metadata.json', 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        store = get_metadata_store()
+        for (db_name, schema_name, table_name), columns in pending.items():
+            store.update_columns(db_name, schema_name, table_name, columns)
+        st.session_state.pending_table_edits = {}
         st.session_state.metadata_saved = True
-        st.success("✅ Metadata changes saved successfully!")
+        st.success(f"✅ Metadata changes saved successfully! ({len(pending)} tables updated)")
     except Exception as e:
         st.error(f"❌ Error saving metadata: {str(e)}")
 
+def export_metadata_json():
+    """Export the stored metadata to clickhouse_metadata.json for the command line tools"""
+    try:
+        get_metadata_store().export_json('clickhouse_metadata.json')
+        st.success("✅ Metadata exported to clickhouse_metadata.json")
+    except Exception as e:
+        st.error(f"❌ Error exporting metadata: {str(e)}")
+
 def show_schema_viewer():
     """Schema viewer page with editing capabilities"""
     st.markdown('<h2 class="section-header">📊 Schema Viewer</h2>', unsafe_allow_html=True)
     
     # Check if metadata exists
-    if 'metadata' not in st.session_state or not st.session_state.get('extraction_success'):
+    if not has_metadata():
         st.warning("⚠️ No metadata available. Please run metadata extraction first from the Database Connection tab.")
         return
     
-    metadata = st.session_state.metadata
+    store = get_metadata_store()
+    pending = st.session_state.setdefault('pending_table_edits', {})
     
-    # Add save button at the top
-    col1, col2 = st.columns([1, 4])
+    # Add save and export buttons at the top
+    col1, col2, col3 = st.columns([1, 1, 3])
     with col1:
         if st.button("💾 Save Changes", type="primary"):
-            save_metadata_changes(metadata)
+            save_metadata_changes()
     
     with col2:
+        if st.button("📤 Export JSON", type="secondary"):
+            export_metadata_json()
+    
+    with col3:
         if st.session_state.get("metadata_saved", False):
             st.success("✅ Metadata saved successfully!")
             st.session_state.metadata_saved = False
+        elif pending:
+            st.info(f"✏️ {len(pending)} tables have unsaved changes")
+    
+    # Changes found by the last extraction in this session
+    if st.session_state.get('schema_drift') is not None:
+        with st.expander("🔀 Changes Since Previous Extraction", expanded=False):
+            show_schema_drift(st.session_state.schema_drift)
     
     # Display metadata in an organized way with editing
     st.subheader("Database Structure")
     
     # Create expandable sections for each database
-    for db_name, db_data in metadata.get('databases', {}).items():
+    for db_name in store.list_databases():
         with st.expander(f"🗄️ Database: {db_name}", expanded=True):
-            for schema_name, schema_data in db_data.get('schemas', {}).items():
+            for schema_name in store.list_schemas(db_name):
                 st.write(f"**Schema:** {schema_name}")
                 
-                for table_name, table_data in schema_data.get('tables', {}).items():
+                for table_name in store.list_tables(db_name, schema_name):
                     st.write(f"**Table:** {table_name}")
+                    table_key = (db_name, schema_name, table_name)
+                    table_data = store.get_table(db_name, schema_name, table_name) or {}
                     
                     # Create a DataFrame for the columns with editing capability
                     columns_data = []
@@ -393,20 +541,23 @@ def show_schema_viewer():
                             num_rows="dynamic"
                         )
                         
-                        # Update metadata with edited data
-                        updated_columns = []
-                        for _, row in edited_df.iterrows():
-                            updated_columns.append({
-                                'name': row['Column Name'],
-                                'type': row['Type'],
-                                'default_expression': row['Default'],
-                                'comment': row['Comment'],
-                                'ai_definition': row['AI Definition']
-                            })
-                        
-                        # Update the metadata structure
-                        metadata['databases'][db_name]['schemas'][schema_name]['tables'][table_name]['columns'] = updated_columns
-                        metadata['databases'][db_name]['schemas'][schema_name]['tables'][table_name]['column_count'] = len(updated_columns)
+                        # Queue the table for saving if its rows were edited
+                        if not edited_df.equals(df):
+                            updated_columns = []
+                            for _, row in edited_df.iterrows():
+                                # Rows added without a column name cannot be stored
+                                if pd.isna(row['Column Name']) or not row['Column Name']:
+                                    continue
+                                updated_columns.append({
+                                    'name': row['Column Name'],
+                                    'type': row['Type'],
+                                    'default_expression': row['Default'],
+                                    'comment': row['Comment'],
+                                    'ai_definition': row['AI Definition']
+                                })
+                            pending[table_key] = updated_columns
+                        else:
+                            pending.pop(table_key, None)
                         
                     else:
                         st.info("No columns found for this table")
@@ -437,6 +588,25 @@ def show_chat_interface():
         4. 📋 Display results in a formatted table
         """)
     
+    if SQL_STREAMING:
+        st.checkbox(
+            "Run query as soon as the SQL is complete",
+            value=SQL_EARLY_EXECUTION,
+            key="early_execution",
+            help="Validated queries start executing while the model is still finishing its reply"
+        )
+    
+    # Result fetching mode for generated queries
+    st.selectbox(
+        "Result format",
+        RESULT_FORMATS,
+        key="result_format",
+        format_func=lambda fmt: {"arrow": "Arrow (columnar)", "rows": "Row tuples"}[fmt],
+        help="Arrow builds results directly from columnar buffers and is faster for large results"
+    )
+    
+    show_cache_metrics()
+    
     # Initialize chat history
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -578,8 +748,15 @@ def process_chat_message(prompt: str):
     
     # Generate bot response with loading indicator
     with st.chat_message("assistant"):
+        streamed_sql = st.empty()
+        runner = create_early_query_runner()
         with st.spinner("🤖 AI is analyzing your question and generating SQL..."):
-            response = generate_chat_response(prompt)
+            response = generate_chat_response(
+                prompt,
+                on_partial=lambda text: streamed_sql.code(text, language="sql"),
+                runner=runner
+            )
+            streamed_sql.empty()
             
             # If response contains SQL, show it first
             if "Generated SQL:" in response:
@@ -590,12 +767,25 @@ def process_chat_message(prompt: str):
                     if sql_end != -1:
                         sql_query = response[sql_start + 6:sql_end].strip()
                         st.info(f"**Generated SQL:**\n```sql\n{sql_query}\n```")
+                        if st.session_state.get('sql_cache_note'):
+                            st.caption(st.session_state.sql_cache_note)
+                        show_query_cost(sql_query)
                         
                         # Show execution status
                         with st.spinner("🔍 Executing query..."):
-                            # Execute the query and show result
-                            result = execute_clickhouse_query(sql_query)
+                            # Use the validation/result started while the SQL was streaming
+                            early = runner.outcome(sql_query) if runner else None
+                            if early and early['error']:
+                                result = f"❌ Query validation failed (EXPLAIN): {early['error']}"
+                            elif early and early['result'] is not None:
+                                result = early['result']
+                            else:
+                                result = execute_clickhouse_query(sql_query)
+                            if runner:
+                                runner.mark('result')
+                                show_stream_timings(runner)
                             if isinstance(result, pd.DataFrame):
+                                remember_validated_sql(sql_query)
                                 if result.empty:
                                     st.success("✅ Query executed successfully!")
                                     st.info("**Result:** No data found.")
@@ -604,6 +794,7 @@ def process_chat_message(prompt: str):
                                     st.dataframe(result, use_container_width=True)
                             else:
                                 st.error(f"❌ Query execution failed: {result}")
+                                forget_failed_sql(sql_query)
                         return
             
         st.markdown(response)
@@ -611,6 +802,59 @@ def process_chat_message(prompt: str):
     # Add assistant response to chat history
     st.session_state.messages.append({"role": "assistant", "content": response})
 
+def create_early_query_runner():
+    """Runner that validates (and optionally executes) streamed SQL, or None when streaming is off"""
+    creds = st.session_state.get('saved_credentials', {})
+    if not (SQL_STREAMING and creds):
+        return None
+    # Captured here: the runner's thread cannot read session state
+    params = query_connection_params(creds)
+    result_format = st.session_state.get('result_format', 'arrow')
+    execute = None
+    if st.session_state.get('early_execution', SQL_EARLY_EXECUTION):
+        execute = lambda sql: run_guarded_query(params, sql, result_format)
+    return EarlyQueryRunner(validate=lambda sql: explain_query(params, sql), execute=execute)
+
+def show_stream_timings(runner):
+    """Caption with the time to the first SQL token, the complete statement and the result"""
+    labels = (('first_token', 'first SQL token'), ('statement', 'statement complete'),
+              ('validated', 'validated'), ('result', 'result'))
+    parts = [f"{label} {runner.timings[event]:.2f}s" for event, label in labels if event in runner.timings]
+    if parts:
+        st.caption("⏱️ " + " · ".join(parts))
+
+def remember_validated_sql(sql_query):
+    """Index a query that executed successfully in the semantic cache under its question"""
+    generated = st.session_state.get('last_generated_sql')
+    semantic_cache = get_semantic_cache()
+    if semantic_cache and generated and generated['sql'] == sql_query:
+        semantic_cache.add(generated['question'], generated['version'], generated['model'], sql_query)
+
+def forget_failed_sql(sql_query):
+    """Drop a failing query from the caches so the question is regenerated next time"""
+    for cache in (get_sql_cache(), get_semantic_cache()):
+        if cache:
+            cache.discard_sql(sql_query)
+
+def show_cache_metrics():
+    """Hit counts of the SQL caches shared by all sessions"""
+    sql_cache = get_sql_cache()
+    semantic_cache = get_semantic_cache()
+    if not (sql_cache or semantic_cache):
+        return
+    with st.expander("⚡ Query caches", expanded=False):
+        metric_cols = st.columns(4)
+        if sql_cache:
+            sql_stats = sql_cache.stats()
+            metric_cols[0].metric("Exact/normalized hits", sql_stats['exact_hits'] + sql_stats['normalized_hits'])
+            metric_cols[1].metric("SQL cache misses", sql_stats['misses'])
+        if semantic_cache:
+            semantic_stats = semantic_cache.stats()
+            metric_cols[2].metric("Similar-question hit rate", f"{semantic_stats['hit_rate']:.0%}",
+                                  help=f"{semantic_stats['hits']} hits, {semantic_stats['entries']} indexed questions, "
+                                       f"{semantic_stats['evictions']} evicted")
+            metric_cols[3].metric("Similarity lookup", f"{semantic_stats['avg_lookup_ms']:.2f} ms")
+
 def record_audio():
     """Record audio using microphone with real-time feedback"""
     try:
@@ -730,12 +974,14 @@ def transcribe_audio(audio_data):
         st.error(f"❌ Error transcribing audio: {str(e)}")
         return None
 
-def generate_sql_query(user_question, metadata):
-    """Generate ClickHouse SQL query using Gemini LLM"""
+def generate_sql_query(user_question, on_partial=None, runner=None):
+    """Generate ClickHouse SQL query using Gemini LLM
+    
+    With streaming, ``on_partial`` receives the reply text as it grows and
+    ``runner`` (an EarlyQueryRunner) gets the statement as soon as it is complete.
+    """
     try:
-        import google.generativeai as genai
-        
-        # Configure Gemini
+        # Shared Gemini handle for the saved credentials
         saved_creds = st.session_state.get('saved_credentials', {})
         print(f"DEBUG: Saved credentials keys: {list(saved_creds.keys())}")
         
@@ -743,11 +989,9 @@ def generate_sql_query(user_question, metadata):
         if not api_key:
             return "❌ Error: Gemini API key not found. Please save your credentials first."
         
-        genai.configure(api_key=api_key)
-        
-        # Get the model
+        # Get the model (created once per API key and model, then reused)
         model_name = saved_creds.get('gemini_model', 'gemini-1.5-flash')
-        model = genai.GenerativeModel(model_name)
+        model = get_model(api_key, model_name)
         
         # Debug: Log model configuration
         print(f"DEBUG: Using model: {model_name}")
@@ -755,32 +999,53 @@ def generate_sql_query(user_question, metadata):
         print(f"DEBUG: API key preview: {api_key[:10]}..." if api_key else "No API key")
         print(f"DEBUG: Model object: {model}")
         
-        # Create a simplified schema info (limit size)
-        databases_info = {}
-        for db_name, db_data in metadata.get('databases', {}).items():
-            databases_info[db_name] = {}
-            for schema_name, schema_data in db_data.get('schemas', {}).items():
-                databases_info[db_name][schema_name] = {}
-                for table_name, table_data in schema_data.get('tables', {}).items():
-                    # Only include table name and column count
-                    databases_info[db_name][schema_name][table_name] = {
-                        'column_count': table_data.get('column_count', 0)
-                    }
+        # Include only the tables most relevant to the question so the prompt
+        # size stays bounded regardless of catalog size
+        schema_index = get_schema_index()
+        relevant_tables = prompt_tables(schema_index, user_question, SCHEMA_TOP_K, SCHEMA_MAX_COLUMNS)
         
-        schema_info = json.dumps(databases_info, indent=2)
+        # Compact rendering, trimmed from the least relevant tables to fit the token budget
+        schema_prompt = fit_schema(relevant_tables, SCHEMA_PROMPT_FORMAT, SCHEMA_PROMPT_MAX_TOKENS)
+        schema_info = schema_prompt.text
         
         # Debug: Log the schema info being sent
-        print(f"DEBUG: Schema info length: {len(schema_info)}")
-        print(f"DEBUG: Schema keys: {list(metadata.keys())}")
-        print(f"DEBUG: Simplified schema preview: {schema_info[:200]}...")
+        print(f"DEBUG: Schema info length: {len(schema_info)} chars, ~{schema_prompt.tokens} tokens "
+              f"({SCHEMA_PROMPT_FORMAT}{', ' + schema_prompt.reduction if schema_prompt.reduction else ''})")
+        print(f"DEBUG: Relevant tables ({schema_prompt.tables} of {len(schema_index)}): {list(relevant_tables)[:schema_prompt.tables]}")
+        
+        # Repeated questions over the same schema context reuse the SQL generated before
+        st.session_state.sql_cache_note = None
+        sql_cache = get_sql_cache()
+        version = schema_version(SQL_PROMPT_VERSION, schema_info)
+        # Paraphrases may retrieve other tables, so similar questions match on the whole store's version
+        store = get_metadata_store()
+        store_version = schema_version(SQL_PROMPT_VERSION, store.path, store.revision)
+        st.session_state.last_generated_sql = None
+        if sql_cache:
+            cached_sql = sql_cache.get(user_question, version, model_name)
+            if cached_sql:
+                print(f"DEBUG: SQL cache hit: '{cached_sql}'")
+                st.session_state.last_generated_sql = {'question': user_question, 'version': store_version,
+                                                       'model': model_name, 'sql': cached_sql}
+                return cached_sql
+        semantic_cache = get_semantic_cache()
+        if semantic_cache:
+            match = semantic_cache.get(user_question, store_version, model_name)
+            if match:
+                print(f"DEBUG: Semantic cache hit ({match['similarity']:.3f}): '{match['question']}'")
+                st.session_state.sql_cache_note = (f"♻️ Reused the validated SQL of a similar question: "
+                                                   f"\"{match['question']}\" (similarity {match['similarity']:.2f})")
+                return match['sql']
         
         prompt = f"""
 Generate a ClickHouse SQL query for this question.
 
 Question: {user_question}
 
-Available tables: {schema_info}
+Relevant tables ({schema_prompt.description}):
+{schema_info}
 
+For large tables, filter on the partition or sorting key and avoid unbounded SELECT *.
 Return only the SQL query, no explanations.
 
 SQL Query:
@@ -791,159 +1056,178 @@ SQL Query:
         print(f"DEBUG: Prompt preview: {prompt[:500]}...")
         print(f"DEBUG: User question: '{user_question}'")
         
-        # Generate response
-        response = model.generate_content(prompt)
-        
-        # Debug: Log the raw response
-        print(f"DEBUG: Raw response type: {type(response)}")
-        print(f"DEBUG: Response attributes: {dir(response)}")
-        print(f"DEBUG: Response candidates: {response.candidates if hasattr(response, 'candidates') else 'No candidates'}")
-        print(f"DEBUG: Response parts: {response.parts if hasattr(response, 'parts') else 'No parts'}")
-        
-        # Debug: Check if response has content
-        if hasattr(response, 'candidates') and response.candidates:
-            for i, candidate in enumerate(response.candidates):
-                print(f"DEBUG: Candidate {i}: {candidate}")
-                if hasattr(candidate, 'content'):
-                    print(f"DEBUG: Candidate {i} content: {candidate.content}")
-                    if hasattr(candidate.content, 'parts'):
-                        print(f"DEBUG: Candidate {i} parts: {candidate.content.parts}")
-                        for j, part in enumerate(candidate.content.parts):
-                            print(f"DEBUG: Candidate {i} part {j}: {part}")
-                            if hasattr(part, 'text'):
-                                print(f"DEBUG: Candidate {i} part {j} text: '{part.text}'")
-        
-        # Extract the SQL query from response using robust method
-        sql_query = ""
+        if SQL_STREAMING:
+            # Stream the reply: show tokens as they arrive and hand the first complete
+            # statement to the early runner while the model is still finishing
+            detector = StatementDetector()
+            for text in iter_response_text(model.generate_content(prompt, stream=True)):
+                if runner:
+                    runner.mark('first_token')
+                statement = detector.feed(text)
+                if on_partial:
+                    on_partial(detector.text)
+                if statement and runner:
+                    runner.start(statement)
+            sql_query = detector.text
+            print(f"DEBUG: Streamed text: '{sql_query}'")
+        else:
+            # Generate response
+            response = model.generate_content(prompt)
+        
+            # Debug: Log the raw response
+            print(f"DEBUG: Raw response type: {type(response)}")
+            print(f"DEBUG: Response attributes: {dir(response)}")
+            print(f"DEBUG: Response candidates: {response.candidates if hasattr(response, 'candidates') else 'No candidates'}")
+            print(f"DEBUG: Response parts: {response.parts if hasattr(response, 'parts') else 'No parts'}")
+        
+            # Debug: Check if response has content
+            if hasattr(response, 'candidates') and response.candidates:
+                for i, candidate in enumerate(response.candidates):
+                    print(f"DEBUG: Candidate {i}: {candidate}")
+                    if hasattr(candidate, 'content'):
+                        print(f"DEBUG: Candidate {i} content: {candidate.content}")
+                        if hasattr(candidate.content, 'parts'):
+                            print(f"DEBUG: Candidate {i} parts: {candidate.content.parts}")
+                            for j, part in enumerate(candidate.content.parts):
+                                print(f"DEBUG: Candidate {i} part {j}: {part}")
+                                if hasattr(part, 'text'):
+                                    print(f"DEBUG: Candidate {i} part {j} text: '{part.text}'")
+        
+            # Extract the SQL query from response using robust method
+            sql_query = ""
         
-        try:
-            # Use the same response extraction method as the working metadata extractor
-            texts = []
-            
-            # New SDK shape: response.candidates[*].content.parts[*].text
             try:
-                if hasattr(response, "candidates") and response.candidates:
-                    for cand in response.candidates:
-                        content = getattr(cand, "content", None)
-                        if content and hasattr(content, "parts") and content.parts:
-                            for p in content.parts:
-                                t = getattr(p, "text", None)
-                                if isinstance(t, str) and t.strip():
-                                    texts.append(t.strip())
-            except Exception:
-                pass
+                # Use the same response extraction method as the working metadata extractor
+                texts = []
             
-            # Fallback for older SDK shapes or different response formats
-            if not texts and hasattr(response, "parts") and response.parts:
-                for p in response.parts:
-                    t = getattr(p, "text", None)
-                    if isinstance(t, str) and t.strip():
-                        texts.append(t.strip())
+                # New SDK shape: response.candidates[*].content.parts[*].text
+                try:
+                    if hasattr(response, "candidates") and response.candidates:
+                        for cand in response.candidates:
+                            content = getattr(cand, "content", None)
+                            if content and hasattr(content, "parts") and content.parts:
+                                for p in content.parts:
+                                    t = getattr(p, "text", None)
+                                    if isinstance(t, str) and t.strip():
+                                        texts.append(t.strip())
+                except Exception:
+                    pass
             
-            sql_query = "\n".join(texts).strip()
+                # Fallback for older SDK shapes or different response formats
+                if not texts and hasattr(response, "parts") and response.parts:
+                    for p in response.parts:
+                        t = getattr(p, "text", None)
+                        if isinstance(t, str) and t.strip():
+                            texts.append(t.strip())
             
-            # Debug: Log what we extracted
-            print(f"DEBUG: Raw extracted text: '{sql_query}'")
+                sql_query = "\n".join(texts).strip()
             
-        except Exception as e:
-            print(f"DEBUG: Error in extraction: {str(e)}")
-            return f"❌ Error extracting SQL from response: {str(e)}"
-        
-        # Clean up the SQL query
-        sql_query = sql_query.strip()
+                # Debug: Log what we extracted
+                print(f"DEBUG: Raw extracted text: '{sql_query}'")
+            
+            except Exception as e:
+                print(f"DEBUG: Error in extraction: {str(e)}")
+                return f"❌ Error extracting SQL from response: {str(e)}"
         
         # Debug: Log the extracted SQL
-        print(f"DEBUG: Extracted SQL: '{sql_query}'")
-        print(f"DEBUG: SQL length: {len(sql_query)}")
-        
-        # Remove markdown code blocks if present
-        if sql_query.startswith('```sql'):
-            sql_query = sql_query[6:]
-        if sql_query.startswith('```'):
-            sql_query = sql_query[3:]
-        if sql_query.endswith('```'):
-            sql_query = sql_query[:-3]
-        
-        # Remove any FORMAT clauses
-        if 'FORMAT' in sql_query.upper():
-            sql_query = sql_query.split('FORMAT')[0].strip()
-        
-        # Remove semicolons
-        sql_query = sql_query.rstrip(';')
-        
-        # Remove any extra whitespace and newlines
-        sql_query = ' '.join(sql_query.split())
+        print(f"DEBUG: Extracted SQL: '{sql_query.strip()}'")
+        print(f"DEBUG: SQL length: {len(sql_query.strip())}")
         
-        sql_query = sql_query.strip()
+        # Remove code fences, FORMAT clauses, semicolons and extra whitespace
+        sql_query = clean_generated_sql(sql_query)
         
         # Debug: Log the final SQL
         print(f"DEBUG: Final SQL: '{sql_query}'")
         
+        if sql_query and not sql_query.startswith("ERROR:"):
+            if sql_cache:
+                sql_cache.put(user_question, version, model_name, sql_query)
+            st.session_state.last_generated_sql = {'question': user_question, 'version': store_version,
+                                                   'model': model_name, 'sql': sql_query}
+        
         return sql_query
         
     except Exception as e:
         return f"❌ Error generating SQL: {str(e)}"
 
-def execute_clickhouse_query(sql_query):
-    """Execute ClickHouse SQL query and return results"""
+def lookup_table_statistics(database, table):
+    """Statistics of a stored table; unqualified names resolve to the connection's database first"""
+    store = get_metadata_store()
+    matches = store.find_tables(table)
+    default_database = st.session_state.get('saved_credentials', {}).get('database', 'default')
+    for db_name, schema_name, table_name in sorted(matches, key=lambda key: key[0] != default_database):
+        if database is None or db_name == database:
+            return (store.get_table(db_name, schema_name, table_name) or {}).get('statistics')
+    return None
+
+def show_query_cost(sql_query):
+    """Warn before running a generated query that may scan more than the guardrail limits"""
+    estimate = estimate_query_cost(sql_query, lookup_table_statistics,
+                                   QUERY_MAX_ROWS_TO_READ, QUERY_MAX_BYTES_TO_READ)
+    if estimate.warnings:
+        tables = ", ".join(f"{name} ({format_count(rows)} rows, {format_bytes(size)})"
+                           for name, rows, size in estimate.tables)
+        st.warning(f"⚠️ This query {'; '.join(estimate.warnings)}. Tables: {tables}. "
+                   f"ClickHouse will stop it if it reads past the limits.")
+
+def execute_clickhouse_query(sql_query, result_format=None):
+    """Execute ClickHouse SQL query and return results
+    
+    result_format selects the columnar Arrow path ('arrow') or the row tuple
+    path ('rows'); it defaults to the format chosen in the chat interface.
+    """
+    # Get credentials from session state
+    creds = st.session_state.get('saved_credentials', {})
+    if not creds:
+        return "❌ Error: Database credentials not found. Please save your credentials first."
+    
+    result_format = result_format or st.session_state.get('result_format', 'arrow')
+    return run_guarded_query(query_connection_params(creds), sql_query, result_format)
+
+def query_connection_params(creds):
+    """Connection parameters for the shared pool from saved credentials"""
+    return {
+        'host': creds.get('host', 'localhost'),
+        'port': int(creds.get('port', 8123)),
+        'username': creds.get('user', 'default'),
+        'password': creds.get('password', ''),
+        'database': creds.get('database', 'default'),
+        'secure': creds.get('secure', False)
+    }
+
+def run_guarded_query(params, sql_query, result_format):
+    """Run a generated query with the guardrail settings; safe to call off the script thread"""
     try:
-        import clickhouse_connect
-        
-        # Get credentials from session state
-        creds = st.session_state.get('saved_credentials', {})
-        if not creds:
-            return "❌ Error: Database credentials not found. Please save your credentials first."
-        
-        # Connect to ClickHouse
-        client = clickhouse_connect.get_client(
-            host=creds.get('host', 'localhost'),
-            port=int(creds.get('port', 8123)),
-            username=creds.get('user', 'default'),
-            password=creds.get('password', ''),
-            database=creds.get('database', 'default'),
-            secure=creds.get('secure', False)
-        )
-        
-        # Execute query
-        result = client.query(sql_query)
-        
-        # Convert result to DataFrame - handle ClickHouse result properly
-        try:
-            # Try to get result rows and column names
-            if hasattr(result, 'result_rows') and result.result_rows:
-                # Get column names
-                if hasattr(result, 'column_names') and result.column_names:
-                    column_names = [desc[0] for desc in result.column_names]
-                else:
-                    # Generate column names if not available
-                    column_names = [f'col_{i}' for i in range(len(result.result_rows[0]))]
-                
-                # Create DataFrame
-                df = pd.DataFrame(result.result_rows, columns=column_names)
-            else:
-                # Empty result
-                df = pd.DataFrame()
-            
-            return df
-            
-        except Exception as df_error:
-            # If DataFrame conversion fails, return the raw result
-            return f"Query executed successfully but couldn't convert to DataFrame: {str(df_error)}"
+        # Check a client out of the process-wide connection pool
+        with get_pool().connection(**params) as client:
+            # Execute query and convert the result to a DataFrame; the server
+            # aborts it if it reads more than the guardrail limits
+            settings = guardrail_settings(QUERY_MAX_ROWS_TO_READ, QUERY_MAX_BYTES_TO_READ)
+            return query_dataframe(client, sql_query, result_format, settings=settings)
         
     except Exception as e:
         return f"❌ Error executing query: {str(e)}"
 
-def generate_chat_response(prompt: str) -> str:
+def explain_query(params, sql_query):
+    """Validate a query with EXPLAIN; returns the error message, or None when it is valid"""
+    try:
+        with get_pool().connection(**params) as client:
+            client.query(f"EXPLAIN {sql_query}")
+        return None
+    except Exception as e:
+        return str(e)
+
+def generate_chat_response(prompt: str, on_partial=None, runner=None) -> str:
     """Generate a response for the chat interface using LLM-powered SQL generation"""
     # Check if we have metadata and credentials
-    if 'metadata' not in st.session_state or not st.session_state.get('extraction_success'):
+    if not has_metadata():
         return "❌ No database schema available. Please generate schema from the Database Connection tab first."
     
     if not st.session_state.get('saved_credentials'):
         return "❌ No database credentials saved. Please save your credentials in the Database Connection tab first."
     
     # Generate SQL query using LLM
-    sql_query = generate_sql_query(prompt, st.session_state.metadata)
+    sql_query = generate_sql_query(prompt, on_partial=on_partial, runner=runner)
     
     if sql_query.startswith("❌"):
         # Error occurred
@@ -954,11 +1238,12 @@ def generate_chat_response(prompt: str) -> str:
         return sql_query
     
     # Debug: Show the metadata structure being sent to LLM
+    databases = get_metadata_store().list_databases()
     debug_info = f"""
 **Debug Info:**
-- Metadata keys: {list(st.session_state.metadata.keys())}
-- Databases found: {list(st.session_state.metadata.get('databases', {}).keys())}
-- Total databases: {len(st.session_state.metadata.get('databases', {}))}
+- Metadata store: {get_metadata_store().path}
+- Databases found: {databases}
+- Total databases: {len(databases)}
 """
     
     # Return SQL query with debug info
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Table Statistics
+
+Helpers for the size and layout statistics the extractor stores with each
+table (``table_info['statistics']``): row count, compressed and
+uncompressed bytes, active parts and partitions, engine, and the sorting,
+partition, primary and sampling keys.
+
+- ``prompt_statistics`` condenses them for NL-to-SQL prompts, so the model
+  can tell a small dimension table from a huge fact table and filter on the
+  right keys.
+- ``estimate_query_cost`` looks up the tables a generated query reads and
+  warns before it runs when it may scan more than the configured limits.
+- ``guardrail_settings`` turns the same limits into ClickHouse settings, so
+  the server stops a query that actually reads too much.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Keys of table_info['statistics']
+STATISTICS_FIELDS = ('engine', 'sorting_key', 'partition_key', 'primary_key', 'sampling_key', 'rows',
+                     'compressed_bytes', 'uncompressed_bytes', 'parts', 'partitions')
+
+# Tables after FROM or JOIN, optionally qualified with a database and quoted
+_TABLE_REFERENCE = re.compile(
+    r'\b(?:FROM|JOIN)\s+(?:[`"]?(\w+)[`"]?\s*\.\s*)?[`"]?(\w+)[`"]?',
+    re.IGNORECASE
+)
+
+
+def format_count(value: Optional[int]) -> str:
+    """Human-readable count, e.g. 5.2B."""
+    if value is None:
+        return "unknown"
+    for threshold, suffix in ((1e12, 'T'), (1e9, 'B'), (1e6, 'M'), (1e3, 'K')):
+        if value >= threshold:
+            return f"{value / threshold:.1f}{suffix}"
+    return str(value)
+
+
+def format_bytes(value: Optional[int]) -> str:
+    """Human-readable byte size, e.g. 1.2 GiB."""
+    if value is None:
+        return "unknown"
+    for power, unit in ((4, 'TiB'), (3, 'GiB'), (2, 'MiB'), (1, 'KiB')):
+        if value >= 1024 ** power:
+            return f"{value / 1024 ** power:.1f} {unit}"
+    return f"{value} B"
+
+
+def prompt_statistics(statistics: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compact statistics for an NL-to-SQL prompt; empty keys are left out."""
+    if not statistics:
+        return {}
+    summary = {
+        'rows': statistics.get('rows'),
+        'size': format_bytes(statistics.get('compressed_bytes')) if statistics.get('compressed_bytes') else None,
+        'engine': statistics.get('engine'),
+        'sorting_key': statistics.get('sorting_key'),
+        'partition_key': statistics.get('partition_key')
+    }
+    return {key: value for key, value in summary.items() if value not in (None, '')}
+
+
+def referenced_tables(sql_query: str) -> List[Tuple[Optional[str], str]]:
+    """(database or None, table) for each table read after FROM or JOIN, in order."""
+    references = []
+    for database, table in _TABLE_REFERENCE.findall(sql_query):
+        reference = (database or None, table)
+        if table.upper() != 'SELECT' and reference not in references:
+            references.append(reference)
+    return references
+
+
+@dataclass
+class QueryCostEstimate:
+    """Upper bound of what a query reads, assuming full scans of its tables."""
+    tables: List[Tuple[str, Optional[int], Optional[int]]] = field(default_factory=list)  # (table, rows, bytes)
+    rows: int = 0
+    uncompressed_bytes: int = 0
+    unknown_tables: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+
+def estimate_query_cost(sql_query: str,
+                        lookup: Callable[[Optional[str], str], Optional[Dict[str, Any]]],
+                        max_rows: int = 0, max_bytes: int = 0) -> QueryCostEstimate:
+    """Estimate the rows and bytes ``sql_query`` may read from table statistics.
+
+    ``lookup(database, table)`` returns a table's statistics or None. Limits
+    of 0 are disabled. The estimate is pessimistic: filters, primary key
+    pruning and aggregate shortcuts can make the real read much smaller,
+    which is why the server-side limits from guardrail_settings decide
+    whether the query actually runs.
+    """
+    estimate = QueryCostEstimate()
+    for database, table in referenced_tables(sql_query):
+        name = f"{database}.{table}" if database else table
+        statistics = lookup(database, table)
+        if not statistics:
+            estimate.unknown_tables.append(name)
+            continue
+        rows = statistics.get('rows')
+        size = statistics.get('uncompressed_bytes')
+        estimate.tables.append((name, rows, size))
+        estimate.rows += rows or 0
+        estimate.uncompressed_bytes += size or 0
+
+    unfiltered = not re.search(r'\b(WHERE|PREWHERE|LIMIT|SAMPLE)\b', sql_query, re.IGNORECASE)
+    if max_rows and estimate.rows > max_rows:
+        estimate.warnings.append(f"may read up to {format_count(estimate.rows)} rows "
+                                 f"(limit {format_count(max_rows)})")
+    if max_bytes and estimate.uncompressed_bytes > max_bytes:
+        estimate.warnings.append(f"may read up to {format_bytes(estimate.uncompressed_bytes)} "
+                                 f"(limit {format_bytes(max_bytes)})")
+    if estimate.warnings and unfiltered:
+        estimate.warnings.append("the query has no WHERE, PREWHERE, SAMPLE or LIMIT clause")
+    return estimate
+
+
+def guardrail_settings(max_rows: int = 0, max_bytes: int = 0) -> Dict[str, Any]:
+    """ClickHouse settings that abort a query reading more than the limits (0 disables a limit)."""
+    settings = {}
+    if max_rows:
+        settings['max_rows_to_read'] = max_rows
+    if max_bytes:
+        settings['max_bytes_to_read'] = max_bytes
+    if settings:
+        settings['read_overflow_mode'] = 'throw'
+    return settings
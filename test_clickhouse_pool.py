@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for the ClickHouse connection pool's idle eviction, with clients
+replaced by stand-ins that record whether they were closed.
+"""
+
+import time
+
+import clickhouse_pool
+from clickhouse_pool import ClickHousePool
+
+
+class FakeClient:
+    def __init__(self, **params):
+        self.params = params
+        self.closed = False
+
+    def ping(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+def fake_pool(monkeypatch, **kwargs) -> ClickHousePool:
+    monkeypatch.setattr(clickhouse_pool.clickhouse_connect, 'get_client', lambda **params: FakeClient(**params))
+    return ClickHousePool(**kwargs)
+
+
+def test_acquire_evicts_idle_clients_of_other_credentials(monkeypatch):
+    pool = fake_pool(monkeypatch, idle_timeout=0.05, reap_interval=0)
+    stale = pool.acquire(host='a')
+    pool.release(stale)
+    time.sleep(0.1)
+    fresh = pool.acquire(host='b')
+    assert stale.closed
+    assert not fresh.closed
+    assert pool.stats()['idle'] == 0
+    pool.release(fresh)
+    pool.close_all()
+
+
+def test_reaper_closes_idle_clients_without_further_use(monkeypatch):
+    pool = fake_pool(monkeypatch, idle_timeout=0.05, reap_interval=0.02)
+    client = pool.acquire(host='a')
+    pool.release(client)
+    deadline = time.monotonic() + 2
+    while not client.closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.closed
+    assert pool.stats()['idle'] == 0
+    pool.close_all()
+
+
+def test_recent_clients_are_reused(monkeypatch):
+    pool = fake_pool(monkeypatch, idle_timeout=60)
+    client = pool.acquire(host='a')
+    pool.release(client)
+    assert pool.acquire(host='a') is client
+    assert pool.stats()['reused'] == 1
+    pool.close_all()
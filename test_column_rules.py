@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Tests for the column rules: well-known names get their definitions locally,
+and names a rule would describe wrongly are left to the LLM.
+"""
+
+from column_rules import ColumnRuleEngine
+
+
+def define(name: str, column_type: str, table: str = 'events'):
+    return ColumnRuleEngine().define({'name': name, 'type': column_type}, table)
+
+
+def test_well_known_columns():
+    assert define('id', 'UInt64', 'orders') == "Unique identifier of each record in orders."
+    assert define('created_at', 'DateTime') == "Timestamp when the record was created."
+    assert define('user_id', 'UInt64', 'orders') == "Identifier of the related user."
+    assert define('shipped_at', 'DateTime') == "Timestamp when the record was shipped."
+    assert define('paid_at', 'DateTime') == "Timestamp when the record was paid."
+    assert define('orders_count', 'UInt32') == "Number of orders."
+    assert define('num_users', 'UInt32') == "Number of users."
+
+
+def test_own_identifier_uses_self_definition():
+    assert define('order_id', 'UInt64', 'orders') == "Unique identifier of each order record."
+    assert define('category_id', 'UInt64', 'categories') == "Unique identifier of each category record."
+    assert define('address_id', 'UInt64', 'addresses') == "Unique identifier of each address record."
+
+
+def test_key_columns_go_to_llm():
+    for name in ('api_key', 'partition_key', 'idempotency_key', 'hash_key'):
+        assert define(name, 'String') is None, name
+
+
+def test_non_verb_times_go_to_llm():
+    for name in ('response_time', 'token_time', 'speed_time'):
+        assert define(name, 'DateTime') is None, name
+
+
+def test_singular_counts_go_to_llm():
+    for name in ('item_count', 'status_count', 'retry_cnt'):
+        assert define(name, 'UInt32') is None, name
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Tests for extraction jobs: resuming from checkpoints, dead-process
+detection, cancellation, results assembled from checkpoints and pruning of
+old jobs. ClickHouse clients and extractions are replaced by stand-ins.
+"""
+
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+
+import clickhouse_pool
+import extraction_jobs
+from clickhouse_metadata_extractor import ClickHouseMetadataExtractor, ExtractionCancelled, ExtractorConfig
+from extraction_jobs import ExtractionJobRunner, JobCheckpoint, JobStore
+
+
+class FakeClient:
+    def ping(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def config() -> ExtractorConfig:
+    return ExtractorConfig.from_dict({'host': 'jobs-test', 'llmEnabled': False, 'workers': 1})
+
+
+def sample_metadata():
+    return {
+        'databases': {
+            'shop': {
+                'schemas': {
+                    'shop': {
+                        'tables': {
+                            'orders': {'columns': [{'name': 'order_id', 'type': 'UInt64'}], 'column_count': 1},
+                            'customers': {'columns': [], 'column_count': 0,
+                                          'statistics': {'engine': 'MergeTree', 'rows': 3}}
+                        }
+                    }
+                }
+            },
+            'empty': {'schemas': {'empty': {'tables': {}}}}
+        }
+    }
+
+
+def test_resume_processes_only_missing_tables(monkeypatch, tmp_path):
+    monkeypatch.setattr(clickhouse_pool.clickhouse_connect, 'get_client', lambda **params: FakeClient())
+    store = JobStore(str(tmp_path / 'jobs.sqlite'))
+    store.start_job('job', 'test')
+    store.save_table('job', 'shop', 'shop', 'orders', {'columns': [], 'column_count': 0})
+    extractor = ClickHouseMetadataExtractor(config(), checkpoint=JobCheckpoint(store, 'job'))
+    processed = []
+
+    def process_table(task, client=None):
+        processed.append(task[2])
+        future = Future()
+        future.set_result({'columns': [], 'column_count': 0})
+        return future
+
+    monkeypatch.setattr(extractor, '_process_table', process_table)
+    tasks = [('shop', 'shop', 'orders', None), ('shop', 'shop', 'customers', None)]
+    results = extractor.process_tables(tasks)
+    extractor.close()
+    assert processed == ['customers']
+    assert len(results) == 2
+    assert set(store.load_tables('job')) == {('shop', 'shop', 'orders'), ('shop', 'shop', 'customers')}
+    store.close()
+
+
+def test_job_of_a_dead_process_is_interrupted(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite'))
+    store.start_job('job', 'test')
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    with store._lock:
+        store._conn.execute("UPDATE jobs SET pid = ? WHERE job_id = 'job'", (process.pid,))
+        store._conn.commit()
+    assert store.get_job('job')['status'] == 'interrupted'
+    store.close()
+
+
+def test_cancel_stops_a_job_and_allows_resume(monkeypatch, tmp_path):
+    started = threading.Event()
+
+    def extract(config, previous=None, progress_callback=None, cancel_event=None, checkpoint=None):
+        started.set()
+        cancel_event.wait(5)
+        raise ExtractionCancelled()
+
+    monkeypatch.setattr(extraction_jobs.ClickHouseMetadataExtractor, 'extract', extract)
+    runner = ExtractionJobRunner(JobStore(str(tmp_path / 'jobs.sqlite')))
+    job_id = runner.submit(config())
+    assert started.wait(5)
+    runner.cancel(job_id)
+    runner._threads[job_id].join(5)
+    assert runner.status(job_id)['status'] == 'cancelled'
+    assert runner.result(job_id) is None
+
+    started.clear()
+    assert runner.resume(job_id, config()) == job_id
+    assert started.wait(5)
+    runner.cancel(job_id)
+    runner._threads[job_id].join(5)
+    runner.store.close()
+
+
+def test_result_is_assembled_from_checkpoints(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite'))
+    store.start_job('job', 'test')
+    # Checkpointed before statistics were added; the final table info replaces it
+    store.save_table('job', 'shop', 'shop', 'customers', {'columns': [], 'column_count': 0})
+    metadata = sample_metadata()
+    store.finish_job('job', 'completed', metadata=metadata)
+    with store._lock:
+        result = store._conn.execute("SELECT result FROM jobs WHERE job_id = 'job'").fetchone()[0]
+    assert 'order_id' not in result
+    assembled = store.get_result('job')
+    assert assembled == metadata
+    assert list(assembled['databases']['shop']['schemas']['shop']['tables']) == ['orders', 'customers']
+    store.close()
+
+
+def test_rerunning_a_completed_job_starts_over(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite'))
+    store.start_job('job', 'test')
+    store.finish_job('job', 'completed', metadata=sample_metadata())
+    store.start_job('job', 'test')
+    assert store.load_tables('job') == {}
+    assert store.get_result('job') is None
+    store.close()
+
+
+def test_old_completed_jobs_are_pruned(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite'), keep_completed=2)
+    store.start_job('failed', 'test')
+    store.save_table('failed', 'shop', 'shop', 'orders', {'columns': []})
+    store.finish_job('failed', 'failed', error='boom')
+    for job_id in ('first', 'second', 'third'):
+        store.start_job(job_id, 'test')
+        store.finish_job(job_id, 'completed', metadata=sample_metadata())
+    assert {job['job_id'] for job in store.list_jobs()} == {'failed', 'second', 'third'}
+    assert store.load_tables('first') == {}
+    assert store.load_tables('failed')
+    assert store.get_result('third') == sample_metadata()
+    store.close()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for ExtractorConfig: values are converted and trimmed, except secrets,
+which are used verbatim, and command line options override a config file.
+"""
+
+import argparse
+
+from clickhouse_metadata_extractor import _ARG_SETTINGS, _ARG_SWITCHES, ExtractorConfig, apply_args
+
+
+def test_secrets_are_not_stripped(monkeypatch):
+    monkeypatch.setenv('CLICKHOUSE_PASSWORD', ' secret ')
+    monkeypatch.setenv('GEMINI_API_KEY', 'key ')
+    monkeypatch.setenv('CLICKHOUSE_HOST', ' localhost ')
+    config = ExtractorConfig.from_env()
+    assert config.password == ' secret '
+    assert config.gemini_api_key == 'key '
+    assert config.host == 'localhost'
+
+
+def test_from_dict_keeps_secrets_verbatim():
+    config = ExtractorConfig.from_dict({'password': ' p ', 'geminiApiKey': ' k', 'port': '9000'})
+    assert config.password == ' p '
+    assert config.gemini_api_key == ' k'
+    assert config.port == 9000
+
+
+def cli_args(**given) -> argparse.Namespace:
+    args = {arg: None for arg in _ARG_SETTINGS}
+    args.update({arg: False for arg in _ARG_SWITCHES})
+    args.update(given)
+    return argparse.Namespace(**args)
+
+
+def test_config_file_keys_and_list_values():
+    config = ExtractorConfig.from_dict({
+        'targetedSchemas': ['shop', ' analytics '],
+        'llmBatchTokenBudget': 2000,
+        'llmMaxConcurrency': 2,
+        'definitionCachePath': '/tmp/cache.sqlite',
+        'profileTopK': 3,
+        'outputFile': 'out.json'
+    })
+    assert config.targeted_schemas == ['shop', 'analytics']
+    assert config.llm_batch_token_budget == 2000
+    assert config.llm_max_concurrency == 2
+    assert config.definition_cache_path == '/tmp/cache.sqlite'
+    assert config.profile_top_k == 3
+    assert config.output_file == 'out.json'
+
+
+def test_command_line_overrides_only_given_options():
+    config = ExtractorConfig.from_dict({'host': 'file-host', 'port': 9000, 'workers': 2, 'secure': True})
+    apply_args(config, cli_args(host='cli-host', port='8443', target_tables='a, b', no_table_dedup=True))
+    assert config.host == 'cli-host'
+    assert config.port == 8443
+    assert config.target_tables == ['a', 'b']
+    assert config.table_dedup is False
+    assert config.workers == 2
+    assert config.secure is True
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for the LLM dispatcher: token bucket bursts, and retries of quota
+errors with backoff, on a fake clock so nothing actually sleeps.
+"""
+
+import types
+
+import pytest
+
+import llm_dispatcher
+from llm_dispatcher import LLMDispatcher, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+class FlakyModel:
+    """Raises the given errors in turn, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_dispatcher, 'time', types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    monkeypatch.setattr(llm_dispatcher.random, 'uniform', lambda low, high: 0.0)
+    return clock
+
+
+def test_bucket_capacity_defaults_to_a_tenth_of_the_rate(clock):
+    assert TokenBucket(60).capacity == 6
+    assert TokenBucket(5).capacity == 1
+    assert TokenBucket(60, capacity=20).capacity == 20
+    dispatcher = LLMDispatcher(FlakyModel(), requests_per_minute=120, tokens_per_minute=60000, burst_seconds=30)
+    assert dispatcher.request_bucket.capacity == 60
+    assert dispatcher.token_bucket.capacity == 30000
+    dispatcher.close()
+
+
+def test_bucket_admits_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(60)
+    for _ in range(6):
+        bucket.acquire()
+    assert clock.slept == 0
+    bucket.acquire()
+    assert clock.slept == pytest.approx(1.0)
+
+
+def test_requests_above_capacity_leave_the_bucket_in_debt(clock):
+    bucket = TokenBucket(480)
+    bucket.acquire(96)
+    assert clock.slept == 0
+    # 48 tokens of debt plus one token at 8 tokens per second
+    bucket.acquire(1)
+    assert clock.slept == pytest.approx(6.125)
+
+
+def test_quota_errors_are_retried_with_exponential_backoff(clock):
+    model = FlakyModel(Exception('429 Resource exhausted'), Exception('429 Resource exhausted'))
+    dispatcher = LLMDispatcher(model, requests_per_minute=60)
+    assert dispatcher.generate('prompt') == 'ok'
+    assert model.calls == 3
+    # 1s after the first error, 2s after the second
+    assert clock.slept == pytest.approx(3.0)
+    assert dispatcher.stats() == {'calls': 1, 'throttled': 2, 'in_flight': 0}
+    # Lowered twice by 30%, then raised by 5% on success
+    assert dispatcher.request_bucket.rate_per_minute == pytest.approx(60 * (0.7 * 0.7 + 0.05))
+    dispatcher.close()
+
+
+def test_server_suggested_delay_is_respected(clock):
+    model = FlakyModel(Exception('429 Quota exceeded, please retry in 30s'))
+    dispatcher = LLMDispatcher(model)
+    assert dispatcher.generate('prompt') == 'ok'
+    assert clock.slept == pytest.approx(30.0)
+    dispatcher.close()
+
+
+def test_other_errors_and_exhausted_retries_are_raised(clock):
+    dispatcher = LLMDispatcher(FlakyModel(ValueError('bad request')))
+    with pytest.raises(ValueError):
+        dispatcher.generate('prompt')
+    assert dispatcher.stats()['throttled'] == 0
+    dispatcher.close()
+
+    model = FlakyModel(*[Exception('ResourceExhausted') for _ in range(3)])
+    dispatcher = LLMDispatcher(model, max_retries=2)
+    with pytest.raises(Exception, match='ResourceExhausted'):
+        dispatcher.generate('prompt')
+    assert model.calls == 3
+    dispatcher.close()
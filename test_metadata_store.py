@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the metadata store: a snapshot imported into the store is exported
+back unchanged, including fields the extractor wrote as None.
+"""
+
+import json
+import os
+
+from metadata_store import MetadataStore
+
+
+def sample_metadata():
+    return {
+        'databases': {
+            'shop': {
+                'schemas': {
+                    'shop': {
+                        'tables': {
+                            'orders': {
+                                'columns': [
+                                    {'name': 'order_id', 'type': 'UInt64', 'default_type': '',
+                                     'default_expression': None, 'comment': '', 'codec_expression': None,
+                                     'ttl_expression': None, 'ai_definition': 'Unique identifier of each order.'},
+                                    {'name': 'status', 'type': 'LowCardinality(String)', 'default_type': '',
+                                     'default_expression': '', 'comment': None, 'codec_expression': '',
+                                     'ttl_expression': '',
+                                     'profile': {'distinct': 3, 'top_values': ['new', 'paid']}},
+                                ],
+                                'column_count': 2,
+                                'uuid': '00000000-0000-0000-0000-000000000001',
+                                'metadata_modification_time': '2024-01-01 00:00:00',
+                                'statistics': {'engine': 'MergeTree', 'rows': 10}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+
+def test_import_export_round_trip(tmp_path):
+    store = MetadataStore(str(tmp_path / 'store.sqlite'))
+    metadata = sample_metadata()
+    store.replace_metadata(metadata)
+    assert store.export_metadata() == metadata
+    store.close()
+
+
+def test_json_round_trip(tmp_path):
+    source = str(tmp_path / 'in.json')
+    target = str(tmp_path / 'out.json')
+    with open(source, 'w', encoding='utf-8') as f:
+        json.dump(sample_metadata(), f)
+    store = MetadataStore(str(tmp_path / 'store.sqlite'))
+    store.import_json(source)
+    store.export_json(target)
+    with open(target, 'r', encoding='utf-8') as f:
+        assert json.load(f) == sample_metadata()
+    store.close()
+
+
+def test_setting_an_absent_field(tmp_path):
+    store = MetadataStore(str(tmp_path / 'store.sqlite'))
+    store.replace_metadata(sample_metadata())
+    store.update_column('shop', 'shop', 'orders', 'status', ai_definition='Order status.')
+    assert store.get_table('shop', 'shop', 'orders')['columns'][1]['ai_definition'] == 'Order status.'
+    columns = store.get_table('shop', 'shop', 'orders')['columns']
+    columns[0]['ai_definition'] = None
+    store.update_columns('shop', 'shop', 'orders', columns)
+    stored = store.get_table('shop', 'shop', 'orders')['columns']
+    assert stored[0]['ai_definition'] is None
+    assert stored[1]['ai_definition'] == 'Order status.'
+    store.close()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for the similar-question cache: paraphrases reuse validated SQL, while
+questions with other literals or the opposite polarity do not.
+"""
+
+from semantic_cache import SemanticCache, question_polarity
+
+
+def cache_with(question: str) -> SemanticCache:
+    cache = SemanticCache()
+    cache.add(question, 'v1', 'model', 'SELECT 1')
+    return cache
+
+
+def test_paraphrase_hits():
+    cache = cache_with("revenue by month")
+    assert cache.get("monthly revenue", 'v1', 'model')['sql'] == 'SELECT 1'
+    assert cache.get("Show me revenue by month please", 'v1', 'model') is not None
+
+
+def test_other_literals_miss():
+    cache = cache_with("top 10 customers by revenue")
+    assert cache.get("top 20 customers by revenue", 'v1', 'model') is None
+
+
+def test_prefixed_antonym_misses():
+    cache = cache_with("Show revenue for active premium customers in the electronics category")
+    assert cache.get("Show revenue for inactive premium customers in the electronics category", 'v1', 'model') is None
+
+
+def test_negation_misses():
+    cache = cache_with("List users who placed orders and paid with credit card")
+    assert cache.get("List users who placed orders and never paid with credit card", 'v1', 'model') is None
+    cache = cache_with("orders with a discount")
+    assert cache.get("orders without a discount", 'v1', 'model') is None
+    cache = cache_with("orders that are paid")
+    assert cache.get("orders that aren't paid", 'v1', 'model') is None
+
+
+def test_question_polarity():
+    assert question_polarity("users who never paid") == ('never',)
+    assert question_polarity("orders that aren't shipped") == ('not',)
+    assert question_polarity("inactive users") == ('inactive',)
+    assert question_polarity("revenue by month") == ()
+
+
+def test_default_threshold():
+    assert SemanticCache().threshold >= 0.95
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for snapshot diffs: added, removed and altered databases, tables and
+columns, with AI definitions left out of the comparison.
+"""
+
+import json
+
+from snapshot_diff import diff_files, diff_metadata
+
+
+def column(name, column_type, **fields):
+    return {'name': name, 'type': column_type, 'default_type': '', 'default_expression': '',
+            'comment': '', 'codec_expression': '', 'ttl_expression': '', **fields}
+
+
+def snapshot(tables):
+    metadata = {'databases': {}}
+    for (database, table), columns in tables.items():
+        metadata['databases'].setdefault(database, {'schemas': {database: {'tables': {}}}})
+        metadata['databases'][database]['schemas'][database]['tables'][table] = {'columns': columns}
+    return metadata
+
+
+OLD = snapshot({
+    ('shop', 'orders'): [column('order_id', 'UInt64'), column('amount', 'Float32'), column('note', 'String')],
+    ('shop', 'users'): [column('user_id', 'UInt64', ai_definition='Old definition.')],
+    ('shop', 'legacy'): [column('id', 'UInt64')],
+    ('archive', 'events'): [column('event_id', 'UInt64')],
+})
+NEW = snapshot({
+    ('shop', 'orders'): [column('order_id', 'UInt64'), column('amount', 'Float64'),
+                         column('note', 'String', comment='Free text'), column('status', 'String')],
+    ('shop', 'users'): [column('user_id', 'UInt64', ai_definition='New definition.')],
+    ('shop', 'payments'): [column('payment_id', 'UInt64')],
+    ('analytics', 'sessions'): [column('session_id', 'UUID')],
+})
+
+
+def test_added_removed_and_altered_tables():
+    diff = diff_metadata(OLD, NEW)
+    assert diff.databases_added == ['analytics']
+    assert diff.databases_removed == ['archive']
+    assert diff.tables_added == [('shop', 'shop', 'payments'), ('analytics', 'analytics', 'sessions')]
+    assert sorted(diff.tables_removed) == [('archive', 'archive', 'events'), ('shop', 'shop', 'legacy')]
+    # Only the AI definition of users changed
+    assert diff.tables_unchanged == 1
+    [change] = diff.tables_altered
+    assert (change.database, change.table) == ('shop', 'orders')
+    assert change.columns_added == [('status', 'String')]
+    assert change.columns_removed == []
+    assert change.type_changes == [('amount', 'Float32', 'Float64')]
+    assert change.columns_modified == ['note']
+    assert not change.reordered
+
+
+def test_removed_and_reordered_columns():
+    old = snapshot({('shop', 'orders'): [column('a', 'UInt8'), column('b', 'UInt8'), column('c', 'UInt8')]})
+    new = snapshot({('shop', 'orders'): [column('c', 'UInt8'), column('a', 'UInt8')]})
+    [change] = diff_metadata(old, new).tables_altered
+    assert change.columns_removed == [('b', 'UInt8')]
+    assert change.reordered
+    assert diff_metadata(old, new).summary()['columns_removed'] == 1
+
+
+def test_identical_snapshots_have_no_changes():
+    diff = diff_metadata(OLD, OLD)
+    assert not diff.has_changes
+    assert diff.tables_unchanged == 4
+    assert diff.rows() == []
+
+
+def test_diff_files(tmp_path):
+    old_file = tmp_path / 'old.json'
+    new_file = tmp_path / 'new.json'
+    old_file.write_text(json.dumps(OLD, indent=2), encoding='utf-8')
+    new_file.write_text(json.dumps(NEW, indent=2), encoding='utf-8')
+    assert diff_files(str(old_file), str(new_file)).to_dict() == diff_metadata(OLD, NEW).to_dict()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for snapshot I/O: the streaming JSON writer matches json.dump, and
+binary snapshots round-trip, including files written in the version 1 layout.
+"""
+
+import json
+
+import pytest
+
+from snapshot_io import (
+    BINARY_FORMAT_NAME,
+    SnapshotReader,
+    SnapshotWriter,
+    convert_snapshot,
+    load_snapshot,
+    pack_snapshot,
+    save_snapshot,
+    unpack_snapshot,
+)
+
+
+def sample_metadata():
+    return {
+        'databases': {
+            'shop': {
+                'schemas': {
+                    'shop': {
+                        'tables': {
+                            'orders': {
+                                'columns': [
+                                    {'name': 'order_id', 'type': 'UInt64', 'comment': '', 'ttl_expression': None,
+                                     'ai_definition': 'Unique identifier of each order.'},
+                                    {'name': 'status', 'type': 'LowCardinality(String)', 'comment': 'Stätus',
+                                     'ttl_expression': '',
+                                     'profile': {'distinct': 3, 'top_values': ['new', 'paid']}},
+                                ],
+                                'column_count': 2,
+                                'statistics': {'engine': 'MergeTree', 'rows': 10}
+                            },
+                            'empty': {'columns': [], 'column_count': 0}
+                        }
+                    }
+                }
+            },
+            'analytics': {'schemas': {'analytics': {'tables': {}}}}
+        }
+    }
+
+
+def test_binary_round_trip():
+    pytest.importorskip('msgpack')
+    metadata = sample_metadata()
+    unpacked = unpack_snapshot(pack_snapshot(metadata))
+    assert unpacked == metadata
+    columns = unpacked['databases']['shop']['schemas']['shop']['tables']['orders']['columns']
+    assert [list(column) for column in columns] == [list(column) for column in
+                                                    metadata['databases']['shop']['schemas']['shop']
+                                                    ['tables']['orders']['columns']]
+
+
+def test_reads_version_1_snapshots():
+    msgpack = pytest.importorskip('msgpack')
+    # Version 1 stored string-only columns as string ids per field, -1 for a missing field
+    strings = ['shop', 'orders', 'name', 'type', 'comment', 'order_id', 'UInt64', 'status', 'String', 'Status']
+    document = {
+        'format': BINARY_FORMAT_NAME,
+        'version': 1,
+        'strings': strings,
+        'databases': [[0, [[0, [[1, {'columns': None, 'column_count': 2}, [2, 3, 4], [[5, 7], [6, 8], [-1, 9]]]]]]]]
+    }
+    assert unpack_snapshot(msgpack.packb(document, use_bin_type=True)) == {
+        'databases': {'shop': {'schemas': {'shop': {'tables': {'orders': {
+            'columns': [{'name': 'order_id', 'type': 'UInt64'},
+                        {'name': 'status', 'type': 'String', 'comment': 'Status'}],
+            'column_count': 2
+        }}}}}}
+    }
+
+
+def test_rejects_unknown_versions():
+    msgpack = pytest.importorskip('msgpack')
+    data = msgpack.packb({'format': BINARY_FORMAT_NAME, 'version': 99, 'strings': [], 'databases': []})
+    with pytest.raises(ValueError):
+        unpack_snapshot(data)
+
+
+def test_writer_matches_json_dump(tmp_path):
+    target = tmp_path / 'snapshot.json'
+    metadata = sample_metadata()
+    with SnapshotWriter(str(target)) as writer:
+        for database, db_info in metadata['databases'].items():
+            writer.write_database(database)
+            for schema, schema_info in db_info['schemas'].items():
+                writer.write_schema(database, schema)
+                for table, table_info in schema_info['tables'].items():
+                    writer.write_table(database, schema, table, table_info)
+    assert target.read_text(encoding='utf-8') == json.dumps(metadata, indent=2, ensure_ascii=False)
+
+
+def test_reader_seeks_single_tables(tmp_path):
+    target = tmp_path / 'snapshot.json'
+    target.write_text(json.dumps(sample_metadata(), indent=2, ensure_ascii=False), encoding='utf-8')
+    reader = SnapshotReader(str(target), chunk_size=64)
+    assert reader.load() == sample_metadata()
+    reader.build_index()
+    assert reader.get_table('shop', 'shop', 'orders') == \
+        sample_metadata()['databases']['shop']['schemas']['shop']['tables']['orders']
+    assert reader.get_table('shop', 'shop', 'missing') is None
+
+
+def test_convert_between_formats(tmp_path):
+    pytest.importorskip('msgpack')
+    binary = str(tmp_path / 'snapshot.msgpack')
+    converted = str(tmp_path / 'snapshot.json')
+    save_snapshot(sample_metadata(), binary, 'msgpack')
+    assert load_snapshot(binary) == sample_metadata()
+    convert_snapshot(binary, converted)
+    assert load_snapshot(converted) == sample_metadata()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQL cache: exact and normalized lookups, schema and model
+scoping, expiry, LRU eviction and persistence across instances.
+"""
+
+from sql_cache import SQLCache, normalize_question
+
+
+def test_normalize_question_keeps_literals_and_operators():
+    assert normalize_question("Please show me all users?") == 'show me all users'
+    assert normalize_question("Show me   all users") == 'show me all users'
+    assert normalize_question("Orders by 'Bob' where amount >= 1.5") == "orders by 'Bob' where amount >= 1.5"
+    assert normalize_question("users named 'Bob'") != normalize_question("users named 'bob'")
+
+
+def test_exact_then_normalized_hits():
+    cache = SQLCache()
+    cache.put("Show me all users?", 'v1', 'model', 'SELECT * FROM users')
+    assert cache.get("Show me all users?", 'v1', 'model') == 'SELECT * FROM users'
+    assert cache.get("please show me all  users", 'v1', 'model') == 'SELECT * FROM users'
+    assert cache.get("show me all orders", 'v1', 'model') is None
+    assert cache.stats() == {'exact_hits': 1, 'normalized_hits': 1, 'misses': 1, 'entries': 2}
+
+
+def test_entries_are_scoped_to_schema_and_model():
+    cache = SQLCache()
+    cache.put("count users", 'v1', 'model', 'SELECT count() FROM users')
+    assert cache.get("count users", 'v2', 'model') is None
+    assert cache.get("count users", 'v1', 'other-model') is None
+
+
+def test_expired_entries_are_not_served(monkeypatch):
+    cache = SQLCache(ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr('sql_cache.time.time', lambda: now[0])
+    cache.put("count users", 'v1', 'model', 'SELECT count() FROM users')
+    now[0] += 61
+    assert cache.get("count users", 'v1', 'model') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    # Every question takes an exact and a normalized entry
+    cache = SQLCache(max_entries=4)
+    cache.put("first", 'v1', 'model', 'SELECT 1')
+    cache.put("second", 'v1', 'model', 'SELECT 2')
+    cache.put("third", 'v1', 'model', 'SELECT 3')
+    assert cache.get("first", 'v1', 'model') is None
+    assert cache.get("second", 'v1', 'model') == 'SELECT 2'
+    # The hit made "second" more recent than "third"
+    cache.put("fourth", 'v1', 'model', 'SELECT 4')
+    assert cache.get("second", 'v1', 'model') == 'SELECT 2'
+    assert cache.get("fourth", 'v1', 'model') == 'SELECT 4'
+    assert cache.stats()['entries'] == 4
+
+
+def test_persisted_entries_survive_restarts(tmp_path):
+    path = str(tmp_path / 'sql_cache.sqlite')
+    cache = SQLCache(path=path)
+    cache.put("count users", 'v1', 'model', 'SELECT count() FROM users')
+    cache.put("count orders", 'v1', 'model', 'SELECT count() FROM orders')
+    cache.discard_sql('SELECT count() FROM orders')
+    cache.close()
+
+    reopened = SQLCache(path=path)
+    assert reopened.get("Count users?", 'v1', 'model') == 'SELECT count() FROM users'
+    assert reopened.get("count orders", 'v1', 'model') is None
+    reopened.clear()
+    reopened.close()
+    assert SQLCache(path=path).get("count users", 'v1', 'model') is None
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for table deduplication: members of a table group copy the
+representative's definitions without blocking a worker while it is analyzed.
+"""
+
+import threading
+
+import clickhouse_pool
+from clickhouse_metadata_extractor import ClickHouseMetadataExtractor, ExtractionCancelled, ExtractorConfig
+
+
+class FakeClient:
+    def ping(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def columns():
+    return [{'name': 'event_id', 'type': 'UInt64'}, {'name': 'kind', 'type': 'String'}]
+
+
+def extractor_with_slow_analysis(monkeypatch):
+    monkeypatch.setattr(clickhouse_pool.clickhouse_connect, 'get_client', lambda **params: FakeClient())
+    extractor = ClickHouseMetadataExtractor(ExtractorConfig.from_dict({'host': 'dedup-test', 'llmEnabled': False}))
+    extractor.llm_enabled, extractor.llm_analyzer = True, object()
+    started, release = threading.Event(), threading.Event()
+
+    def analyze(database, schema, table, table_columns):
+        started.set()
+        release.wait(5)
+        for column in table_columns:
+            column['ai_definition'] = f"Definition of {column['name']}."
+        return table_columns
+
+    monkeypatch.setattr(extractor, '_analyze_columns', analyze)
+    return extractor, started, release
+
+
+def test_members_do_not_wait_for_the_representative(monkeypatch):
+    extractor, started, release = extractor_with_slow_analysis(monkeypatch)
+    representative = threading.Thread(
+        target=extractor._annotate_columns, args=('db', 'db', 'events_01', columns()))
+    representative.start()
+    assert started.wait(5)
+
+    member = extractor._annotate_columns('db', 'db', 'events_02', columns())
+    assert not member.done()
+    release.set()
+    assert [column['ai_definition'] for column in member.result(5)] == \
+        ['Definition of event_id.', 'Definition of kind.']
+    representative.join(5)
+    assert extractor.table_groups.stats() == {'groups': 1, 'tables_copied': 1}
+    extractor.llm_analyzer = None
+    extractor.close()
+
+
+def test_members_are_cancelled_with_the_extraction(monkeypatch):
+    extractor, started, release = extractor_with_slow_analysis(monkeypatch)
+    representative = threading.Thread(
+        target=extractor._annotate_columns, args=('db', 'db', 'events_01', columns()))
+    representative.start()
+    assert started.wait(5)
+
+    member = extractor._annotate_columns('db', 'db', 'events_02', columns())
+    extractor.cancel_event.set()
+    release.set()
+    assert isinstance(member.exception(5), ExtractionCancelled)
+    representative.join(5)
+    extractor.llm_analyzer = None
+    extractor.close()